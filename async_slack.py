@@ -0,0 +1,183 @@
+import asyncio
+import time
+from ssl import SSLContext
+from typing import Dict, List, Optional
+
+from slack_sdk.errors import SlackApiError
+from slack_sdk.web.async_client import AsyncWebClient
+from slack_sdk.web.async_slack_response import AsyncSlackResponse
+
+from run_metrics import RunMetrics, current_metrics
+
+# Slack allows roughly one chat.postMessage per second per channel, with short bursts
+CHANNEL_POSTS_PER_SECOND: float = 1.0
+CHANNEL_BURST: int = 3
+MAX_RETRIES: int = 5
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, capacity: int) -> None:
+        self.rate: float = rate
+        self.capacity: int = capacity
+        self.tokens: float = capacity
+        self.updated: float = time.monotonic()
+        # A bucket outlives the event loop it was made in, eg. between a watcher's polls, so its lock is
+        # made for whichever loop is waiting on it
+        self.lock: Optional[asyncio.Lock] = None
+        self.lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    # Wait until a token is available, then take it
+    async def acquire(self) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        if self.lock_loop is not loop:
+            self.lock, self.lock_loop = asyncio.Lock(), loop
+
+        async with self.lock:
+            while True:
+                now: float = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    # Slack told us to back off, so drain the bucket so the next token only arrives once
+    # the Retry-After period has passed
+    def pause(self, seconds: float) -> None:
+        self.tokens = min(self.tokens, 1) - seconds * self.rate
+
+
+def retry_after_seconds(error: SlackApiError) -> Optional[float]:
+    if error.response is None or error.response.status_code != 429:
+        return None
+
+    headers: Dict = error.response.headers or {}
+    retry_after = headers.get("Retry-After", headers.get("retry-after", 1))
+    return float(retry_after)
+
+
+class AsyncSlackPoster:
+
+    def __init__(
+        self,
+        slack_token: str,
+        bot_name: str,
+        emoji: str,
+        rate: float = CHANNEL_POSTS_PER_SECOND,
+        burst: int = CHANNEL_BURST,
+        max_retries: int = MAX_RETRIES,
+        client: AsyncWebClient = None,
+        base_url: str = AsyncWebClient.BASE_URL
+    ) -> None:
+        self.bot_name: str = bot_name
+        self.emoji: str = emoji
+        self.rate: float = rate
+        self.burst: int = burst
+        self.max_retries: int = max_retries
+        self.client: AsyncWebClient = client or AsyncWebClient(
+            token=slack_token,
+            base_url=base_url,
+            ssl=SSLContext()
+        )
+        self.buckets: Dict[str, TokenBucket] = {}
+        # Channel name -> ID, for the calls that only take IDs. See find_channel_ids
+        self.channel_ids: Dict[str, str] = {}
+
+    def bucket_for(self, channel: str) -> TokenBucket:
+        if channel not in self.buckets:
+            self.buckets[channel] = TokenBucket(self.rate, self.burst)
+        return self.buckets[channel]
+
+    # Call a Slack API method for a channel, waiting on the channel's rate limit and retrying on 429s
+    async def call_for_channel(self, channel: str, api_method, **kwargs) -> AsyncSlackResponse:
+        bucket: TokenBucket = self.bucket_for(channel)
+        metrics: RunMetrics = current_metrics()
+
+        for attempt in range(self.max_retries + 1):
+            await bucket.acquire()
+            started: float = time.perf_counter()
+            try:
+                return await api_method(channel=channel, **kwargs)
+            except SlackApiError as e:
+                retry_after: Optional[float] = retry_after_seconds(e)
+                if retry_after is None or attempt == self.max_retries:
+                    raise
+
+                print(f"Rate limited posting to {channel}, retrying in {retry_after} seconds")
+                metrics.increment("slack_api_retries")
+                bucket.pause(retry_after)
+            finally:
+                metrics.observe("slack_api_call", time.perf_counter() - started)
+
+    async def post_message(self, channel: str, blocks: List[Dict], **kwargs) -> AsyncSlackResponse:
+        return await self.call_for_channel(
+            channel,
+            self.client.chat_postMessage,
+            text="COVID stats updated",
+            username=self.bot_name,
+            icon_emoji=self.emoji,
+            blocks=blocks,
+            **kwargs
+        )
+
+    async def update_message(self, channel: str, ts: str, blocks: List[Dict]) -> AsyncSlackResponse:
+        return await self.call_for_channel(
+            channel,
+            self.client.chat_update,
+            ts=ts,
+            text="COVID stats updated",
+            blocks=blocks
+        )
+
+    # Look up the IDs of any "#name" channels not already known, a page of conversations at a time.
+    # Channels that aren't found are left out, and used by name
+    async def find_channel_ids(self, channels: List[str]) -> None:
+        unknown: List[str] = [channel for channel in channels if channel.startswith("#") and channel not in self.channel_ids]
+        cursor: Optional[str] = None
+        while unknown:
+            response: AsyncSlackResponse = await self.client.conversations_list(
+                types="public_channel,private_channel",
+                exclude_archived=True,
+                limit=1000,
+                cursor=cursor
+            )
+            for conversation in response.get("channels") or []:
+                self.channel_ids["#" + conversation["name"]] = conversation["id"]
+            unknown = [channel for channel in unknown if channel not in self.channel_ids]
+            cursor = (response.get("response_metadata") or {}).get("next_cursor")
+            if not cursor:
+                break
+
+    # files_upload_v2 shares the file to a channel ID, so call find_channel_ids first for channels given by name
+    async def upload_file(self, channel: str, file: str, title: str) -> AsyncSlackResponse:
+        async def files_upload(channel: str, **kwargs) -> AsyncSlackResponse:
+            return await self.client.files_upload_v2(channel=self.channel_ids.get(channel, channel), **kwargs)
+
+        return await self.call_for_channel(channel, files_upload, file=file, title=title)
+
+    # Post the same blocks to every channel, with all channels in flight at once
+    async def post_to_channels(self, channels: List[str], blocks: List[Dict]) -> List[AsyncSlackResponse]:
+        return await asyncio.gather(*(self.post_message(channel, blocks) for channel in channels))
+
+    # Post a message split into several chunks, in order, returning the response for every chunk
+    async def post_chunks(self, channel: str, chunks: List[List[Dict]], thread: bool = False) -> List[AsyncSlackResponse]:
+        responses: List[AsyncSlackResponse] = [await self.post_message(channel, chunks[0])]
+        for chunk in chunks[1:]:
+            if thread:
+                responses.append(await self.post_message(channel, chunk, thread_ts=responses[0]["ts"]))
+            else:
+                responses.append(await self.post_message(channel, chunk))
+        return responses
+
+    # Chunks stay in order within a channel, while all channels are in flight at once
+    async def post_chunks_to_channels(
+        self,
+        channels: List[str],
+        chunks: List[List[Dict]],
+        thread: bool = False
+    ) -> List[List[AsyncSlackResponse]]:
+        return await asyncio.gather(*(self.post_chunks(channel, chunks, thread) for channel in channels))
@@ -0,0 +1,159 @@
+import argparse
+import contextlib
+import io
+import json
+import statistics
+import sys
+import time
+from typing import Callable, Dict, List
+
+from code_index import CodeIndex
+from local_servers import FeedServer
+from post_covid_stats import fetch_and_parse_data, get_most_recent_data_for_codes, get_vax_data_for_codes, load_state_data
+from slack_bot import CovidSlackBot
+from synthetic_feed import DEFAULT_CODES, generate_feed_json
+
+
+# Time a function over a number of repeats, with the bot's progress prints silenced
+def time_function(function: Callable, repeats: int) -> Dict[str, float]:
+    timings: List[float] = []
+    for _ in range(repeats):
+        with contextlib.redirect_stdout(io.StringIO()):
+            started: float = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - started)
+
+    return {
+        "repeats": repeats,
+        "min_s": min(timings),
+        "median_s": statistics.median(timings),
+        "mean_s": statistics.mean(timings),
+    }
+
+
+def run_benchmarks(
+    codes: List[str],
+    days: int,
+    null_density: float,
+    shuffle: bool,
+    selected_codes: List[str],
+    population_bracket: str,
+    repeats: int
+) -> Dict:
+    body: bytes = generate_feed_json(codes=codes, days=days, null_density=null_density, shuffle=shuffle)
+    state_data: Dict = load_state_data()
+    # Synthetic codes not in the state data borrow a real code's population
+    for code in codes:
+        state_data.setdefault(code, state_data["AUS"])
+
+    slack_bot: CovidSlackBot = CovidSlackBot("Fake Token Here", "Channel Name Here", "CovidLiveSummary", ":robot_face:")
+    results: Dict[str, Dict[str, float]] = {}
+
+    with FeedServer(body) as server:
+        results["fetch_and_parse_data"] = time_function(lambda: fetch_and_parse_data(server.url, selected_codes), repeats)
+        with contextlib.redirect_stdout(io.StringIO()):
+            rows, _ = fetch_and_parse_data(server.url, selected_codes)
+
+    results["build_code_index"] = time_function(lambda: CodeIndex(rows, selected_codes), repeats)
+    index: CodeIndex = CodeIndex(rows, selected_codes)
+    # A watcher's poll, updating its index with the next snapshot of the feed
+    results["update_code_index"] = time_function(lambda: index.update(rows), repeats)
+
+    results["get_most_recent_data_for_codes"] = time_function(
+        lambda: get_most_recent_data_for_codes(index, state_data, selected_codes, population_bracket),
+        repeats
+    )
+    results["get_vax_data_for_codes"] = time_function(
+        lambda: get_vax_data_for_codes(index, state_data, selected_codes, population_bracket),
+        repeats
+    )
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        code_data: Dict = get_most_recent_data_for_codes(index, state_data, selected_codes, population_bracket)
+        vax_data: Dict = get_vax_data_for_codes(index, state_data, selected_codes, population_bracket)
+
+    # Uncached renders, then through the render cache as repeated polls and channels would
+    results["render_message_for_code"] = time_function(
+        lambda: [slack_bot.render_message_for_code(code_data[code]) for code in code_data],
+        repeats
+    )
+    results["generate_message_for_code"] = time_function(
+        lambda: [slack_bot.generate_message_for_code(code_data[code]) for code in code_data],
+        repeats
+    )
+    results["generate_vax_stats_for_code"] = time_function(
+        lambda: [slack_bot.generate_vax_stats_for_code(vax_data[code]) for code in vax_data],
+        repeats
+    )
+
+    return {
+        "config": {
+            "codes": len(codes),
+            "days": days,
+            "null_density": null_density,
+            "shuffle": shuffle,
+            "selected_codes": selected_codes,
+            "population_bracket": population_bracket,
+            "feed_bytes": len(body),
+            "rows_kept": len(rows),
+        },
+        "results": results,
+    }
+
+
+# Benchmarks whose median got slower than the baseline by more than the tolerance
+def find_regressions(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions: List[str] = []
+    for name, result in report["results"].items():
+        if name not in baseline["results"]:
+            continue
+
+        baseline_median: float = baseline["results"][name]["median_s"]
+        if result["median_s"] > baseline_median * (1 + tolerance):
+            regressions.append(f"{name}: {baseline_median:.6f}s -> {result['median_s']:.6f}s")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark the bot against a synthetic covid-live.json feed")
+    parser.add_argument("--codes", type=int, default=len(DEFAULT_CODES), help="number of codes in the feed")
+    parser.add_argument("--days", type=int, default=365, help="days of history per code")
+    parser.add_argument("--null-density", type=float, default=0.05, help="chance of an optional count being null")
+    parser.add_argument("--shuffle", action="store_true", help="shuffle the feed's row order")
+    parser.add_argument("--selected-codes", default="AUS,VIC,NSW", help="codes the bot selects")
+    parser.add_argument("--population-bracket", default="16+")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="JSON report to compare against, exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown against the baseline")
+    args = parser.parse_args()
+
+    # Real codes first, then synthetic ones to reach the requested count
+    codes: List[str] = (DEFAULT_CODES + [f"X{i:03d}" for i in range(args.codes)])[:args.codes]
+    report: Dict = run_benchmarks(
+        codes,
+        args.days,
+        args.null_density,
+        args.shuffle,
+        args.selected_codes.split(","),
+        args.population_bracket,
+        args.repeats
+    )
+
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            json.dump(report, outputFile, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            regressions: List[str] = find_regressions(report, json.load(baselineFile), args.tolerance)
+        if regressions:
+            print("Regressions against baseline:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+from typing import Dict, List
+
+# Slack rejects messages with more than 50 blocks
+MAX_BLOCKS_PER_MESSAGE: int = 50
+
+
+# Pack groups of blocks into as few messages as possible, in order, without splitting a group
+# across messages. Filling each message greedily is optimal when the order has to be kept.
+# A single group larger than the limit can't be kept together, so it just fills messages block by block.
+def pack_block_groups(groups: List[List[Dict]], limit: int = MAX_BLOCKS_PER_MESSAGE) -> List[List[Dict]]:
+    messages: List[List[Dict]] = []
+    current: List[Dict] = []
+
+    for group in groups:
+        if len(group) > limit:
+            for block in group:
+                if len(current) == limit:
+                    messages.append(current)
+                    current = []
+                current.append(block)
+            continue
+
+        if len(current) + len(group) > limit:
+            messages.append(current)
+            current = []
+        current.extend(group)
+
+    if current:
+        messages.append(current)
+
+    return messages
+
+
+# Like pack_block_groups, but returns the positions of the groups in each message so callers
+# can tell which message each group ended up in. Every group has to fit in a message
+def pack_group_positions(groups: List[List[Dict]], limit: int = MAX_BLOCKS_PER_MESSAGE) -> List[List[int]]:
+    messages: List[List[int]] = []
+    current: List[int] = []
+    current_size: int = 0
+
+    for position, group in enumerate(groups):
+        if len(group) > limit:
+            raise ValueError(f"Group of {len(group)} blocks won't fit in a message of {limit}")
+
+        if current_size + len(group) > limit:
+            messages.append(current)
+            current = []
+            current_size = 0
+        current.append(position)
+        current_size += len(group)
+
+    if current:
+        messages.append(current)
+
+    return messages
@@ -0,0 +1,196 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+from code_index import CodeIndex
+from feed_cache import FeedCache
+from post_covid_stats import (
+    BOT_PROFILES_FILE,
+    FEED_ARCHIVE_DIR,
+    FEED_CACHE_DIR,
+    FEED_EXTRA_SOURCES,
+    FEED_MIRRORS,
+    FORCE_POST,
+    POPULATION_BRACKET,
+    SELECTED_CODES,
+    SLACK_BOT_DISPLAY,
+    SLACK_BOT_EMOJI,
+    SLACK_BOT_NAME,
+    SLACK_API_URL,
+    SLACK_BOT_TOKEN,
+    SLACK_CHANNEL_NAME,
+    SLACK_EDIT_IN_PLACE,
+    SLACK_THREAD_CHUNKS,
+    SOURCE_URL,
+    VAX_TREND_METHOD,
+    SharedSelections,
+    create_chart_renderer,
+    create_index,
+    fetch_and_parse_data,
+    load_last_posted,
+    load_state_data,
+    post_updates,
+    save_last_posted,
+)
+from posted_messages import PostedMessages
+from render_cache import RenderCache
+from run_metrics import RunMetrics, current_metrics
+from snapshot_archive import SnapshotArchive
+
+# Imported when needed, like post_covid_stats does
+if TYPE_CHECKING:
+    from slack_sdk.web import SlackResponse
+    from slack_bot import CovidSlackBot
+    from trend_charts import ChartRenderer
+
+# A comma separated string, as in the env vars, or a list
+def split_setting(value: Union[str, List[str]]) -> List[str]:
+    return value.split(",") if isinstance(value, str) else list(value)
+
+
+# A profiles file has a list of bots, each posting its own codes and bracket to its own channel:
+# {"PROFILES": [{"NAME": "vic-team", "SELECTED_CODES": "VIC", "SLACK_CHANNEL_NAME": "#vic", ...}]}
+# Profile settings are named after the env vars they replace, and default to them
+class BotProfile:
+
+    def __init__(self, config: Dict) -> None:
+        self.name: str = config["NAME"]
+        self.codes: List[str] = split_setting(config.get("SELECTED_CODES", SELECTED_CODES))
+        self.population_bracket: str = config.get("POPULATION_BRACKET", POPULATION_BRACKET)
+        self.display: List[str] = split_setting(config.get("SLACK_BOT_DISPLAY", SLACK_BOT_DISPLAY))
+        self.channel_name: str = config.get("SLACK_CHANNEL_NAME", SLACK_CHANNEL_NAME)
+        # Tokens can be read from a named env var, to keep them out of the profiles file
+        self.slack_token: str = (
+            os.environ.get(config["SLACK_BOT_TOKEN_ENV"], "") if "SLACK_BOT_TOKEN_ENV" in config
+            else config.get("SLACK_BOT_TOKEN", SLACK_BOT_TOKEN)
+        )
+        self.bot_name: str = config.get("SLACK_BOT_NAME", SLACK_BOT_NAME)
+        self.emoji: str = config.get("SLACK_BOT_EMOJI", SLACK_BOT_EMOJI)
+        self.thread_chunks: bool = config.get("SLACK_THREAD_CHUNKS", SLACK_THREAD_CHUNKS)
+        self.edit_in_place: bool = config.get("SLACK_EDIT_IN_PLACE", SLACK_EDIT_IN_PLACE)
+        self.trend_method: str = config.get("VAX_TREND_METHOD", VAX_TREND_METHOD)
+
+    # Bots share a render cache, so the same data is rendered once for every profile showing it
+    def create_slack_bot(self, render_cache: Optional[RenderCache] = None) -> CovidSlackBot:
+        from slack_bot import CovidSlackBot
+        posted_messages_file: str = os.path.join(FEED_CACHE_DIR or ".feed_cache", f"posted-messages-{self.name}.json")
+        slack_bot: CovidSlackBot = CovidSlackBot(
+            self.slack_token,
+            self.channel_name,
+            self.bot_name,
+            self.emoji,
+            self.thread_chunks,
+            self.trend_method,
+            PostedMessages(posted_messages_file) if self.edit_in_place else None,
+            base_url=SLACK_API_URL
+        )
+        if render_cache is not None:
+            slack_bot.render_cache = render_cache
+        return slack_bot
+
+
+def load_profiles(profiles_file: str = BOT_PROFILES_FILE) -> List[BotProfile]:
+    with open(profiles_file) as profilesFile:
+        profiles: List[BotProfile] = [BotProfile(config) for config in json.load(profilesFile)["PROFILES"]]
+
+    names: List[str] = [profile.name for profile in profiles]
+    if len(set(names)) != len(names):
+        raise ValueError(f"Profile names must be unique, got {names}")
+    return profiles
+
+
+# Every code any profile wants, in first seen order
+def profile_codes(profiles: List[BotProfile]) -> List[str]:
+    return list(dict.fromkeys(code for profile in profiles for code in profile.codes))
+
+
+# Post each profile's view of one shared index. last_posted, if given, is kept per profile name.
+# A profile that fails to post is reported and skipped so it can't hold up the others.
+# Returns each profile's response
+def post_profiles(
+    profiles: List[BotProfile],
+    slack_bots: Dict[str, CovidSlackBot],
+    index: CodeIndex,
+    state_data: Dict,
+    last_posted: Optional[Dict[str, Dict[str, Dict[str, Tuple[str, str]]]]] = None,
+    charts: Optional[ChartRenderer] = None
+) -> Dict[str, Optional[SlackResponse]]:
+    selections: SharedSelections = SharedSelections(index, state_data)
+    responses: Dict[str, Optional[SlackResponse]] = {}
+
+    for profile in profiles:
+        print(f"Posting profile {profile.name} to {profile.channel_name}")
+        try:
+            responses[profile.name] = post_updates(
+                slack_bots[profile.name],
+                index,
+                state_data,
+                profile.codes,
+                profile.display,
+                profile.population_bracket,
+                last_posted.setdefault(profile.name, {}) if last_posted is not None else None,
+                selections,
+                charts
+            )
+        except (Exception, SystemExit) as e:
+            print(f"Profile {profile.name} failed: {e}")
+            current_metrics().increment("profile_failures")
+            responses[profile.name] = None
+
+    return responses
+
+
+def create_slack_bots(profiles: List[BotProfile]) -> Dict[str, CovidSlackBot]:
+    render_cache: RenderCache = RenderCache()
+    return {profile.name: profile.create_slack_bot(render_cache) for profile in profiles}
+
+
+# One fetch and parse of the feed for every profile's codes, then each profile is posted from it
+def fetch_and_post_profiles(profiles: List[BotProfile]) -> Dict[str, Optional[SlackResponse]]:
+    codes: List[str] = profile_codes(profiles)
+    feed_cache: Optional[FeedCache] = FeedCache(FEED_CACHE_DIR) if FEED_CACHE_DIR else None
+    archive: Optional[SnapshotArchive] = SnapshotArchive(FEED_ARCHIVE_DIR) if FEED_ARCHIVE_DIR else None
+    covid_data, modified = fetch_and_parse_data(
+        SOURCE_URL,
+        codes,
+        feed_cache,
+        archive=archive,
+        mirrors=FEED_MIRRORS,
+        extra_sources=FEED_EXTRA_SOURCES
+    )
+
+    if not modified and not FORCE_POST:
+        print("Feed has not changed since the last run, nothing to post")
+        return {}
+
+    # What each profile has posted is kept with the cache, shared with the watcher's, so when a failed profile
+    # has the feed fetched and posted again next run the profiles that succeeded don't repost it.
+    # FORCE_POST posts everything again
+    last_posted_file: Optional[str] = os.path.join(FEED_CACHE_DIR, "last-posted-profiles.json") if feed_cache else None
+    last_posted: Optional[Dict] = None
+    if last_posted_file is not None:
+        last_posted = {} if FORCE_POST else load_last_posted(last_posted_file)
+
+    charts: Optional[ChartRenderer] = create_chart_renderer()
+    metrics: RunMetrics = current_metrics()
+    failures: int = metrics.counters.get("profile_failures", 0)
+    try:
+        responses: Dict[str, Optional[SlackResponse]] = post_profiles(
+            profiles,
+            create_slack_bots(profiles),
+            create_index(covid_data, codes, charts),
+            load_state_data(),
+            last_posted,
+            charts
+        )
+        if last_posted_file is not None:
+            save_last_posted(last_posted_file, last_posted)
+        # If any profile failed to post, the feed is fetched and posted again next run, see FeedCache.commit
+        if feed_cache is not None and metrics.counters.get("profile_failures", 0) == failures:
+            feed_cache.commit()
+        return responses
+    finally:
+        if charts is not None:
+            charts.shutdown()
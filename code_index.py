@@ -0,0 +1,215 @@
+import os
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from run_metrics import current_metrics
+
+VAX_TREND_WINDOW = int(os.environ.get("VAX_TREND_WINDOW", 7))  # days, eg. 7, 14 or 28
+
+
+# Sort key for a feed row, newest report first and within a report the most recently updated
+def row_recency(row: Dict) -> Tuple[str, str]:
+    return (row["REPORT_DATE"] or "", row["LAST_UPDATED_DATE"] or "")
+
+
+def has_vax_data(row: Dict) -> bool:
+    return row["LAST_UPDATED_DATE"] != None and row["VACC_DOSE_CNT"] != None
+
+
+class RecentRows:
+
+    # The `limit` most recent rows added (all of them if limit is None), one version of each report
+    # (the most recently updated, or the last added if they tie). Kept oldest first with their sort
+    # keys alongside for bisecting, and each report's kept key by REPORT_DATE
+    def __init__(self, limit: Optional[int]) -> None:
+        self.limit: Optional[int] = limit
+        self.keys: List[Tuple[str, str]] = []
+        self.rows: List[Dict] = []
+        self.versions: Dict[Optional[str], Tuple[str, str]] = {}
+
+    # Returns whether a new report, or a newer version of one, was kept. A version that's already
+    # kept is replaced by the one added, to pick up any corrections, but doesn't count as a change
+    def add(self, row: Dict, key: Tuple[str, str]) -> bool:
+        if len(self.rows) == self.limit and (self.limit == 0 or key < self.keys[0]):
+            return False
+
+        kept_key: Optional[Tuple[str, str]] = self.versions.get(row["REPORT_DATE"])
+        if kept_key is not None:
+            if key < kept_key:
+                return False
+            kept_position: int = bisect_left(self.keys, kept_key)
+            if key == kept_key:
+                self.rows[kept_position] = row
+                return False
+            del self.keys[kept_position], self.rows[kept_position]
+
+        position: int = bisect_left(self.keys, key)
+        self.keys.insert(position, key)
+        self.rows.insert(position, row)
+        self.versions[row["REPORT_DATE"]] = key
+        if self.limit is not None and len(self.rows) > self.limit:
+            del self.versions[self.rows[0]["REPORT_DATE"]], self.keys[0], self.rows[0]
+        return True
+
+    # Remove and return the rows newer than the key, oldest first
+    def pop_newer(self, key: Tuple[str, str]) -> List[Dict]:
+        position: int = bisect_left(self.keys, key)
+        newer: List[Dict] = self.rows[position:]
+        for row in newer:
+            del self.versions[row["REPORT_DATE"]]
+        del self.keys[position:], self.rows[position:]
+        return newer
+
+    # Newest first
+    def newest_first(self) -> List[Dict]:
+        return self.rows[::-1]
+
+
+class CodeRows:
+    __slots__ = ["latest", "latest_vax", "trailing", "pending", "history", "floor"]
+
+    # What selection needs of one code: the newest updated row, the newest row with vaccination data,
+    # the `window` rows before that one, and every row after it, as any of them may end up in the window
+    # of a newer vax row still to arrive. With history_days, the newest updated rows are kept too, eg. for charts
+    def __init__(self, window: int, history_days: int) -> None:
+        self.latest: Optional[Dict] = None
+        self.latest_vax: Optional[Dict] = None
+        self.trailing: RecentRows = RecentRows(window)
+        self.pending: RecentRows = RecentRows(None)
+        self.history: RecentRows = RecentRows(history_days)
+        # Rows older than this can't change anything, so they're skipped without a closer look
+        self.floor: Tuple[str, str] = ("", "")
+
+    def update_floor(self) -> None:
+        if self.latest_vax is None or len(self.trailing.rows) < self.trailing.limit:
+            self.floor = ("", "")
+        elif self.history.limit and len(self.history.rows) < self.history.limit:
+            self.floor = ("", "")
+        else:
+            floor: Tuple[str, str] = self.trailing.keys[0] if self.trailing.limit else row_recency(self.latest_vax)
+            self.floor = min(floor, self.history.keys[0]) if self.history.limit else floor
+
+    # Returns whether the row changed anything. Like RecentRows, a version already kept is replaced without counting
+    def add(self, row: Dict, key: Tuple[str, str]) -> bool:
+        changed: bool = self.add_row(row, key)
+        self.update_floor()
+        return changed
+
+    def add_row(self, row: Dict, key: Tuple[str, str]) -> bool:
+        changed: bool = False
+
+        if row["LAST_UPDATED_DATE"] != None:
+            latest_key: Optional[Tuple[str, str]] = row_recency(self.latest) if self.latest is not None else None
+            if latest_key is None or key >= latest_key:
+                changed = key != latest_key
+                self.latest = row
+            changed = self.history.add(row, key) or changed
+
+        if self.latest_vax is None:
+            if has_vax_data(row):
+                self.set_latest_vax(row, key)
+                return True
+            return self.pending.add(row, key) or changed
+
+        latest_vax_key: Tuple[str, str] = row_recency(self.latest_vax)
+        if key < latest_vax_key:
+            # An earlier version of the latest vax report isn't part of its trailing window
+            if row["REPORT_DATE"] == self.latest_vax["REPORT_DATE"]:
+                return changed
+            return self.trailing.add(row, key) or changed
+        if key == latest_vax_key:
+            if has_vax_data(row):
+                self.latest_vax = row
+            return changed
+        if has_vax_data(row):
+            self.set_latest_vax(row, key)
+            return True
+        return self.pending.add(row, key) or changed
+
+    # Rows between the old and new latest vax rows, and the old one, move into the trailing window
+    def set_latest_vax(self, row: Dict, key: Tuple[str, str]) -> None:
+        previous: Optional[Dict] = self.latest_vax
+        self.latest_vax = row
+        newer: List[Dict] = self.pending.pop_newer(key)
+        # Newest first, so once the window is full the older rows are turned away without being inserted
+        for pending in self.pending.rows[::-1] + ([previous] if previous is not None else []):
+            if pending["REPORT_DATE"] != row["REPORT_DATE"]:
+                self.trailing.add(pending, row_recency(pending))
+        self.pending = RecentRows(None)
+        for pending in newer:
+            if pending["REPORT_DATE"] != row["REPORT_DATE"]:
+                self.pending.add(pending, row_recency(pending))
+
+
+class CodeIndex:
+
+    # Per code selection state, built from rows in any order and updated in place as more arrive, selecting
+    # the same rows as sorting all of them would. Each code keeps just the rows selection could need (see
+    # CodeRows), so updating with new rows costs time in proportion to them, a whole snapshot's older rows
+    # are skipped with a comparison each, and the feed's history is never sorted or rescanned
+    def __init__(
+        self,
+        rows: Iterable[Dict] = (),
+        codes: Optional[Iterable[str]] = None,
+        window: int = VAX_TREND_WINDOW,
+        history_days: int = 0
+    ) -> None:
+        self.selected: Optional[Set[str]] = set(codes) if codes is not None else None
+        self.window: int = window
+        self.history_days: int = history_days
+        self.rows_by_code: Dict[str, CodeRows] = {}
+        self.update(rows)
+
+    # Add new rows, or a whole new snapshot: rows already seen don't change anything.
+    # Returns how many rows changed the selection
+    def update(self, rows: Iterable[Dict]) -> int:
+        seen: int = 0
+        changed: int = 0
+        for row in rows:
+            seen += 1
+            code: str = row["CODE"]
+            if self.selected is not None and code not in self.selected:
+                continue
+            code_rows: Optional[CodeRows] = self.rows_by_code.get(code)
+            if code_rows is None:
+                code_rows = self.rows_by_code[code] = CodeRows(self.window, self.history_days)
+
+            key: Tuple[str, str] = row_recency(row)
+            if key < code_rows.floor:
+                continue
+            if code_rows.add(row, key):
+                changed += 1
+
+        metrics = current_metrics()
+        metrics.increment("index_rows_seen", seen)
+        metrics.increment("index_rows_changed", changed)
+        return changed
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.rows_by_code
+
+    def codes(self) -> List[str]:
+        return list(self.rows_by_code)
+
+    # The codes that have never had an updated row
+    def missing(self, codes: Iterable[str]) -> List[str]:
+        return [code for code in codes if self.latest(code) is None]
+
+    # Most recently updated row for the code, or None if it has none
+    def latest(self, code: str) -> Optional[Dict]:
+        return self.rows_by_code[code].latest if code in self.rows_by_code else None
+
+    # Most recently updated row with vaccination data, or None
+    def latest_vax(self, code: str) -> Optional[Dict]:
+        return self.rows_by_code[code].latest_vax if code in self.rows_by_code else None
+
+    # Up to `window` rows published before the latest vax row, newest first
+    def trailing(self, code: str, window: Optional[int] = None) -> List[Dict]:
+        window = self.window if window is None else window
+        if window > self.window:
+            raise ValueError(f"The index only keeps {self.window} trailing rows, {window} were asked for")
+        return self.rows_by_code[code].trailing.newest_first()[:window] if code in self.rows_by_code else []
+
+    # Up to history_days of the code's most recently updated rows, newest first
+    def history(self, code: str) -> List[Dict]:
+        return self.rows_by_code[code].history.newest_first() if code in self.rows_by_code else []
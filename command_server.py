@@ -0,0 +1,228 @@
+import asyncio
+import hashlib
+import hmac
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import requests
+from aiohttp import web
+
+from code_index import CodeIndex
+from covid_row import CovidRow, parse_feed_rows
+from feed_cache import FeedCache
+from feed_fetcher import create_session
+from population_brackets import population_table
+from post_covid_stats import (
+    FEED_CACHE_DIR,
+    FEED_EXTRA_SOURCES,
+    FEED_MIRRORS,
+    POPULATION_BRACKET,
+    SELECTED_CODES,
+    SLACK_BOT_EMOJI,
+    SLACK_BOT_NAME,
+    SLACK_BOT_TOKEN,
+    SLACK_CHANNEL_NAME,
+    SOURCE_URL,
+    VAX_TREND_METHOD,
+    fetch_and_parse_data,
+    get_most_recent_data_for_codes,
+    get_vax_data_for_codes,
+    load_state_data,
+)
+from slack_bot import CovidSlackBot
+
+SLACK_SIGNING_SECRET = os.environ.get("SLACK_SIGNING_SECRET", "")
+COMMAND_SERVER_PORT = int(os.environ.get("COMMAND_SERVER_PORT", 3000))
+COMMAND_FEED_FILE = os.environ.get("COMMAND_FEED_FILE", "")  # serve a local feed file instead of covidlive
+COMMAND_REFRESH_SECONDS = int(os.environ.get("COMMAND_REFRESH_SECONDS", 300))
+# Slack signs requests with their timestamp, older ones are rejected as possible replays
+MAX_REQUEST_AGE_SECONDS = 5 * 60
+
+# Slash command -> what it displays
+COMMANDS: Dict[str, str] = {"/covid": "CODE_DATA", "/vax": "VAX_DATA"}
+
+
+# Check a request came from Slack, see https://api.slack.com/authentication/verifying-requests-from-slack
+def verify_slack_signature(
+    signing_secret: str,
+    timestamp: str,
+    body: bytes,
+    signature: str,
+    now: Optional[float] = None
+) -> bool:
+    if not signing_secret or not timestamp or not signature:
+        return False
+
+    try:
+        if abs((now if now is not None else time.time()) - int(timestamp)) > MAX_REQUEST_AGE_SECONDS:
+            return False
+    except ValueError:
+        return False
+
+    base: bytes = b"v0:" + timestamp.encode("utf-8") + b":" + body
+    expected: str = "v0=" + hmac.new(signing_secret.encode("utf-8"), base, hashlib.sha256).hexdigest()
+    return hmac.compare_digest(expected, signature)
+
+
+def ephemeral(text: str) -> Dict:
+    return {"response_type": "ephemeral", "text": text}
+
+
+class CommandServer:
+
+    # Answers slash commands from blocks rendered ahead of time for every code and bracket.
+    # Requests only ever look the answer up, the feed is fetched, parsed and rendered in the background
+    def __init__(
+        self,
+        signing_secret: str = SLACK_SIGNING_SECRET,
+        feed_file: str = COMMAND_FEED_FILE,
+        refresh_interval: int = COMMAND_REFRESH_SECONDS,
+        state_data: Optional[Dict] = None,
+        default_codes: Optional[List[str]] = None,
+        slack_bot: Optional[CovidSlackBot] = None
+    ) -> None:
+        self.signing_secret: str = signing_secret
+        self.feed_file: str = feed_file
+        self.refresh_interval: int = refresh_interval
+        self.state_data: Dict = state_data or load_state_data()
+        self.codes: List[str] = list(self.state_data)
+        # Only the brackets that are defined, see PopulationTable
+        self.brackets: List[str] = population_table(self.state_data).brackets
+        # Codes shown when a command doesn't name one
+        self.default_codes: List[str] = default_codes or SELECTED_CODES.split(",")
+        # Only used to render, nothing is posted through it
+        self.slack_bot: CovidSlackBot = slack_bot or CovidSlackBot(
+            SLACK_BOT_TOKEN,
+            SLACK_CHANNEL_NAME,
+            SLACK_BOT_NAME,
+            SLACK_BOT_EMOJI,
+            trend_method=VAX_TREND_METHOD
+        )
+        self.session: requests.Session = create_session()
+        # A cache of its own, so its pending downloads can't clash with a watcher's or one-shot run's
+        self.feed_cache: FeedCache = FeedCache(os.path.join(FEED_CACHE_DIR or ".feed_cache", "command-server"))
+        self.feed_file_version: Optional[Tuple[float, int]] = None
+
+        # (display, code, bracket) -> blocks, replaced as a whole on each refresh
+        self.rendered: Dict[Tuple[str, str, str], List[Dict]] = {}
+        self.refreshed_at: Optional[float] = None
+
+    # The feed's rows if it changed since it was last loaded, otherwise None
+    def load_rows(self) -> Optional[List[CovidRow]]:
+        if self.feed_file:
+            stat: os.stat_result = os.stat(self.feed_file)
+            version: Tuple[float, int] = (stat.st_mtime, stat.st_size)
+            if version == self.feed_file_version:
+                return None
+
+            self.feed_file_version = version
+            with open(self.feed_file, encoding="utf-8") as feedFile:
+                return list(parse_feed_rows(iter(lambda: feedFile.read(64 * 1024), ""), self.codes))
+
+        rows, modified = fetch_and_parse_data(
+            SOURCE_URL,
+            self.codes,
+            self.feed_cache,
+            self.session,
+            mirrors=FEED_MIRRORS,
+            extra_sources=FEED_EXTRA_SOURCES
+        )
+        return rows if modified or not self.rendered else None
+
+    # Returns whether anything changed
+    def refresh(self) -> bool:
+        rows: Optional[List[CovidRow]] = self.load_rows()
+        if rows is None:
+            return False
+
+        self.rendered = self.render_all(CodeIndex(rows, self.codes))
+        self.refreshed_at = time.time()
+        # Only once it's rendered is the feed cached as seen, so later refreshes are conditional on it
+        self.feed_cache.commit()
+        print(f"Rendered {len(self.rendered)} command responses")
+        return True
+
+    def render_all(self, index: CodeIndex) -> Dict[Tuple[str, str, str], List[Dict]]:
+        codes: List[str] = [code for code in self.codes if code in index]
+        rendered: Dict[Tuple[str, str, str], List[Dict]] = {}
+
+        for bracket in self.brackets:
+            bracket_codes: List[str] = [code for code in codes if bracket in self.state_data[code]["POPULATION"]]
+            code_data: Dict = get_most_recent_data_for_codes(index, self.state_data, bracket_codes, bracket)
+            vax_data: Dict = get_vax_data_for_codes(index, self.state_data, bracket_codes, bracket)
+
+            for display, data in [("CODE_DATA", code_data), ("VAX_DATA", vax_data)]:
+                for code, blocks in self.slack_bot.render_code_groups(display, data).items():
+                    rendered[(display, code, bracket)] = blocks
+
+        return rendered
+
+    # The response to a command, eg. "/vax" with text "NSW 12+"
+    def respond(self, command: str, text: str) -> Dict:
+        if command not in COMMANDS:
+            return ephemeral(f"Unknown command {command}, try /covid VIC or /vax NSW 12+")
+        if self.refreshed_at is None:
+            return ephemeral("Still loading the latest figures, try again in a moment")
+
+        codes: List[str] = []
+        bracket: str = POPULATION_BRACKET
+        for word in text.upper().split():
+            if word in self.brackets:
+                bracket = word
+            else:
+                codes.append(word)
+
+        blocks: List[Dict] = []
+        for code in codes or self.default_codes:
+            code_blocks: Optional[List[Dict]] = self.rendered.get((COMMANDS[command], code, bracket))
+            if code_blocks is None:
+                return ephemeral(f"No {bracket} figures for {code}, try one of {', '.join(self.codes)}")
+            blocks.extend(code_blocks)
+
+        return {"response_type": "in_channel", "blocks": blocks}
+
+    async def handle_command(self, request: web.Request) -> web.Response:
+        body: bytes = await request.read()
+        if not verify_slack_signature(
+            self.signing_secret,
+            request.headers.get("X-Slack-Request-Timestamp", ""),
+            body,
+            request.headers.get("X-Slack-Signature", "")
+        ):
+            return web.Response(status=401, text="Invalid signature")
+
+        form: Dict[str, List[str]] = parse_qs(body.decode("utf-8"))
+        command: str = form.get("command", [""])[0]
+        text: str = form.get("text", [""])[0]
+        return web.json_response(self.respond(command, text))
+
+    async def refresh_forever(self) -> None:
+        loop: asyncio.AbstractEventLoop = asyncio.get_running_loop()
+        while True:
+            try:
+                # Fetching, parsing and rendering run off the event loop so requests are never held up
+                await loop.run_in_executor(None, self.refresh)
+            except (Exception, SystemExit) as e:
+                # Keep serving the last rendered figures, the next refresh will retry
+                print(f"Refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def create_app(self) -> web.Application:
+        app: web.Application = web.Application()
+        app.router.add_post("/slack/commands", self.handle_command)
+
+        async def start_refreshing(app: web.Application) -> None:
+            app["refresher"] = asyncio.ensure_future(self.refresh_forever())
+
+        async def stop_refreshing(app: web.Application) -> None:
+            app["refresher"].cancel()
+
+        app.on_startup.append(start_refreshing)
+        app.on_cleanup.append(stop_refreshing)
+        return app
+
+
+if __name__ == "__main__":
+    web.run_app(CommandServer().create_app(), port=COMMAND_SERVER_PORT)
@@ -0,0 +1,137 @@
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from feed_parser import stream_rows_for_codes
+
+# Counts the bot reads from the feed, each with a PREV_ value from the previous report
+FEED_COUNT_FIELDS: List[str] = [
+    "CASE_CNT",
+    "TEST_CNT",
+    "DEATH_CNT",
+    "MED_ICU_CNT",
+    "MED_VENT_CNT",
+    "MED_HOSP_CNT",
+    "SRC_OVERSEAS_CNT",
+    "ACTIVE_CNT",
+    "VACC_DOSE_CNT",
+    "VACC_FIRST_DOSE_CNT",
+    "VACC_PEOPLE_CNT",
+    "VACC_FIRST_DOSE_CNT_12_15",
+    "VACC_PEOPLE_CNT_12_15",
+]
+# Vaccination counts broken down by population bracket
+BRACKET_VAX_FIELDS: List[str] = ["VACC_FIRST_DOSE_CNT", "VACC_PEOPLE_CNT"]
+# How each bracket's counts are made from the feed's all ages counts, as (sign, age group suffix) terms.
+# eg. 16+ is everyone less the 12-15s. A bracket needs an entry here and a population in state-data.json
+BRACKET_DEFINITIONS: Dict[str, List[Tuple[int, str]]] = {
+    "12+": [],
+    "16+": [(-1, "_12_15")],
+}
+# Field name of each vax field for each bracket, eg. ("VACC_PEOPLE_CNT", "16+") -> "VACC_PEOPLE_CNT_16+"
+BRACKET_FIELD_NAMES: Dict[Tuple[str, str], str] = {
+    (prefix + field, bracket): f"{prefix}{field}_{bracket}"
+    for field in BRACKET_VAX_FIELDS for bracket in BRACKET_DEFINITIONS for prefix in ["", "PREV_"]
+}
+# Counts derived per population bracket by population_brackets.derive_brackets
+BRACKET_COUNT_FIELDS: List[str] = [f"{field}_{bracket}" for bracket in BRACKET_DEFINITIONS for field in BRACKET_VAX_FIELDS]
+COUNT_FIELDS: List[str] = [
+    prefix + field for field in FEED_COUNT_FIELDS + BRACKET_COUNT_FIELDS for prefix in ["", "PREV_"]
+]
+COUNT_POSITIONS: Dict[str, int] = {field: position for position, field in enumerate(COUNT_FIELDS)}
+ATTRIBUTE_FIELDS: List[str] = [
+    "CODE",
+    "REPORT_DATE",
+    "LAST_UPDATED_DATE",
+    "POPULATION",
+    "POPULATION_BRACKET",
+    "CODE_EMOJI",
+    "RECORD_COUNT",
+]
+
+# Stored in the counts array for a count that is null (or absent) in the feed, read back as None
+MISSING: int = -(2 ** 63)
+
+
+class CovidRow:
+    # Only the fields the bot uses are kept, counts converted to ints once in a packed array.
+    # Anything else set on the row (eg. vax projections) goes in the rarely used extras dict
+    __slots__ = ["counts", "extras"] + ATTRIBUTE_FIELDS
+
+    def __init__(self) -> None:
+        self.counts: array = array("q", [MISSING]) * len(COUNT_FIELDS)
+        self.extras: Optional[Dict] = None
+        for field in ATTRIBUTE_FIELDS:
+            setattr(self, field, None)
+
+    @classmethod
+    def from_feed(cls, feed_row: Dict) -> "CovidRow":
+        row: CovidRow = cls()
+        for field in ATTRIBUTE_FIELDS:
+            setattr(row, field, feed_row.get(field))
+
+        counts: array = row.counts
+        for position, field in enumerate(COUNT_FIELDS):
+            value = feed_row.get(field)
+            if value is not None:
+                counts[position] = int(value)
+
+        return row
+
+    # Dict style access, so code reading fields works on rows and on plain feed dicts (eg. test fixtures).
+    # Unlike a dict, a count field the feed left out reads as None rather than raising KeyError, see __contains__
+    def __getitem__(self, field: str):
+        position: Optional[int] = COUNT_POSITIONS.get(field)
+        if position is not None:
+            value: int = self.counts[position]
+            return None if value == MISSING else value
+
+        if field in ATTRIBUTE_FIELDS:
+            return getattr(self, field)
+
+        if self.extras is None or field not in self.extras:
+            raise KeyError(field)
+        return self.extras[field]
+
+    def __setitem__(self, field: str, value) -> None:
+        position: Optional[int] = COUNT_POSITIONS.get(field)
+        if position is not None:
+            self.counts[position] = MISSING if value is None else value
+        elif field in ATTRIBUTE_FIELDS:
+            setattr(self, field, value)
+        else:
+            if self.extras is None:
+                self.extras = {}
+            self.extras[field] = value
+
+    # `field in row` is whether the field has a value, so it's False for a field the feed left null
+    # where `field in feed_dict` would be True. get() relies on this to fall back to its default
+    def __contains__(self, field: str) -> bool:
+        try:
+            return self[field] is not None
+        except KeyError:
+            return False
+
+    def get(self, field: str, default=None):
+        value = self[field] if field in self else None
+        return default if value is None else value
+
+    def copy(self) -> "CovidRow":
+        row: CovidRow = CovidRow()
+        row.counts = array("q", self.counts)
+        row.extras = dict(self.extras) if self.extras is not None else None
+        for field in ATTRIBUTE_FIELDS:
+            setattr(row, field, getattr(self, field))
+        return row
+
+    def to_dict(self) -> Dict:
+        data: Dict = {field: getattr(self, field) for field in ATTRIBUTE_FIELDS}
+        data.update({field: self[field] for field in COUNT_FIELDS})
+        if self.extras is not None:
+            data.update(self.extras)
+        return data
+
+
+# Parse the feed straight into rows for the selected codes
+def parse_feed_rows(chunks: Iterable[str], codes: Optional[Iterable[str]] = None) -> Iterator[CovidRow]:
+    for feed_row in stream_rows_for_codes(chunks, codes):
+        yield CovidRow.from_feed(feed_row)
@@ -0,0 +1,146 @@
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from bot_profiles import BotProfile, create_slack_bots, post_profiles, profile_codes
+from code_index import CodeIndex
+from feed_cache import FeedCache
+from feed_fetcher import create_session
+from snapshot_archive import SnapshotArchive
+from trend_charts import ChartRenderer
+from post_covid_stats import (
+    FEED_ARCHIVE_DIR,
+    FEED_CACHE_DIR,
+    FEED_EXTRA_SOURCES,
+    FEED_MIRRORS,
+    METRICS_TEXTFILE,
+    POPULATION_BRACKET,
+    SELECTED_CODES,
+    SLACK_BOT_DISPLAY,
+    SOURCE_URL,
+    create_chart_renderer,
+    create_index,
+    create_slack_bot,
+    fetch_and_parse_data,
+    load_last_posted,
+    load_state_data,
+    post_updates,
+    save_last_posted,
+)
+from run_metrics import RunMetrics, start_run
+from slack_bot import CovidSlackBot
+
+POLL_INTERVAL_SECONDS = int(os.environ.get("POLL_INTERVAL_SECONDS", 300))
+# Optional local hours to poll in, eg. "8-20". Outside of them the watcher sleeps until the window opens
+POLL_ACTIVE_HOURS = os.environ.get("POLL_ACTIVE_HOURS", "")
+
+
+def parse_active_hours(active_hours: str) -> Optional[Tuple[int, int]]:
+    if not active_hours:
+        return None
+
+    start, end = active_hours.split("-")
+    return int(start), int(end)
+
+
+# Seconds to wait before the next poll, respecting the active hours window if there is one
+def seconds_until_next_poll(now: datetime, interval: int, active_hours: Optional[Tuple[int, int]]) -> int:
+    if active_hours is None:
+        return interval
+
+    start, end = active_hours
+    if start <= now.hour < end:
+        return interval
+
+    seconds_into_day: int = now.hour * 3600 + now.minute * 60 + now.second
+    seconds_to_start: int = (start * 3600 - seconds_into_day) % (24 * 3600)
+    return max(interval, seconds_to_start)
+
+
+class CovidWatcher:
+
+    def __init__(
+        self,
+        codes: List[str] = None,
+        display: List[str] = None,
+        population_bracket: str = POPULATION_BRACKET,
+        interval: int = POLL_INTERVAL_SECONDS,
+        active_hours: str = POLL_ACTIVE_HOURS,
+        slack_bot: CovidSlackBot = None,
+        profiles: Optional[List[BotProfile]] = None
+    ) -> None:
+        # With profiles, each profile's codes, bracket, display and bot are used instead
+        self.profiles: Optional[List[BotProfile]] = profiles
+        self.codes: List[str] = profile_codes(profiles) if profiles else codes or SELECTED_CODES.split(",")
+        self.display: List[str] = display or SLACK_BOT_DISPLAY.split(",")
+        self.population_bracket: str = population_bracket
+        self.interval: int = interval
+        self.active_hours: Optional[Tuple[int, int]] = parse_active_hours(active_hours)
+
+        # Everything below is set up once and reused by every poll
+        self.session: requests.Session = create_session()
+        self.slack_bot: Optional[CovidSlackBot] = None if profiles else slack_bot or create_slack_bot()
+        self.slack_bots: Dict[str, CovidSlackBot] = create_slack_bots(profiles) if profiles else {}
+        self.feed_cache: FeedCache = FeedCache(FEED_CACHE_DIR or ".feed_cache")
+        self.archive: Optional[SnapshotArchive] = SnapshotArchive(FEED_ARCHIVE_DIR) if FEED_ARCHIVE_DIR else None
+        self.state_data: Dict = load_state_data()
+        # The chart worker processes are kept between polls
+        self.charts: Optional[ChartRenderer] = create_chart_renderer()
+        # Updated with each changed snapshot rather than rebuilt, so a poll doesn't rescan the feed's history
+        self.index: CodeIndex = create_index([], self.codes, self.charts)
+        # display -> code -> (REPORT_DATE, LAST_UPDATED_DATE) of what was last posted (under each profile's
+        # name with profiles), persisted so a restarted watcher doesn't repost data the channel has already seen
+        last_posted_name: str = "last-posted-profiles.json" if profiles else "last-posted.json"
+        self.last_posted_file: str = os.path.join(self.feed_cache.cache_dir, last_posted_name)
+        self.last_posted: Dict = load_last_posted(self.last_posted_file)
+
+    def poll(self) -> None:
+        covid_data, modified = fetch_and_parse_data(
+            SOURCE_URL,
+            self.codes,
+            self.feed_cache,
+            self.session,
+            self.archive,
+            FEED_MIRRORS,
+            FEED_EXTRA_SOURCES
+        )
+        # An unchanged feed can still have codes to post, eg. if posting them failed last time, and checking the
+        # cached rows against last_posted is cheap: a snapshot the index has already seen changes nothing in it
+        if not modified:
+            print("Feed has not changed since the last poll, posting anything that hasn't been posted yet")
+
+        self.index.update(covid_data)
+        if self.profiles:
+            post_profiles(self.profiles, self.slack_bots, self.index, self.state_data, self.last_posted, self.charts)
+        else:
+            post_updates(
+                self.slack_bot,
+                self.index,
+                self.state_data,
+                self.codes,
+                self.display,
+                self.population_bracket,
+                self.last_posted,
+                charts=self.charts
+            )
+        save_last_posted(self.last_posted_file, self.last_posted)
+        self.feed_cache.commit()
+
+    def run_forever(self) -> None:
+        print(f"Watching {SOURCE_URL} for updates to {','.join(self.codes)}")
+        while True:
+            metrics: RunMetrics = start_run()
+            try:
+                self.poll()
+            except (Exception, SystemExit) as e:
+                # Keep the daemon alive through transient failures, the next poll will retry
+                print(f"Poll failed: {e}")
+                metrics.increment("poll_failures")
+            metrics.export(METRICS_TEXTFILE)
+
+            delay: int = seconds_until_next_poll(datetime.now(), self.interval, self.active_hours)
+            print(f"Next poll in {delay} seconds")
+            time.sleep(delay)
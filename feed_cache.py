@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from covid_row import CovidRow, parse_feed_rows
+
+
+class FeedCache:
+
+    def __init__(self, cache_dir: str) -> None:
+        self.cache_dir: str = cache_dir
+        self.body_file: str = os.path.join(cache_dir, "covid-live.json")
+        self.meta_file: str = os.path.join(cache_dir, "covid-live.meta.json")
+        # A downloaded body and its validators wait here until what was parsed from it has been posted, see commit
+        self.pending_body_file: str = self.body_file + ".pending"
+        self.pending_meta: Optional[Dict] = None
+        # The caches made for other sources, committed along with this one
+        self.sources: Dict[str, FeedCache] = {}
+        # Parsed rows from the last fetch in this process, keyed by the selected codes
+        self.parsed: Optional[Tuple[Optional[Tuple[str, ...]], List[CovidRow]]] = None
+
+    # A cache of its own for another source, kept in a subdirectory of this one
+    def for_source(self, url: str) -> "FeedCache":
+        if url not in self.sources:
+            self.sources[url] = FeedCache(os.path.join(self.cache_dir, "sources", hashlib.sha1(url.encode("utf-8")).hexdigest()[:16]))
+        return self.sources[url]
+
+    def load_meta(self) -> Dict:
+        if not os.path.exists(self.meta_file) or not os.path.exists(self.body_file):
+            return {}
+
+        with open(self.meta_file) as metaFile:
+            return json.load(metaFile)
+
+    # Validators from the last successful response, used to make the next request conditional
+    def conditional_headers(self, url: str) -> Dict[str, str]:
+        meta: Dict = self.load_meta()
+        if meta.get("URL") != url:
+            return {}
+
+        headers: Dict[str, str] = {}
+        if meta.get("ETAG"):
+            headers["If-None-Match"] = meta["ETAG"]
+        if meta.get("LAST_MODIFIED"):
+            headers["If-Modified-Since"] = meta["LAST_MODIFIED"]
+        return headers
+
+    # Write the body to disk as it streams through. Once the whole body has been received it's
+    # kept as pending, the cached copy (and its validators) are only replaced by commit
+    def store(self, url: str, headers: Dict[str, str], chunks: Iterator[str]) -> Iterator[str]:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        partial_file: str = self.body_file + ".partial"
+
+        with open(partial_file, "w", encoding="utf-8") as bodyFile:
+            for chunk in chunks:
+                bodyFile.write(chunk)
+                yield chunk
+
+        os.replace(partial_file, self.pending_body_file)
+        self.pending_meta = {
+            "URL": url,
+            "ETAG": headers.get("ETag"),
+            "LAST_MODIFIED": headers.get("Last-Modified"),
+        }
+
+    # Make the pending body the cached copy, so the next request is conditional on it. Called once it's
+    # been posted: if posting fails the validators stay as they were, so the next run fetches and posts it again
+    def commit(self) -> None:
+        for source in self.sources.values():
+            source.commit()
+        if self.pending_meta is None:
+            return
+
+        partial_file: str = self.meta_file + ".partial"
+        with open(partial_file, "w") as metaFile:
+            json.dump(self.pending_meta, metaFile)
+        os.replace(self.pending_body_file, self.body_file)
+        os.replace(partial_file, self.meta_file)
+        self.pending_meta = None
+
+    def read_chunks(self, chunk_size: int = 64 * 1024) -> Iterator[str]:
+        with open(self.body_file, encoding="utf-8") as bodyFile:
+            while True:
+                chunk: str = bodyFile.read(chunk_size)
+                if not chunk:
+                    return
+                yield chunk
+
+    def remember_rows(self, codes: Optional[List[str]], rows: List[CovidRow]) -> None:
+        self.parsed = (tuple(codes) if codes is not None else None, rows)
+
+    # Reuse the rows parsed earlier in this process if possible, otherwise re-parse the cached body
+    def cached_rows(self, codes: Optional[List[str]]) -> List[CovidRow]:
+        key = tuple(codes) if codes is not None else None
+        if self.parsed is not None and self.parsed[0] == key:
+            return self.parsed[1]
+
+        rows: List[CovidRow] = list(parse_feed_rows(self.read_chunks(), codes))
+        self.remember_rows(codes, rows)
+        return rows
@@ -0,0 +1,90 @@
+import os
+import random
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from covid_row import CovidRow
+from run_metrics import current_metrics
+
+FEED_CONNECT_TIMEOUT = float(os.environ.get("FEED_CONNECT_TIMEOUT", 10))  # seconds
+FEED_READ_TIMEOUT = float(os.environ.get("FEED_READ_TIMEOUT", 60))  # seconds between bytes, not for the whole body
+FEED_RETRIES = int(os.environ.get("FEED_RETRIES", 4))
+FEED_BACKOFF_SECONDS = float(os.environ.get("FEED_BACKOFF_SECONDS", 1))
+FEED_MAX_BACKOFF_SECONDS = 30.0
+# Responses worth retrying, anything else is a real answer from the server
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class FeedFetchError(Exception):
+    pass
+
+
+# A session whose pool keeps a connection open to each source between fetches
+def create_session(pool_size: int = 8) -> requests.Session:
+    session: requests.Session = requests.Session()
+    adapter: HTTPAdapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+SHARED_SESSION: Optional[requests.Session] = None
+
+
+# Reused by every fetch that isn't given its own session
+def shared_session() -> requests.Session:
+    global SHARED_SESSION
+    if SHARED_SESSION is None:
+        SHARED_SESSION = create_session()
+    return SHARED_SESSION
+
+
+# Exponential backoff with full jitter, so retrying clients don't all come back at once
+def backoff_seconds(attempt: int, base: float = FEED_BACKOFF_SECONDS, cap: float = FEED_MAX_BACKOFF_SECONDS) -> float:
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+# GET with a timeout, retrying connection failures, timeouts and 429/5xx responses.
+# Returns a 200 or 304 response, anything else raises FeedFetchError
+def get_with_retries(
+    session: requests.Session,
+    url: str,
+    headers: Dict[str, str],
+    retries: int = FEED_RETRIES,
+    timeout: Tuple[float, float] = (FEED_CONNECT_TIMEOUT, FEED_READ_TIMEOUT)
+) -> requests.Response:
+    for attempt in range(retries + 1):
+        try:
+            response = session.get(url, headers=headers, stream=True, timeout=timeout)
+        except (requests.ConnectionError, requests.Timeout) as e:
+            failure: str = str(e)
+        else:
+            if response.status_code in (200, 304):
+                return response
+            if response.status_code not in RETRY_STATUS_CODES:
+                raise FeedFetchError(f"Unable to fetch {url}: {response.status_code} {response.text[:200]}")
+            failure = f"{response.status_code}"
+            response.close()
+
+        if attempt == retries:
+            raise FeedFetchError(f"Unable to fetch {url} after {retries + 1} attempts: {failure}")
+
+        delay: float = backoff_seconds(attempt)
+        print(f"Fetching {url} failed ({failure}), retrying in {delay:.1f} seconds")
+        current_metrics().increment("feed_fetch_retries")
+        time.sleep(delay)
+
+
+# Combine rows from several sources into one stream. Where sources overlap on a code's report,
+# the most recently updated version wins, with ties going to the earlier source
+def merge_rows(source_rows: Iterable[List[CovidRow]]) -> List[CovidRow]:
+    merged: Dict[Tuple[str, str], CovidRow] = {}
+    for rows in source_rows:
+        for row in rows:
+            key: Tuple[str, str] = (row["CODE"], row["REPORT_DATE"])
+            if key not in merged or (row["LAST_UPDATED_DATE"] or "") > (merged[key]["LAST_UPDATED_DATE"] or ""):
+                merged[key] = row
+    return list(merged.values())
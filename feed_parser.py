@@ -0,0 +1,89 @@
+import codecs
+import json
+from typing import Dict, Iterable, Iterator, Optional, Set
+
+from run_metrics import current_metrics
+
+JSON_DECODER: json.JSONDecoder = json.JSONDecoder()
+WHITESPACE: str = " \t\n\r"
+
+
+# Incrementally decode a top level JSON array from an iterable of text chunks, yielding one
+# element at a time so the full document never has to be held in memory at once
+def iter_json_array(chunks: Iterable[str]) -> Iterator:
+    buffer: str = ""
+    position: int = 0
+    started: bool = False
+    chunk_iter: Iterator[str] = iter(chunks)
+    exhausted: bool = False
+
+    while True:
+        # Skip whitespace, the opening bracket and element separators
+        while position < len(buffer) and (buffer[position] in WHITESPACE or buffer[position] == ","):
+            position += 1
+
+        if position < len(buffer) and not started:
+            if buffer[position] != "[":
+                raise ValueError("Expected feed to be a JSON array")
+            started = True
+            position += 1
+            continue
+
+        if position < len(buffer) and buffer[position] == "]":
+            # Drain any trailing chunks so wrapping generators (eg. the feed cache) run to completion
+            for _ in chunk_iter:
+                pass
+            return
+
+        if position < len(buffer):
+            try:
+                element, end = JSON_DECODER.raw_decode(buffer, position)
+                position = end
+                yield element
+                continue
+            except json.JSONDecodeError:
+                # The element is split across chunks, fall through and read more
+                if exhausted:
+                    raise
+
+        if exhausted:
+            raise ValueError("Feed ended before the JSON array was closed")
+
+        # Drop everything already consumed before appending the next chunk
+        buffer = buffer[position:]
+        position = 0
+        try:
+            buffer += next(chunk_iter)
+        except StopIteration:
+            exhausted = True
+
+
+# Decode a stream of bytes chunks (eg. from requests' iter_content) into text chunks
+def decode_chunks(byte_chunks: Iterable[bytes], encoding: str = "utf-8") -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    for byte_chunk in byte_chunks:
+        text: str = decoder.decode(byte_chunk)
+        if text:
+            yield text
+
+    tail: str = decoder.decode(b"", final=True)
+    if tail:
+        yield tail
+
+
+# Stream rows from the feed, keeping only those for the selected codes
+# If no codes are given every row is returned
+def stream_rows_for_codes(chunks: Iterable[str], codes: Optional[Iterable[str]] = None) -> Iterator[Dict]:
+    selected: Optional[Set[str]] = set(codes) if codes is not None else None
+    scanned: int = 0
+    kept: int = 0
+
+    try:
+        for row in iter_json_array(chunks):
+            scanned += 1
+            if selected is None or row.get("CODE") in selected:
+                kept += 1
+                yield row
+    finally:
+        current_metrics().increment("feed_rows_scanned", scanned)
+        current_metrics().increment("feed_rows_kept", kept)
@@ -0,0 +1,128 @@
+import argparse
+import contextlib
+import io
+import json
+import sys
+import time
+from typing import Dict, List, Optional
+
+from code_index import CodeIndex
+from feed_fetcher import create_session
+from local_servers import FakeSlackServer, FeedServer, archived_feed_json
+from post_covid_stats import fetch_and_parse_data, load_state_data, post_updates
+from run_metrics import RunMetrics, start_run
+from slack_bot import CovidSlackBot
+from snapshot_archive import SnapshotArchive
+from synthetic_feed import DEFAULT_CODES, generate_feed_json
+
+
+# One full run, from fetching the feed to posting every display to every channel, against a local
+# feed and a local fake Slack. Returns the run's metrics and what the fake Slack was sent
+def run_load_test(
+    codes: List[str],
+    days: int,
+    channels: int,
+    display: List[str],
+    population_bracket: str,
+    latency: float = 0,
+    channel_rate: Optional[float] = None,
+    failures: Optional[List[int]] = None,
+    archive_dir: Optional[str] = None,
+    as_of: Optional[float] = None
+) -> Dict:
+    if archive_dir:
+        body: bytes = archived_feed_json(SnapshotArchive(archive_dir), codes, as_of)
+    else:
+        body = generate_feed_json(codes=codes, days=days)
+    state_data: Dict = load_state_data()
+    # Synthetic codes not in the state data borrow a real code's population
+    for code in codes:
+        state_data.setdefault(code, state_data["AUS"])
+
+    metrics: RunMetrics = start_run()
+    error: Optional[str] = None
+    with FeedServer(body) as feed_server, FakeSlackServer(latency, channel_rate) as slack_server:
+        slack_server.fail_next(*(failures or []))
+        slack_bot: CovidSlackBot = CovidSlackBot(
+            "load-test-token",
+            ",".join(f"#load-test-{channel}" for channel in range(channels)),
+            "CovidLiveSummary",
+            ":robot_face:",
+            base_url=slack_server.url
+        )
+
+        started: float = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            try:
+                rows, _ = fetch_and_parse_data(feed_server.url, codes, session=create_session())
+                post_updates(slack_bot, CodeIndex(rows, codes), state_data, codes, display, population_bracket)
+            except (Exception, SystemExit) as e:
+                error = f"{type(e).__name__}: {e}"
+        elapsed: float = time.perf_counter() - started
+
+        slack_calls: Dict[str, Dict[str, int]] = slack_server.summary()
+        messages: int = len(slack_server.accepted("chat.postMessage"))
+
+    return {
+        "config": {
+            "codes": len(codes),
+            "days": days,
+            "channels": channels,
+            "display": display,
+            "population_bracket": population_bracket,
+            "latency_s": latency,
+            "channel_rate": channel_rate,
+            "failures": failures or [],
+            "feed_bytes": len(body),
+        },
+        "elapsed_s": elapsed,
+        "error": error,
+        "messages_posted": messages,
+        "slack_calls": slack_calls,
+        "metrics": metrics.to_dict(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Load test a full run against a local feed and a fake Slack")
+    parser.add_argument("--codes", type=int, default=len(DEFAULT_CODES), help="number of codes to post")
+    parser.add_argument("--days", type=int, default=365, help="days of history per code")
+    parser.add_argument("--channels", type=int, default=5, help="channels to post to")
+    parser.add_argument("--display", default="CODE_DATA,VAX_DATA")
+    parser.add_argument("--population-bracket", default="16+")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds the fake Slack takes to answer each call")
+    parser.add_argument("--channel-rate", type=float, help="calls a second the fake Slack allows per channel before a 429")
+    parser.add_argument("--fail", default="", help="statuses to answer the first Slack calls with, eg. 429,503")
+    parser.add_argument("--archive-dir", help="serve this snapshot archive instead of a generated feed")
+    parser.add_argument("--as-of", type=float, help="unix time to replay the archive as of")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    args = parser.parse_args()
+
+    # Real codes first, then synthetic ones to reach the requested count
+    codes: List[str] = (DEFAULT_CODES + [f"X{i:03d}" for i in range(args.codes)])[:args.codes]
+    report: Dict = run_load_test(
+        codes,
+        args.days,
+        args.channels,
+        args.display.split(","),
+        args.population_bracket,
+        args.latency,
+        args.channel_rate,
+        [int(status) for status in args.fail.split(",") if status],
+        args.archive_dir,
+        args.as_of
+    )
+
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            json.dump(report, outputFile, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if report["error"]:
+        exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+from covid_row import FEED_COUNT_FIELDS, CovidRow
+from snapshot_archive import SnapshotArchive
+
+# Local stand-ins for covidlive and the Slack Web API, so whole runs can be tested and load tested without a network.
+# Point SOURCE_URL at a FeedServer's url and SLACK_API_URL at a FakeSlackServer's url
+
+
+# A row as covidlive publishes it, with just the fields the bot reads
+def feed_row(row: CovidRow) -> Dict:
+    data: Dict = {"CODE": row["CODE"], "REPORT_DATE": row["REPORT_DATE"], "LAST_UPDATED_DATE": row["LAST_UPDATED_DATE"]}
+    for field in FEED_COUNT_FIELDS:
+        for prefix in ["", "PREV_"]:
+            data[prefix + field] = row[prefix + field]
+    return data
+
+
+# A feed body replaying the archive as it was known at `as_of` (or now)
+def archived_feed_json(archive: SnapshotArchive, codes: Optional[List[str]] = None, as_of: Optional[float] = None) -> bytes:
+    return json.dumps([feed_row(row) for row in archive.latest_rows(codes, as_of)]).encode("utf-8")
+
+
+class FeedServer:
+
+    # Serves body on every GET from a local port, with an ETag so unchanged feeds get a 304.
+    # latency delays each response, and statuses queued with fail_next are returned first.
+    # set_body swaps in a new snapshot, eg. to replay the feed updating between polls
+    def __init__(self, body: bytes = b"[]", latency: float = 0) -> None:
+        self.latency: float = latency
+        self.failures: List[int] = []
+        self.requests: int = 0
+        # The status each request was answered with, in order
+        self.statuses: List[int] = []
+        self.lock: threading.Lock = threading.Lock()
+        self.set_body(body)
+        server: FeedServer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                time.sleep(server.latency)
+                with server.lock:
+                    server.requests += 1
+                    status: int = server.failures.pop(0) if server.failures else 200
+                    body, etag = server.body, server.etag
+
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    status, body = 304, b""
+                elif status != 200:
+                    body = b""
+                with server.lock:
+                    server.statuses.append(status)
+
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        self.server: ThreadingHTTPServer = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url: str = f"http://127.0.0.1:{self.server.server_address[1]}/covid-live.json"
+        self.thread: threading.Thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def set_body(self, body: bytes) -> None:
+        with self.lock:
+            self.body: bytes = body
+            self.etag: str = '"' + hashlib.sha1(body).hexdigest() + '"'
+
+    def fail_next(self, *statuses: int) -> None:
+        with self.lock:
+            self.failures.extend(statuses)
+
+    def __enter__(self) -> "FeedServer":
+        self.thread.start()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class FakeSlackServer:
+
+    # A local Slack Web API answering chat.postMessage, chat.update, conversations.list and the calls
+    # files_upload_v2 makes, recording every call. It has no channel IDs, so channels are known by name.
+    # latency delays each response, and statuses queued with fail_next (eg. 429, 503) are returned first.
+    # With channel_rate set, each channel is rate limited like Slack does, bursts of channel_burst then
+    # channel_rate calls a second, anything over gets a 429 with a Retry-After
+    def __init__(
+        self,
+        latency: float = 0,
+        channel_rate: Optional[float] = None,
+        channel_burst: int = 3,
+        retry_after: float = 1
+    ) -> None:
+        self.latency: float = latency
+        self.channel_rate: Optional[float] = channel_rate
+        self.channel_burst: int = channel_burst
+        self.retry_after: float = retry_after
+        # Each call as {"METHOD", "CHANNEL", "STATUS", "RECEIVED_AT", "PAYLOAD"}, in the order they were answered
+        self.calls: List[Dict] = []
+        self.failures: List[int] = []
+        # channel -> (tokens, when they were counted)
+        self.channel_tokens: Dict[str, Tuple[float, float]] = {}
+        self.lock: threading.Lock = threading.Lock()
+        self.url: Optional[str] = None
+        self.runner: Optional[web.AppRunner] = None
+        self.loop: asyncio.AbstractEventLoop = asyncio.new_event_loop()
+        self.thread: threading.Thread = threading.Thread(target=self.loop.run_forever, daemon=True)
+
+    def fail_next(self, *statuses: int) -> None:
+        with self.lock:
+            self.failures.extend(statuses)
+
+    # The status to answer a call to the channel with
+    def status_for(self, channel: str) -> int:
+        with self.lock:
+            if self.failures:
+                return self.failures.pop(0)
+            if self.channel_rate is None:
+                return 200
+
+            now: float = time.monotonic()
+            tokens, counted = self.channel_tokens.get(channel, (self.channel_burst, now))
+            tokens = min(self.channel_burst, tokens + (now - counted) * self.channel_rate)
+            if tokens < 1:
+                self.channel_tokens[channel] = (tokens, now)
+                return 429
+            self.channel_tokens[channel] = (tokens - 1, now)
+            return 200
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method: str = request.match_info["method"]
+        received_at: float = time.time()
+        # Some methods are sent their arguments in the query string, some as a GET
+        payload: Dict = dict(request.query)
+        if request.content_type == "application/json":
+            payload.update(await request.json())
+        elif request.method == "POST":
+            payload.update(await request.post())
+        channel: str = payload.get("channel") or payload.get("channel_id") or ""
+
+        await asyncio.sleep(self.latency)
+        status: int = self.status_for(channel)
+        with self.lock:
+            self.calls.append({"METHOD": method, "CHANNEL": channel, "STATUS": status, "RECEIVED_AT": received_at, "PAYLOAD": payload})
+
+        if status == 429:
+            return web.json_response({"ok": False, "error": "ratelimited"}, status=429, headers={"Retry-After": f"{self.retry_after:g}"})
+        if status != 200:
+            return web.json_response({"ok": False, "error": "fatal_error"}, status=status)
+
+        if method == "conversations.list":
+            return web.json_response({"ok": True, "channels": [], "response_metadata": {"next_cursor": ""}})
+        if method == "files.getUploadURLExternal":
+            file_id: str = f"F{len(self.calls)}"
+            return web.json_response({"ok": True, "file_id": file_id, "upload_url": self.url.replace("/api/", "/upload/") + file_id})
+        if method == "files.completeUploadExternal":
+            return web.json_response({"ok": True, "files": [{"id": file["id"]} for file in json.loads(payload["files"])]})
+        return web.json_response({"ok": True, "channel": channel, "ts": payload.get("ts") or f"{received_at:.6f}"})
+
+    # Where files_upload_v2 sends the file itself, recorded by size rather than kept
+    async def handle_upload(self, request: web.Request) -> web.Response:
+        body: bytes = await request.read()
+        with self.lock:
+            self.calls.append({
+                "METHOD": "upload",
+                "CHANNEL": "",
+                "STATUS": 200,
+                "RECEIVED_AT": time.time(),
+                "PAYLOAD": {"file_id": request.match_info["file_id"], "file": f"<{len(body)} bytes>"}
+            })
+        return web.Response(text="OK")
+
+    # The calls that were answered with a 200, optionally just one method's
+    def accepted(self, method: Optional[str] = None) -> List[Dict]:
+        with self.lock:
+            return [call for call in self.calls if call["STATUS"] == 200 and method in (None, call["METHOD"])]
+
+    # Calls by method and status, eg. {"chat.postMessage": {"200": 12, "429": 3}}
+    def summary(self) -> Dict[str, Dict[str, int]]:
+        summary: Dict[str, Dict[str, int]] = {}
+        with self.lock:
+            for call in self.calls:
+                statuses: Dict[str, int] = summary.setdefault(call["METHOD"], {})
+                statuses[str(call["STATUS"])] = statuses.get(str(call["STATUS"]), 0) + 1
+        return summary
+
+    async def start(self) -> None:
+        app: web.Application = web.Application()
+        app.router.add_post("/api/{method}", self.handle)
+        app.router.add_get("/api/{method}", self.handle)
+        app.router.add_post("/upload/{file_id}", self.handle_upload)
+        self.runner = web.AppRunner(app)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, "127.0.0.1", 0).start()
+        self.url = f"http://127.0.0.1:{self.runner.addresses[0][1]}/api/"
+
+    # The server runs on its own event loop in a background thread, so it can answer blocking clients too
+    def __enter__(self) -> "FakeSlackServer":
+        self.thread.start()
+        asyncio.run_coroutine_threadsafe(self.start(), self.loop).result()
+        return self
+
+    def __exit__(self, *args) -> None:
+        asyncio.run_coroutine_threadsafe(self.runner.cleanup(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
@@ -0,0 +1,99 @@
+from __future__ import annotations
+
+from array import array
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+# numpy is imported when brackets are first derived rather than on import, it's slow to import
+# and runs that post nothing never need it
+if TYPE_CHECKING:
+    import numpy as np
+
+from covid_row import BRACKET_DEFINITIONS, BRACKET_VAX_FIELDS, COUNT_FIELDS, COUNT_POSITIONS, MISSING, CovidRow
+
+
+# Derive every bracket's vaccination counts (and their PREV_ values) for all the rows at once,
+# working on the rows' count arrays as one matrix. A bracket count is missing if any count it's made from is
+def derive_brackets(rows: List[CovidRow]) -> None:
+    if not rows:
+        return
+
+    import numpy as np
+
+    counts: np.ndarray = np.frombuffer(
+        b"".join(row.counts.tobytes() for row in rows),
+        dtype=np.int64
+    ).reshape(len(rows), len(COUNT_FIELDS)).copy()
+    missing: np.ndarray = counts == MISSING
+
+    def column(field: str) -> np.ndarray:
+        return counts[:, COUNT_POSITIONS[field]]
+
+    for field in BRACKET_VAX_FIELDS:
+        for prefix in ["", "PREV_"]:
+            total: np.ndarray = column(prefix + field)
+            for bracket, terms in BRACKET_DEFINITIONS.items():
+                derived: np.ndarray = total.copy()
+                derived_missing: np.ndarray = missing[:, COUNT_POSITIONS[prefix + field]].copy()
+
+                for sign, suffix in terms:
+                    group: np.ndarray = column(prefix + field + suffix)
+                    group_missing: np.ndarray = missing[:, COUNT_POSITIONS[prefix + field + suffix]]
+                    if not prefix:
+                        # fallback on previous vax if 0. Datafeed seems to update current vax with yesterdays
+                        # data before todays data comes in but not the age groups, so this should be accurate (enough)
+                        previous: np.ndarray = column("PREV_" + field + suffix)
+                        stale: np.ndarray = group == 0
+                        group = np.where(stale, previous, group)
+                        group_missing = np.where(stale, missing[:, COUNT_POSITIONS["PREV_" + field + suffix]], group_missing)
+                    derived += sign * group
+                    derived_missing |= group_missing
+
+                counts[:, COUNT_POSITIONS[f"{prefix}{field}_{bracket}"]] = np.where(derived_missing, MISSING, derived)
+
+    for row, row_counts in zip(rows, counts):
+        row.counts = array("q", row_counts.tobytes())
+
+
+# Populations of every code in every bracket, read once from the state data
+class PopulationTable:
+
+    def __init__(self, state_data: Dict) -> None:
+        import numpy as np
+        self.codes: List[str] = list(state_data)
+        populations: List[str] = sorted({bracket for code in self.codes for bracket in state_data[code]["POPULATION"]})
+        # A population can be added before its bracket is defined, it's only an error to ask for it
+        undefined: List[str] = [bracket for bracket in populations if bracket not in BRACKET_DEFINITIONS]
+        if undefined:
+            print(f"Skipping population brackets with no definition in covid_row.BRACKET_DEFINITIONS: {undefined}")
+        self.brackets: List[str] = [bracket for bracket in populations if bracket in BRACKET_DEFINITIONS]
+
+        self.code_positions: Dict[str, int] = {code: position for position, code in enumerate(self.codes)}
+        self.bracket_positions: Dict[str, int] = {bracket: position for position, bracket in enumerate(self.brackets)}
+        # code x bracket, 0 where the state data has no population for the bracket
+        self.populations: np.ndarray = np.zeros((len(self.codes), len(self.brackets)), dtype=np.int64)
+        for code in self.codes:
+            for bracket, population in state_data[code]["POPULATION"].items():
+                if bracket in self.bracket_positions:
+                    self.populations[self.code_positions[code], self.bracket_positions[bracket]] = population
+
+    def population(self, code: str, bracket: str) -> Optional[int]:
+        if bracket not in BRACKET_DEFINITIONS:
+            raise ValueError(f"No definition in covid_row.BRACKET_DEFINITIONS for population bracket {bracket}")
+        if code not in self.code_positions or bracket not in self.bracket_positions:
+            return None
+
+        population: int = int(self.populations[self.code_positions[code], self.bracket_positions[bracket]])
+        return population or None
+
+
+LAST_TABLE: Optional[PopulationTable] = None
+LAST_STATE_DATA: Optional[Dict] = None
+
+
+# The table for the state data, only rebuilt when different state data is passed in
+def population_table(state_data: Dict) -> PopulationTable:
+    global LAST_TABLE, LAST_STATE_DATA
+    if state_data is not LAST_STATE_DATA:
+        LAST_TABLE = PopulationTable(state_data)
+        LAST_STATE_DATA = state_data
+    return LAST_TABLE
@@ -1,176 +1,533 @@
+from __future__ import annotations
+
 import json
 import requests
 import os
-from typing import Dict, List
-from slack_sdk.web import SlackResponse
-from slack_bot import CovidSlackBot
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Iterator, List, Optional, Tuple
+from feed_parser import decode_chunks
+from covid_row import BRACKET_FIELD_NAMES, BRACKET_VAX_FIELDS, CovidRow, parse_feed_rows
+from code_index import VAX_TREND_WINDOW, CodeIndex
+from feed_cache import FeedCache
+from feed_fetcher import FeedFetchError, get_with_retries, merge_rows, shared_session
+from snapshot_archive import SnapshotArchive
+from population_brackets import derive_brackets, population_table
+from posted_messages import PostedMessages
+from run_metrics import RunMetrics, current_metrics, measure_download, profiled, start_run
+
+# Slack, aiohttp and charting are only imported once there's something to post,
+# so runs where the feed hasn't changed start quickly. See startup_profile.py
+if TYPE_CHECKING:
+    from slack_sdk.web import SlackResponse
+    from slack_bot import CovidSlackBot
+    from trend_charts import ChartRenderer
 
 SELECTED_CODES = os.environ.get("SELECTED_CODES", 'AUS,VIC,NSW')
 POPULATION_BRACKET = os.environ.get("POPULATION_BRACKET", "16+")
 SLACK_CHANNEL_NAME = os.environ.get("SLACK_CHANNEL_NAME", "#testcovidbot")
 SLACK_BOT_DISPLAY = os.environ.get("SLACK_BOT_DISPLAY", 'CODE_DATA,VAX_DATA')
 SLACK_BOT_TOKEN = os.environ.get("SLACK_BOT_TOKEN", '')
+SLACK_API_URL = os.environ.get("SLACK_API_URL", "https://www.slack.com/api/")  # eg. a local fake Slack, see local_servers.py
 SLACK_BOT_EMOJI = os.environ.get("SLACK_BOT_EMOJI", ":robot_face:")
 SLACK_BOT_NAME = os.environ.get("SLACK_BOT_NAME", "CovidLiveSummary")
+SLACK_THREAD_CHUNKS = os.environ.get("SLACK_THREAD_CHUNKS", "false").lower() == "true"
+SLACK_EDIT_IN_PLACE = os.environ.get("SLACK_EDIT_IN_PLACE", "false").lower() == "true"
+SLACK_CHARTS = os.environ.get("SLACK_CHARTS", "false").lower() == "true"  # upload trend charts, needs matplotlib
+VAX_TREND_METHOD = os.environ.get("VAX_TREND_METHOD", "average")  # average or least_squares
+FEED_CHUNK_SIZE = int(os.environ.get("FEED_CHUNK_SIZE", 64 * 1024))
+FEED_CACHE_DIR = os.environ.get("FEED_CACHE_DIR", ".feed_cache")  # empty to disable
+FORCE_POST = os.environ.get("FORCE_POST", "false").lower() == "true"
+METRICS_TEXTFILE = os.environ.get("METRICS_TEXTFILE", "")  # Prometheus textfile to write run metrics to
+PROFILE_OUTPUT = os.environ.get("PROFILE_OUTPUT", "")  # cProfile stats file, profiling is off when unset
+FEED_ARCHIVE_DIR = os.environ.get("FEED_ARCHIVE_DIR", "")  # archive every fetched snapshot here, empty to disable
+FEED_OFFLINE = os.environ.get("FEED_OFFLINE", "false").lower() == "true"  # serve the feed from the archive
+FEED_ARCHIVE_AS_OF = os.environ.get("FEED_ARCHIVE_AS_OF", "")  # offline only, unix time to replay the archive as of
+# Where posted messages are remembered, so corrections can edit them in place
+SLACK_POSTED_MESSAGES_FILE = os.environ.get(
+    "SLACK_POSTED_MESSAGES_FILE",
+    os.path.join(FEED_CACHE_DIR or ".feed_cache", "posted-messages.json")
+)
+CHART_CACHE_DIR = os.environ.get("CHART_CACHE_DIR", os.path.join(FEED_CACHE_DIR or ".feed_cache", "charts"))
+# A JSON file of bot profiles to post instead of the single bot configured above, see bot_profiles.py
+BOT_PROFILES_FILE = os.environ.get("BOT_PROFILES_FILE", "")
+SOURCE_URL = os.environ.get("SOURCE_URL", "https://covidlive.com.au/covid-live.json")
+# Alternates for SOURCE_URL, tried in order when it can't be fetched
+FEED_MIRRORS = [url for url in os.environ.get("FEED_MIRRORS", "").split(",") if url]
+# More covid-live.json shaped feeds, eg. per region, downloaded alongside SOURCE_URL and merged into its rows
+FEED_EXTRA_SOURCES = [url for url in os.environ.get("FEED_EXTRA_SOURCES", "").split(",") if url]
+STATE_DATA_FILE = "resources/state-data.json"
+
+
+def post_covid_stats() -> Optional[SlackResponse]:
+    metrics: RunMetrics = start_run()
+    try:
+        with profiled(PROFILE_OUTPUT):
+            if BOT_PROFILES_FILE:
+                from bot_profiles import fetch_and_post_profiles, load_profiles
+                fetch_and_post_profiles(load_profiles(BOT_PROFILES_FILE))
+                return None
+            return fetch_and_post_covid_stats()
+    finally:
+        metrics.export(METRICS_TEXTFILE)
+
+
+def fetch_and_post_covid_stats() -> Optional[SlackResponse]:
+    codes = SELECTED_CODES.split(",")
+    feed_cache: Optional[FeedCache] = FeedCache(FEED_CACHE_DIR) if FEED_CACHE_DIR else None
+    archive: Optional[SnapshotArchive] = SnapshotArchive(FEED_ARCHIVE_DIR) if FEED_ARCHIVE_DIR else None
+    covid_data, modified = fetch_and_parse_data(
+        SOURCE_URL,
+        codes,
+        feed_cache,
+        archive=archive,
+        mirrors=FEED_MIRRORS,
+        extra_sources=FEED_EXTRA_SOURCES
+    )
+
+    if not modified and not FORCE_POST:
+        print("Feed has not changed since the last run, nothing to post")
+        return None
 
+    charts: Optional[ChartRenderer] = create_chart_renderer()
+    # Index the feed once and share it between both displays
+    index: CodeIndex = create_index(covid_data, codes, charts)
+    state_data: Dict = load_state_data()
+    slack_bot: CovidSlackBot = create_slack_bot()
 
-def post_covid_stats() -> SlackResponse:
-    state_data_file: str = "resources/state-data.json"
-    source_url: str = "https://covidlive.com.au/covid-live.json"
-    covid_data: Dict = fetch_and_parse_data(source_url)
-    
+    try:
+        response: Optional[SlackResponse] = post_updates(
+            slack_bot,
+            index,
+            state_data,
+            codes,
+            SLACK_BOT_DISPLAY.split(","),
+            POPULATION_BRACKET,
+            charts=charts
+        )
+        # Only now is the feed cached as seen, so a run that fails to post fetches it again next time
+        if feed_cache is not None:
+            feed_cache.commit()
+        return response
+    finally:
+        if charts is not None:
+            charts.shutdown()
+
+
+def load_state_data(state_data_file: str = STATE_DATA_FILE) -> Dict:
     with open(state_data_file) as stateDataFile:
-        state_data: Dict = json.load(stateDataFile)
-    
-    slack_bot: CovidSlackBot = CovidSlackBot(
+        return json.load(stateDataFile)
+
+
+# An index keeping the history charts need, if there are any
+def create_index(rows: List[CovidRow], codes: List[str], charts: Optional[ChartRenderer] = None) -> CodeIndex:
+    return CodeIndex(rows, codes, history_days=charts.days if charts is not None else 0)
+
+
+def create_chart_renderer() -> Optional[ChartRenderer]:
+    if not SLACK_CHARTS:
+        return None
+
+    from trend_charts import ChartRenderer, charts_available
+    if not charts_available():
+        print("SLACK_CHARTS is on but matplotlib isn't installed, posting without charts")
+        return None
+    return ChartRenderer(CHART_CACHE_DIR)
+
+
+def create_slack_bot() -> CovidSlackBot:
+    from slack_bot import CovidSlackBot
+    return CovidSlackBot(
         SLACK_BOT_TOKEN,
         SLACK_CHANNEL_NAME,
         SLACK_BOT_NAME,
-        SLACK_BOT_EMOJI
+        SLACK_BOT_EMOJI,
+        SLACK_THREAD_CHUNKS,
+        VAX_TREND_METHOD,
+        PostedMessages(SLACK_POSTED_MESSAGES_FILE) if SLACK_EDIT_IN_PLACE else None,
+        base_url=SLACK_API_URL
     )
 
-    response: SlackResponse
-    codes = SELECTED_CODES.split(",")
-    display = SLACK_BOT_DISPLAY.split(",")
 
-    if "CODE_DATA" in display:
-        code_data: Dict = get_most_recent_data_for_codes(covid_data, state_data, codes, POPULATION_BRACKET)
-        response = slack_bot.execute_for_covid_data(code_data)
-    if "VAX_DATA" in display:
-        vax_data: Dict = get_vax_data_for_codes(covid_data, state_data, codes, POPULATION_BRACKET)
-        response = slack_bot.execute_for_vax_stats(vax_data)
+# Select, render and post each display. If last_posted is given (display -> code -> version) only
+# codes whose data has moved on since they were last posted are sent, and last_posted is updated.
+# With charts, the updated codes' charts render while the text is posted and are uploaded after it
+def post_updates(
+    slack_bot: CovidSlackBot,
+    index: CodeIndex,
+    state_data: Dict,
+    codes: List[str],
+    display: List[str],
+    population_bracket: str,
+    last_posted: Optional[Dict[str, Dict[str, Tuple[str, str]]]] = None,
+    selections: Optional["SharedSelections"] = None,
+    charts: Optional[ChartRenderer] = None
+) -> Optional[SlackResponse]:
+    response: Optional[SlackResponse] = None
+    metrics: RunMetrics = current_metrics()
+    selections = selections or SharedSelections(index, state_data)
+
+    with metrics.stage("select"):
+        code_data: Dict = {}
+        if "CODE_DATA" in display:
+            code_data = select_updated_codes(selections.select("CODE_DATA", codes, population_bracket), last_posted, "CODE_DATA")
+        vax_data: Dict = {}
+        if "VAX_DATA" in display:
+            vax_data = select_updated_codes(selections.select("VAX_DATA", codes, population_bracket), last_posted, "VAX_DATA")
+
+    pending_charts: Dict = {}
+    if charts is not None:
+        from trend_charts import chart_series, post_charts
+        chart_codes: List[str] = [code for code in codes if code in code_data or code in vax_data]
+        pending_charts = charts.submit({
+            code: chart_series(index, state_data, code, population_bracket, charts.days) for code in chart_codes
+        })
+
+    if code_data:
+        record_data_published(code_data, metrics)
+        response = check_slack_response(slack_bot.execute_for_covid_data(code_data)) or response
+        record_posted_codes(code_data, last_posted, "CODE_DATA")
+    if vax_data:
+        record_data_published(vax_data, metrics)
+        response = check_slack_response(slack_bot.execute_for_vax_stats(vax_data)) or response
+        record_posted_codes(vax_data, last_posted, "VAX_DATA")
+
+    if pending_charts:
+        post_charts(slack_bot, charts, pending_charts)
+
+    if response is None:
+        print("Nothing has updated since it was last posted")
+        return None
+
+    print(f"Successfully posted update to slack")
+    return response
+
+
+# Selections from one index. Each code is selected once per display with every population bracket
+# derived, then viewed from each bracket asked for, however many bots ask for it
+class SharedSelections:
+
+    def __init__(self, index: CodeIndex, state_data: Dict) -> None:
+        self.index: CodeIndex = index
+        self.state_data: Dict = state_data
+        # (display, code) -> the selected row (and trailing rows for VAX_DATA), None if the code has none
+        self.rows: Dict[Tuple[str, str], Optional[Tuple[CovidRow, List[CovidRow]]]] = {}
+        self.views: Dict[Tuple[str, str, str], CovidRow] = {}
+
+    def select(self, display: str, codes: List[str], population_bracket: str) -> Dict:
+        missing: List[str] = [code for code in codes if (display, code) not in self.rows]
+        if missing:
+            if display == "CODE_DATA":
+                selected: Dict = {code: (row, []) for code, row in select_most_recent_rows(self.index, missing).items()}
+            else:
+                selected = select_vax_rows(self.index, missing)
+            for code in missing:
+                self.rows[(display, code)] = selected.get(code)
+            current_metrics().increment("selections_computed", len(missing))
+
+        data: Dict = {}
+        for code in codes:
+            if self.rows[(display, code)] is None:
+                continue
+
+            key: Tuple[str, str, str] = (display, code, population_bracket)
+            if key not in self.views:
+                row, trailing = self.rows[(display, code)]
+                if display == "CODE_DATA":
+                    self.views[key] = most_recent_bracket_view(row, self.state_data, population_bracket)
+                else:
+                    self.views[key] = vax_bracket_view(row, trailing, self.state_data, population_bracket)
+            data[code] = self.views[key]
+        return data
+
+
+def record_data_published(data: Dict, metrics: RunMetrics) -> None:
+    for code in data:
+        metrics.data_published(data[code]["LAST_UPDATED_DATE"])
+
+
+def check_slack_response(response: Optional[SlackResponse]) -> Optional[SlackResponse]:
+    if response is None:
+        return None
 
     if response.status_code != 200:
         print(f"something went wrong: {response.data}")
         exit(1)
 
     print(response.data)
-    print(f"Successfully posted update to slack")
     return response
 
 
-def fetch_and_parse_data(source_url: str):
-    # fetch json content
-    response_body: str = fetch_data(source_url)
-    # return parsed content
-    return json.loads(response_body)
+# The version of a code's data is its report date plus when that report was last updated
+def data_version(data: Dict) -> Tuple[str, str]:
+    return (data["REPORT_DATE"], data["LAST_UPDATED_DATE"])
+
+
+def select_updated_codes(data: Dict, last_posted: Optional[Dict], display: str) -> Dict:
+    if last_posted is None:
+        return data
+
+    posted: Dict[str, Tuple[str, str]] = last_posted.get(display, {})
+    return {code: data[code] for code in data if posted.get(code) != data_version(data[code])}
+
+
+def record_posted_codes(data: Dict, last_posted: Optional[Dict], display: str) -> None:
+    if last_posted is None:
+        return
+
+    posted: Dict[str, Tuple[str, str]] = last_posted.setdefault(display, {})
+    for code in data:
+        posted[code] = data_version(data[code])
+
+
+# JSON turns the saved version tuples into lists, turn them back so they compare equal
+def restore_versions(posted: Dict) -> Dict:
+    return {key: tuple(value) if isinstance(value, list) else restore_versions(value) for key, value in posted.items()}
+
 
+# last_posted is persisted so a restarted or rerun bot doesn't repost data the channel has already seen
+def load_last_posted(last_posted_file: str) -> Dict:
+    if not os.path.exists(last_posted_file):
+        return {}
 
-def fetch_data(url: str):
+    with open(last_posted_file) as lastPostedFile:
+        return restore_versions(json.load(lastPostedFile))
+
+
+# Written to a partial file first, so a run stopped while saving can't leave a truncated file behind
+def save_last_posted(last_posted_file: str, last_posted: Dict) -> None:
+    os.makedirs(os.path.dirname(last_posted_file) or ".", exist_ok=True)
+    partial_file: str = last_posted_file + ".partial"
+    with open(partial_file, "w") as lastPostedFile:
+        json.dump(last_posted, lastPostedFile)
+    os.replace(partial_file, last_posted_file)
+
+
+# Returns the parsed rows and whether the feed changed since it was last cached.
+# Mirrors are alternates for source_url, tried in order if it fails. Extra sources are
+# fetched alongside it and their rows merged in, see feed_fetcher.merge_rows
+def fetch_and_parse_data(
+    source_url: str,
+    codes: Optional[List[str]] = None,
+    feed_cache: Optional[FeedCache] = None,
+    session: Optional[requests.Session] = None,
+    archive: Optional[SnapshotArchive] = None,
+    mirrors: Optional[List[str]] = None,
+    extra_sources: Optional[List[str]] = None
+) -> Tuple[List[CovidRow], bool]:
+    if FEED_OFFLINE:
+        if archive is None:
+            raise ValueError("FEED_OFFLINE is on but there is no archive to serve the feed from, set FEED_ARCHIVE_DIR")
+        as_of: Optional[float] = float(FEED_ARCHIVE_AS_OF) if FEED_ARCHIVE_AS_OF else None
+        print(f"Serving feed from the archive at {archive.archive_dir}")
+        return archive.latest_rows(codes, as_of), True
+
+    session = session or shared_session()
+    sources: List[Tuple[List[str], Optional[FeedCache]]] = [([source_url] + (mirrors or []), feed_cache)]
+    for url in extra_sources or []:
+        sources.append(([url], feed_cache.for_source(url) if feed_cache is not None else None))
+
+    if len(sources) == 1:
+        results: List[Tuple[List[CovidRow], bool]] = [fetch_and_parse_source(sources[0][0], codes, sources[0][1], session)]
+    else:
+        # Download every source at once, so fetching takes as long as the slowest source rather than all of them
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            results = list(executor.map(lambda source: fetch_and_parse_source(source[0], codes, source[1], session), sources))
+
+    modified: bool = any(source_modified for _, source_modified in results)
+    rows: List[CovidRow] = results[0][0] if len(results) == 1 else merge_rows(source_rows for source_rows, _ in results)
+    if modified and archive is not None:
+        with current_metrics().stage("archive"):
+            print(f"Archived {archive.append(rows)} new or changed rows")
+    return rows, modified
+
+
+# Fetch and parse one source, falling back through its urls in order
+def fetch_and_parse_source(
+    urls: List[str],
+    codes: Optional[List[str]],
+    feed_cache: Optional[FeedCache],
+    session: requests.Session
+) -> Tuple[List[CovidRow], bool]:
+    metrics: RunMetrics = current_metrics()
+    for position, url in enumerate(urls):
+        try:
+            # fetch json content as a stream of text chunks
+            waits: List[float] = []
+            response_chunks, modified = fetch_data(url, feed_cache, session, waits)
+            if not modified:
+                return feed_cache.cached_rows(codes), False
+
+            # parse incrementally, keeping only the rows for the selected codes. The body is downloaded
+            # as it is parsed, so this call's time spent waiting on the network is taken out of the parse stage
+            started: float = time.perf_counter()
+            rows: List[CovidRow] = list(parse_feed_rows(response_chunks, codes))
+            metrics.add_stage_time("parse", max(0.0, time.perf_counter() - started - sum(waits)))
+        except (FeedFetchError, requests.RequestException, ValueError) as e:
+            if position == len(urls) - 1:
+                raise
+            print(f"Fetching {url} failed ({e}), trying {urls[position + 1]}")
+            metrics.increment("feed_mirror_fallbacks")
+            continue
+
+        print(f"Successfully parsed {len(rows)} rows")
+        if feed_cache is not None:
+            feed_cache.remember_rows(codes, rows)
+        return rows, True
+
+
+def fetch_data(
+    url: str,
+    feed_cache: Optional[FeedCache] = None,
+    session: Optional[requests.Session] = None,
+    waits: Optional[List[float]] = None
+) -> Tuple[Optional[Iterator[str]], bool]:
     print(f"Fetching data from: {url}")
-    response = requests.get(url)
-    if response.status_code != 200:
-        print(f"Unable to fetch data: {response.text}")
-        exit(1)
+    headers: Dict[str, str] = feed_cache.conditional_headers(url) if feed_cache is not None else {}
+    # Reuse the caller's session (and its open connections) when there is one
+    metrics: RunMetrics = current_metrics()
+    with metrics.stage("fetch"):
+        response = get_with_retries(session or shared_session(), url, headers)
+    if response.status_code == 304:
+        if feed_cache is None:
+            raise FeedFetchError(f"Unable to fetch {url}: 304 without a cached copy")
+        print("Feed not modified, using cached copy")
+        return None, False
 
     print(f"Successfully fetched")
-    return response.text
-
-
-def get_vax_data_for_codes(data: Dict, state_data: Dict, codes: List[str], population_bracket: str) -> Dict:
-    vax_data: Dict[str] = {}
-
-    for row in data:
-        if(row['CODE'] in codes):
-            code: str = row['CODE']
-            # If we dont have this state in the most recent data add it
-            if code not in vax_data:
-                if row["LAST_UPDATED_DATE"] != None and row['VACC_DOSE_CNT'] != None:
-                    vax_data[code] = row
-                    
-                    vax_data[code]["RECORD_COUNT"] = 0
-                    vax_data[code]["POPULATION_BRACKET"] = population_bracket
-                    vax_data[code]["CODE_EMOJI"] = state_data[code]["EMOJI"]
-                    vax_data[code]["POPULATION"] = state_data[code]["POPULATION"][population_bracket]
-                    
-                    normalise_vax_data_for_population(vax_data[code])
-                    print(f'Code: {code} latest vax data selected for updated date: {row["LAST_UPDATED_DATE"]}')
-                continue
+    byte_chunks: Iterator[bytes] = measure_download(response.iter_content(chunk_size=FEED_CHUNK_SIZE), metrics, waits)
+    chunks: Iterator[str] = decode_chunks(byte_chunks, response.encoding or "utf-8")
+    if feed_cache is not None:
+        chunks = feed_cache.store(url, response.headers, chunks)
+    return chunks, True
+
+
+def get_vax_data_for_codes(
+    index: CodeIndex,
+    state_data: Dict,
+    codes: List[str],
+    population_bracket: str,
+    window: int = VAX_TREND_WINDOW
+) -> Dict:
+    selected: Dict[str, Tuple[CovidRow, List[CovidRow]]] = select_vax_rows(index, codes, window)
+    return {code: vax_bracket_view(*selected[code], state_data, population_bracket) for code in selected}
+
+
+# Latest row for each code that has vaccination data, and its trailing window (newest first),
+# with every population bracket derived in one pass over all of them
+def select_vax_rows(index: CodeIndex, codes: List[str], window: int = VAX_TREND_WINDOW) -> Dict[str, Tuple[CovidRow, List[CovidRow]]]:
+    selected: Dict[str, Tuple[CovidRow, List[CovidRow]]] = {}
+    to_derive: List[CovidRow] = []
+
+    for code in codes:
+        latest: Optional[CovidRow] = index.latest_vax(code)
+        if latest is None:
+            print(f"Code: {code} has no vax data")
+            continue
 
-            current = vax_data[code]
-            if current["RECORD_COUNT"] < 7: #weekly average
-                current["RECORD_COUNT"] += 1
-                normalise_vax_data_for_population(row);
-                current[f"PREV_VACC_FIRST_DOSE_CNT_{population_bracket}"] = row[f"VACC_FIRST_DOSE_CNT_{population_bracket}"]
-                current[f"PREV_VACC_PEOPLE_CNT_{population_bracket}"] = row[f"VACC_PEOPLE_CNT_{population_bracket}"]
+        row: CovidRow = latest.copy()
+        print(f'Code: {code} latest vax data selected for updated date: {row["LAST_UPDATED_DATE"]}')
+
+        # The oldest row in the trailing window is the baseline for the rolling average,
+        # the whole window (newest first) is kept for fitting a trend
+        trailing: List[CovidRow] = [trailing_row.copy() for trailing_row in index.trailing(code, window)]
+        selected[code] = (row, trailing)
+        to_derive.append(row)
+        to_derive.extend(trailing_row for trailing_row in trailing if trailing_row["VACC_DOSE_CNT"] != None)
+
+    derive_brackets(to_derive)
+    return selected
+
+
+# A selected vax row as seen from one population bracket
+def vax_bracket_view(row: CovidRow, trailing: List[CovidRow], state_data: Dict, population_bracket: str) -> CovidRow:
+    code: str = row["CODE"]
+    vax_data: CovidRow = row.copy()
+    vax_data["POPULATION_BRACKET"] = population_bracket
+    vax_data["CODE_EMOJI"] = state_data[code]["EMOJI"]
+    vax_data["POPULATION"] = population_table(state_data).population(code, population_bracket)
+
+    # The rolling average's baseline is the oldest row in the window with vax counts, so many days back.
+    # Without one, the row's own PREV_ counts from the day before are used
+    bracket_fields: List[str] = [BRACKET_FIELD_NAMES[(vax_field, population_bracket)] for vax_field in BRACKET_VAX_FIELDS]
+    baseline: Optional[int] = next((
+        position for position in range(len(trailing) - 1, -1, -1)
+        if all(trailing[position][bracket_field] is not None for bracket_field in bracket_fields)
+    ), None)
+    vax_data["RECORD_COUNT"] = baseline + 1 if baseline is not None else 1
+
+    # Newest first, one count a day with None where a row has none, so each count stays at its own day for fitting
+    vax_data["TRAILING_COUNTS"] = {}
+    for vax_field, bracket_field in zip(BRACKET_VAX_FIELDS, bracket_fields):
+        vax_data["TRAILING_COUNTS"][vax_field] = [vax_data[bracket_field]] + [trailing_row[bracket_field] for trailing_row in trailing]
+
+        if baseline is not None:
+            vax_data[BRACKET_FIELD_NAMES[("PREV_" + vax_field, population_bracket)]] = trailing[baseline][bracket_field]
 
     return vax_data
 
-def normalise_vax_data_for_population(data: Dict):
-    
-    youthFirstVax: int = int(data["VACC_FIRST_DOSE_CNT_12_15"])
-    youthFullVax: int = int(data["VACC_PEOPLE_CNT_12_15"])
-    prevYouthFirstVax: int = int(data["PREV_VACC_FIRST_DOSE_CNT_12_15"])
-    prevYouthFullVax: int = int(data["PREV_VACC_PEOPLE_CNT_12_15"])
-
-    # fallback on previous vax if 0. Datafeed seems to update current vax with 
-    # yesterdays data before todays data comes in but not 12-15, so this should be accurate (enough)
-    if youthFirstVax == 0:
-        youthFirstVax = prevYouthFirstVax
-
-    if youthFullVax == 0:
-        youthFullVax = prevYouthFullVax
-
-    totalFirstVax: int = int(data["VACC_FIRST_DOSE_CNT"])
-    totalFullVax: int = int(data["VACC_PEOPLE_CNT"])
-    prevTotalFirstVax: int = int(data["PREV_VACC_FIRST_DOSE_CNT"])
-    prevTotalFullVax: int = int(data["PREV_VACC_PEOPLE_CNT"])
-
-    data["VACC_FIRST_DOSE_CNT_12+"] = totalFirstVax
-    data["VACC_PEOPLE_CNT_12+"] = totalFullVax
-
-    data["PREV_VACC_FIRST_DOSE_CNT_12+"] = prevTotalFirstVax
-    data["PREV_VACC_PEOPLE_CNT_12+"] = prevTotalFullVax
-
-    data["VACC_FIRST_DOSE_CNT_16+"] = totalFirstVax - youthFirstVax
-    data["VACC_PEOPLE_CNT_16+"] = totalFullVax - youthFullVax
-    
-    data["PREV_VACC_FIRST_DOSE_CNT_16+"] = prevTotalFirstVax - prevYouthFirstVax
-    data["PREV_VACC_PEOPLE_CNT_16+"] = prevTotalFullVax - prevYouthFullVax
-
-def get_most_recent_data_for_codes(data: Dict, state_data: Dict, codes: List[str], population_bracket: str) -> Dict:
-    most_recent_data: Dict[str] = {}
-
-    for row in data:
-        if(row['CODE'] in codes):
-            # If we dont have this state in the most recent data add it
-            if row['CODE'] not in most_recent_data:
-                if row["LAST_UPDATED_DATE"] != None:
-                    most_recent_data[row['CODE']] = row
-                    print(f'Code: {row["CODE"]} data selected for updated date: {row["LAST_UPDATED_DATE"]}')
-                continue
 
-            current = most_recent_data[row['CODE']]
-            
-            if row['REPORT_DATE'] > current['REPORT_DATE']:
-                print(f'Code: {row["CODE"]} data selected for updated date: {row["LAST_UPDATED_DATE"]}')
-                most_recent_data[row['CODE']] = row
-                continue
+# Codes asked for that the feed has no rows for are left out of the selection, say so rather than fail
+def report_missing_codes(index: CodeIndex, codes: List[str]) -> List[str]:
+    missing: List[str] = index.missing(codes)
+    if missing:
+        print(f"No data in the feed for codes: {','.join(missing)}")
+        current_metrics().increment("codes_missing", len(missing))
+    return missing
 
-            if row['REPORT_DATE'] == current['REPORT_DATE'] and row['LAST_UPDATED_DATE'] >= current['LAST_UPDATED_DATE']:
-                most_recent_data[row['CODE']] = row
-                print(f'Code: {row["CODE"]} data selected for updated date: {row["LAST_UPDATED_DATE"]}')
-                continue
-            
-            if current['VACC_DOSE_CNT'] == None and row['VACC_DOSE_CNT'] != None:
-                #vaccination data hasn't updated - just use previous
+
+def get_most_recent_data_for_codes(index: CodeIndex, state_data: Dict, codes: List[str], population_bracket: str) -> Dict:
+    selected: Dict[str, CovidRow] = select_most_recent_rows(index, codes)
+    return {code: most_recent_bracket_view(selected[code], state_data, population_bracket) for code in selected}
+
+
+# Latest row for each code, with every population bracket derived in one pass over all of them
+def select_most_recent_rows(index: CodeIndex, codes: List[str]) -> Dict[str, CovidRow]:
+    most_recent_data: Dict[str, CovidRow] = {}
+    report_missing_codes(index, codes)
+
+    for code in codes:
+        latest: Optional[CovidRow] = index.latest(code)
+        if latest is None:
+            continue
+
+        current: CovidRow = latest.copy()
+        most_recent_data[code] = current
+        print(f'Code: {code} data selected for updated date: {current["LAST_UPDATED_DATE"]}')
+
+        if current['VACC_DOSE_CNT'] == None:
+            #vaccination data hasn't updated - just use previous
+            row: Optional[CovidRow] = index.latest_vax(code)
+            if row is not None:
                 current['PREV_VACC_DOSE_CNT'] = row['PREV_VACC_DOSE_CNT']
                 current['VACC_DOSE_CNT'] = row['VACC_DOSE_CNT']
                 current['PREV_VACC_FIRST_DOSE_CNT'] = row['PREV_VACC_FIRST_DOSE_CNT']
                 current['VACC_FIRST_DOSE_CNT'] = row['VACC_FIRST_DOSE_CNT']
                 current['PREV_VACC_PEOPLE_CNT'] = row['PREV_VACC_PEOPLE_CNT']
                 current['VACC_PEOPLE_CNT'] = row['VACC_PEOPLE_CNT']
-                
-    for code in codes:
-        most_recent_data[code]["POPULATION_BRACKET"] = population_bracket
-        normalise_vax_data_for_population(most_recent_data[code])
-        if code not in state_data:
-            most_recent_data[code]["POPULATION"] = None
-            continue
-
-        most_recent_data[code]["POPULATION"] = state_data[code]["POPULATION"][population_bracket]
 
+    derive_brackets(list(most_recent_data.values()))
     return most_recent_data
 
+
+# A selected row as seen from one population bracket
+def most_recent_bracket_view(row: CovidRow, state_data: Dict, population_bracket: str) -> CovidRow:
+    code_data: CovidRow = row.copy()
+    code_data["POPULATION_BRACKET"] = population_bracket
+    code_data["POPULATION"] = population_table(state_data).population(row["CODE"], population_bracket)
+    return code_data
+
 if __name__ == "__main__":
-    post_covid_stats()
+    if "--profile-startup" in sys.argv[1:]:
+        from startup_profile import main
+        main([arg for arg in sys.argv[1:] if arg != "--profile-startup"])
+    elif "--watch" in sys.argv[1:]:
+        from covid_watcher import CovidWatcher
+        if BOT_PROFILES_FILE:
+            from bot_profiles import load_profiles
+            CovidWatcher(profiles=load_profiles(BOT_PROFILES_FILE)).run_forever()
+        else:
+            CovidWatcher().run_forever()
+    else:
+        post_covid_stats()
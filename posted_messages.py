@@ -0,0 +1,47 @@
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+# A posted message is stored as its ts and the groups of blocks it was built from, each group
+# tagged with the code it renders (None for headers) and the version of the data it rendered:
+# {channel: {display: [{"TS": ts, "GROUPS": [{"CODE": code, "VERSION": [report, updated], "BLOCKS": [...]}]}]}}
+
+
+class PostedMessages:
+
+    def __init__(self, state_file: str) -> None:
+        self.state_file: str = state_file
+        self.state: Dict[str, Dict[str, List[Dict]]] = {}
+        if os.path.exists(state_file):
+            with open(state_file) as stateFile:
+                self.state = json.load(stateFile)
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(self.state_file) or ".", exist_ok=True)
+        partial_file: str = self.state_file + ".partial"
+        with open(partial_file, "w") as stateFile:
+            json.dump(self.state, stateFile)
+        os.replace(partial_file, self.state_file)
+
+    def messages(self, channel: str, display: str) -> List[Dict]:
+        return self.state.setdefault(channel, {}).setdefault(display, [])
+
+    # The most recent message that rendered the code, and the code's group within it
+    def find(self, channel: str, display: str, code: str) -> Optional[Tuple[Dict, Dict]]:
+        for message in reversed(self.messages(channel, display)):
+            for group in message["GROUPS"]:
+                if group["CODE"] == code:
+                    return message, group
+        return None
+
+    def record_post(self, channel: str, display: str, ts: str, groups: List[Dict]) -> None:
+        messages: List[Dict] = self.messages(channel, display)
+        messages.append({"TS": ts, "GROUPS": groups})
+
+        # Forget messages that are no longer the latest post for any of their codes
+        latest: Dict[str, str] = {}
+        for message in messages:
+            for group in message["GROUPS"]:
+                if group["CODE"] is not None:
+                    latest[group["CODE"]] = message["TS"]
+        messages[:] = [message for message in messages if message["TS"] in latest.values()]
@@ -0,0 +1,64 @@
+import hashlib
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Optional
+
+from covid_row import ATTRIBUTE_FIELDS, COUNT_FIELDS, CovidRow
+from run_metrics import current_metrics
+
+# Enough for every code and display across a few days of polls, each entry is a handful of blocks
+RENDER_CACHE_SIZE: int = 512
+
+
+# A hash of everything a render reads from the code's data, so unchanged data renders once.
+# Extra fields (eg. trailing vax counts) and settings that change the output go in with it
+def content_key(kind: str, data: Dict, extra_fields: Iterable[str] = (), settings: Iterable = ()) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(repr((kind, tuple(settings))).encode("utf-8"))
+
+    if isinstance(data, CovidRow):
+        digest.update(repr([getattr(data, field) for field in ATTRIBUTE_FIELDS]).encode("utf-8"))
+        digest.update(data.counts.tobytes())
+    else:
+        digest.update(repr([data.get(field) for field in ATTRIBUTE_FIELDS + COUNT_FIELDS]).encode("utf-8"))
+
+    digest.update(repr([data.get(field) for field in extra_fields]).encode("utf-8"))
+    return digest.hexdigest()
+
+
+class RenderCache:
+
+    # Least recently used entries are evicted past max_entries. Cached renders are shared between
+    # callers, so they must be treated as read only
+    def __init__(self, max_entries: int = RENDER_CACHE_SIZE) -> None:
+        self.max_entries: int = max_entries
+        self.entries: OrderedDict = OrderedDict()
+
+    def __contains__(self, key: str) -> bool:
+        return key in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, key: str) -> Optional[object]:
+        if key not in self.entries:
+            return None
+        self.entries.move_to_end(key)
+        return self.entries[key]
+
+    def put(self, key: str, value) -> None:
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def get_or_render(self, key: str, render: Callable[[], object]):
+        value = self.get(key)
+        if value is not None:
+            current_metrics().increment("render_cache_hits")
+            return value
+
+        current_metrics().increment("render_cache_misses")
+        value = render()
+        if self.max_entries > 0:
+            self.put(key, value)
+        return value
@@ -0,0 +1,160 @@
+import cProfile
+import json
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# covidlive publishes LAST_UPDATED_DATE in AEST
+AEST: timezone = timezone(timedelta(hours=10))
+
+
+class RunMetrics:
+
+    def __init__(self) -> None:
+        self.started: float = time.time()
+        # Seconds spent in each stage (fetch, download, parse, select, render, slack)
+        self.stages: Dict[str, float] = {}
+        # Counts for the run, eg. bytes downloaded or rows scanned and kept
+        self.counters: Dict[str, float] = {}
+        # Count, sum and max of each latency observed, eg. every Slack API call
+        self.latencies: Dict[str, Dict[str, float]] = {}
+        self.latest_data_published: Optional[float] = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        started: float = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_stage_time(name, time.perf_counter() - started)
+
+    def add_stage_time(self, name: str, seconds: float) -> None:
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def increment(self, name: str, value: float = 1) -> None:
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def observe(self, name: str, seconds: float) -> None:
+        latency: Dict[str, float] = self.latencies.setdefault(name, {"count": 0, "sum": 0.0, "max": 0.0})
+        latency["count"] += 1
+        latency["sum"] += seconds
+        latency["max"] = max(latency["max"], seconds)
+
+    # Note when the newest data being posted was published, to measure publication -> post latency
+    def data_published(self, last_updated_date: str) -> None:
+        published: float = datetime.strptime(last_updated_date, "%Y-%m-%d %H:%M:%S").replace(tzinfo=AEST).timestamp()
+        if self.latest_data_published is None or published > self.latest_data_published:
+            self.latest_data_published = published
+
+    def to_dict(self) -> Dict:
+        finished: float = time.time()
+        data: Dict = {
+            "event": "run_metrics",
+            "started": self.started,
+            "duration_seconds": finished - self.started,
+            "stages": self.stages,
+            "counters": self.counters,
+            "latencies": self.latencies,
+        }
+        if self.latest_data_published is not None:
+            data["publication_to_post_seconds"] = finished - self.latest_data_published
+        return data
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), sort_keys=True)
+
+    # Render in the Prometheus text exposition format, for node_exporter's textfile collector
+    def to_prometheus(self, prefix: str = "covidbot") -> str:
+        data: Dict = self.to_dict()
+        lines = [
+            f"# TYPE {prefix}_last_run_timestamp_seconds gauge",
+            f"{prefix}_last_run_timestamp_seconds {data['started']}",
+            f"# TYPE {prefix}_run_duration_seconds gauge",
+            f"{prefix}_run_duration_seconds {data['duration_seconds']}",
+            f"# TYPE {prefix}_stage_seconds gauge",
+        ]
+        lines.extend(f'{prefix}_stage_seconds{{stage="{name}"}} {seconds}' for name, seconds in sorted(self.stages.items()))
+
+        for name, value in sorted(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {value}")
+
+        for name, latency in sorted(self.latencies.items()):
+            lines.append(f"# TYPE {prefix}_{name}_seconds summary")
+            lines.append(f"{prefix}_{name}_seconds_count {latency['count']}")
+            lines.append(f"{prefix}_{name}_seconds_sum {latency['sum']}")
+            lines.append(f"# TYPE {prefix}_{name}_seconds_max gauge")
+            lines.append(f"{prefix}_{name}_seconds_max {latency['max']}")
+
+        if "publication_to_post_seconds" in data:
+            lines.append(f"# TYPE {prefix}_publication_to_post_seconds gauge")
+            lines.append(f"{prefix}_publication_to_post_seconds {data['publication_to_post_seconds']}")
+
+        return "\n".join(lines) + "\n"
+
+    # Log the run as a JSON line and, if a path is given, atomically replace the Prometheus textfile
+    def export(self, textfile: Optional[str] = None) -> None:
+        print(self.to_json())
+        if not textfile:
+            return
+
+        partial_file: str = textfile + ".partial"
+        with open(partial_file, "w") as metricsFile:
+            metricsFile.write(self.to_prometheus())
+        os.replace(partial_file, textfile)
+
+
+CURRENT_METRICS: RunMetrics = RunMetrics()
+
+
+# Metrics for the run in progress, recorded into by each stage of the bot
+def current_metrics() -> RunMetrics:
+    return CURRENT_METRICS
+
+
+def start_run() -> RunMetrics:
+    global CURRENT_METRICS
+    CURRENT_METRICS = RunMetrics()
+    return CURRENT_METRICS
+
+
+# Wrap a stream of chunks, counting bytes and the time spent waiting on the next chunk.
+# Each wait is also appended to `waits` if given, so a caller can tell its own download time
+# apart from other downloads running at the same time
+def measure_download(chunks: Iterable[bytes], metrics: RunMetrics, waits: Optional[List[float]] = None) -> Iterator[bytes]:
+    chunk_iter: Iterator[bytes] = iter(chunks)
+    while True:
+        started: float = time.perf_counter()
+        try:
+            chunk: bytes = next(chunk_iter)
+        except StopIteration:
+            record_wait(metrics, time.perf_counter() - started, waits)
+            return
+        record_wait(metrics, time.perf_counter() - started, waits)
+        metrics.increment("feed_bytes_downloaded", len(chunk))
+        yield chunk
+
+
+def record_wait(metrics: RunMetrics, seconds: float, waits: Optional[List[float]]) -> None:
+    metrics.add_stage_time("download", seconds)
+    if waits is not None:
+        waits.append(seconds)
+
+
+# Profile everything run inside the block with cProfile, dumping stats to output_file (if one is given)
+@contextmanager
+def profiled(output_file: Optional[str]) -> Iterator[None]:
+    if not output_file:
+        yield
+        return
+
+    profiler: cProfile.Profile = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(output_file)
+        print(f"Profile written to {output_file}, view with: python3 -m pstats {output_file}")
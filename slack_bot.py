@@ -1,56 +1,266 @@
 from ssl import SSLContext
-from typing import List, Dict
-from datetime import timedelta, date, datetime
-import math
+from typing import List, Dict, Optional, Tuple
+import asyncio
+import time
 
 from slack_sdk import WebClient
 from slack_sdk.web import SlackResponse
 
+from async_slack import AsyncSlackPoster
+from block_packer import pack_block_groups, pack_group_positions
+from covid_row import BRACKET_FIELD_NAMES
+from posted_messages import PostedMessages
+from render_cache import RENDER_CACHE_SIZE, RenderCache, content_key
+from run_metrics import RunMetrics, current_metrics
+from vax_projection import TARGET_REACHED, VAX_TARGETS, Projection, project_vax_targets
+
+# Counts whose change since the previous report is shown
+CHANGE_FIELDS: List[str] = [
+    "CASE_CNT", "SRC_OVERSEAS_CNT", "TEST_CNT", "DEATH_CNT", "VACC_DOSE_CNT",
+    "ACTIVE_CNT", "MED_HOSP_CNT", "MED_VENT_CNT", "MED_ICU_CNT",
+]
+
+# Templates for each part of the code message, looked up once rather than rebuilt on every render
+HEADING_TEMPLATE = "--- *Latest COVID figures for {}* ---\n".format
+CASES_TEMPLATE = ":helmet_with_white_cross: {:,d} New total cases".format
+ACTIVE_TEMPLATE = " | {:,d} active cases ({})".format
+OVERSEAS_TEMPLATE = ":earth_asia: {:,d} New overseas cases\n".format
+HOSPITAL_TEMPLATES = [
+    ("MED_HOSP_CNT", ":hospital: {:,d}{} Hospitalised".format),
+    ("MED_ICU_CNT", " | {:,d}{} in ICU".format),
+    ("MED_VENT_CNT", " | {:,d}{} ventilated".format),
+]
+DEATHS_TEMPLATE = ":skull: +{:,d} Deaths".format
+TOTAL_DEATHS_TEMPLATE = " | {:,d} Total COVID Deaths".format
+TESTS_TEMPLATE = ":test_tube: +{:,d} Tests in the last reporting period".format
+TOTAL_TESTS_TEMPLATE = " | {:,d} total tests".format
+DOSES_TEMPLATE = ":syringe: {:,d} doses (+{:,d})".format
+DOSES_LAGGING_NOTE = "\n        (This will often be lagging as GP numbers come in at odd times)\n"
+REPORT_TEMPLATE = ":robot_face: {} Report, using covidlive.com.au\n        Data published at: {} AEST".format
+
+
+# A change with its sign, eg. +1,041 or -2
+def signed(value: int) -> str:
+    return f"{'+' if value >= 0 else ''}{value:,d}"
+
 
 class CovidSlackBot:
 
-    def __init__(self, slack_token: str, channel_name: str, bot_name: str, emoji: str) -> None:
+    def __init__(
+        self,
+        slack_token: str,
+        channel_name: str,
+        bot_name: str,
+        emoji: str,
+        thread_chunks: bool = False,
+        trend_method: str = "average",
+        posted_messages: Optional[PostedMessages] = None,
+        render_cache_size: int = RENDER_CACHE_SIZE,
+        base_url: str = WebClient.BASE_URL
+    ) -> None:
+        self.slack_token: str = slack_token
         self.channel_name: str = channel_name
+        # A comma separated channel name posts the same summary to each channel
+        self.channel_names: List[str] = channel_name.split(",")
         self.bot_name: str = bot_name
         self.emoji: str = emoji
+        # When a post needs several messages, reply to the first one instead of posting them all to the channel
+        self.thread_chunks: bool = thread_chunks
+        # How the vaccination rate is projected forward, see vax_projection.TREND_METHODS
+        self.trend_method: str = trend_method
+        # When set, what was posted is remembered so corrections edit the original message in place
+        self.posted_messages: Optional[PostedMessages] = posted_messages
+        # Rendered blocks by content hash, so the same data is only formatted once across channels and polls
+        self.render_cache: RenderCache = RenderCache(render_cache_size)
+        # Where the Slack Web API is, eg. a local_servers.FakeSlackServer to run without Slack
+        self.base_url: str = base_url
+        # Made once and reused, so each channel's rate limit and Retry-After carry over between posts and polls
+        self.poster: Optional[AsyncSlackPoster] = None
         self.client: WebClient = WebClient(
             token=slack_token,
+            base_url=base_url,
             ssl=SSLContext()
         )
 
-    def post_messages_to_slack(self, blocks) -> SlackResponse:
+    def post_messages_to_slack(self, blocks, **kwargs) -> SlackResponse:
         print("Posting stats to slack")
-        return self.client.chat_postMessage(
-            channel=self.channel_name,
-            text="COVID stats updated",
-            username=self.bot_name,
-            icon_emoji=self.emoji,
-            blocks=blocks
-        )
+        metrics: RunMetrics = current_metrics()
+        with metrics.stage("slack"):
+            started: float = time.perf_counter()
+            try:
+                return self.client.chat_postMessage(
+                    channel=self.channel_name,
+                    text="COVID stats updated",
+                    username=self.bot_name,
+                    icon_emoji=self.emoji,
+                    blocks=blocks,
+                    **kwargs
+                )
+            finally:
+                metrics.observe("slack_api_call", time.perf_counter() - started)
+
+    # Pack the block groups into as few messages as Slack allows and post them in order,
+    # returning the response for the first message
+    def post_block_groups(self, groups: List[List[Dict]]) -> SlackResponse:
+        chunks: List[List[Dict]] = pack_block_groups(groups)
+        if len(self.channel_names) > 1:
+            return self.post_chunks_to_channels(chunks)[0]
+
+        first: SlackResponse = self.post_messages_to_slack(chunks[0])
+        for chunk in chunks[1:]:
+            if self.thread_chunks:
+                self.post_messages_to_slack(chunk, thread_ts=first["ts"])
+            else:
+                self.post_messages_to_slack(chunk)
+
+        return first
+
+    # Post to every channel concurrently, rate limited per channel
+    def post_chunks_to_channels(self, chunks: List[List[Dict]]) -> List[SlackResponse]:
+        async def post_all() -> List[List[SlackResponse]]:
+            poster: AsyncSlackPoster = self.get_poster()
+            return await poster.post_chunks_to_channels(self.channel_names, chunks, self.thread_chunks)
+
+        with current_metrics().stage("slack"):
+            return [responses[0] for responses in asyncio.run(post_all())]
+
+    # Post new data, and edit messages in place where a code's report was only corrected.
+    # Codes whose data is unchanged since it was posted are skipped without being rendered.
+    # Returns the first response, or None if there was nothing to send
+    def publish(self, display: str, data: Dict) -> Optional[SlackResponse]:
+        versions: Dict[str, List[str]] = {code: [data[code]["REPORT_DATE"], data[code]["LAST_UPDATED_DATE"]] for code in data}
+        plans: Dict[str, Tuple[List[str], Dict[str, Tuple[Dict, List[str]]]]] = {}
+        to_render: List[str] = []
+
+        for channel in self.channel_names:
+            new_codes: List[str] = []
+            corrections: Dict[str, Tuple[Dict, List[str]]] = {}
+            for code in data:
+                found: Optional[Tuple[Dict, Dict]] = self.posted_messages.find(channel, display, code)
+                if found is not None and found[1]["VERSION"] == versions[code]:
+                    continue
+
+                if found is not None and found[1]["VERSION"][0] == versions[code][0]:
+                    corrections.setdefault(found[0]["TS"], (found[0], []))[1].append(code)
+                else:
+                    new_codes.append(code)
+                if code not in to_render:
+                    to_render.append(code)
+            plans[channel] = (new_codes, corrections)
+
+        if not to_render:
+            print(f"Nothing has changed since {display} was last posted")
+            return None
+
+        with current_metrics().stage("render"):
+            rendered: Dict[str, List[Dict]] = self.render_code_groups(display, {code: data[code] for code in to_render})
+        header: List[Dict] = self.build_vax_stats_header() if display == "VAX_DATA" else []
+
+        async def publish_to_channel(poster: AsyncSlackPoster, channel: str) -> Optional[SlackResponse]:
+            new_codes, corrections = plans[channel]
+            first: Optional[SlackResponse] = None
+
+            for ts, (message, codes) in corrections.items():
+                print(f"Correcting {','.join(codes)} in {channel}")
+                for group in message["GROUPS"]:
+                    if group["CODE"] in codes:
+                        group["BLOCKS"] = rendered[group["CODE"]]
+                        group["VERSION"] = versions[group["CODE"]]
+                blocks: List[Dict] = [block for group in message["GROUPS"] for block in group["BLOCKS"]]
+                # Every corrected message is edited, not just the first
+                response: SlackResponse = await poster.update_message(channel, ts, blocks)
+                first = first or response
+
+            if new_codes:
+                groups: List[Dict] = [{"CODE": None, "VERSION": None, "BLOCKS": header}] if header else []
+                groups += [{"CODE": code, "VERSION": versions[code], "BLOCKS": rendered[code]} for code in new_codes]
+                thread_ts: Optional[str] = None
+
+                for positions in pack_group_positions([group["BLOCKS"] for group in groups]):
+                    blocks: List[Dict] = [block for position in positions for block in groups[position]["BLOCKS"]]
+                    if thread_ts is not None:
+                        response = await poster.post_message(channel, blocks, thread_ts=thread_ts)
+                    else:
+                        response = await poster.post_message(channel, blocks)
+                    if self.thread_chunks and thread_ts is None:
+                        thread_ts = response["ts"]
+                    self.posted_messages.record_post(channel, display, response["ts"], [groups[position] for position in positions])
+                    first = first or response
+
+            return first
+
+        async def publish_all() -> List[Optional[SlackResponse]]:
+            poster: AsyncSlackPoster = self.get_poster()
+            return await asyncio.gather(*(publish_to_channel(poster, channel) for channel in self.channel_names))
+
+        print("Posting stats to slack")
+        try:
+            with current_metrics().stage("slack"):
+                responses: List[Optional[SlackResponse]] = asyncio.run(publish_all())
+        finally:
+            # Save even after a failure, so messages that were posted are still edited next time
+            self.posted_messages.save()
+
+        return next((response for response in responses if response is not None), None)
+
+    def get_poster(self) -> AsyncSlackPoster:
+        if self.poster is None:
+            self.poster = self.create_poster()
+        return self.poster
+
+    def create_poster(self) -> AsyncSlackPoster:
+        return AsyncSlackPoster(self.slack_token, self.bot_name, self.emoji, base_url=self.base_url)
+
+    # Render just the blocks for each code, keyed by code
+    def render_code_groups(self, display: str, data: Dict) -> Dict[str, List[Dict]]:
+        if display == "VAX_DATA":
+            return dict(zip(data, self.build_vax_stats_code_groups(data)))
+        return dict(zip(data, self.build_covid_data_groups(data)))
 
     # For the filtered data, generate messages and send them to slack
-    def execute_for_covid_data(self, covid_data: Dict) -> SlackResponse:
+    def execute_for_covid_data(self, covid_data: Dict) -> Optional[SlackResponse]:
+        if self.posted_messages is not None:
+            return self.publish("CODE_DATA", covid_data)
+
+        with current_metrics().stage("render"):
+            groups: List[List[Dict]] = self.build_covid_data_groups(covid_data)
+        # Post these messages to slack
+        return self.post_block_groups(groups)
+
+    # One group of blocks per code
+    def build_covid_data_groups(self, covid_data: Dict) -> List[List[Dict]]:
         # Generate the messages for each state/country code
         messages: List[str] = []
         for code_data in covid_data:
             messages.append(self.generate_message_for_code(covid_data[code_data]))
 
-        blocks = [
-            {
-                "type": "section",
-                "text": {
-                    "type": "mrkdwn",
-                    "text": message
+        return [
+            [
+                {
+                    "type": "section",
+                    "text": {
+                        "type": "mrkdwn",
+                        "text": message
+                    }
                 }
-            } for message in messages
+            ] for message in messages
         ]
 
+    def execute_for_vax_stats(self, vax_data: Dict) -> Optional[SlackResponse]:
+        if self.posted_messages is not None:
+            return self.publish("VAX_DATA", vax_data)
+
+        with current_metrics().stage("render"):
+            groups: List[List[Dict]] = self.build_vax_stats_groups(vax_data)
         # Post these messages to slack
-        return self.post_messages_to_slack(blocks)
+        return self.post_block_groups(groups)
 
-    def execute_for_vax_stats(self, vax_data: Dict) -> SlackResponse:
-        # Generate the messages for each state/country code
-        blocks = [
+    # The header group followed by one group of blocks per code
+    def build_vax_stats_groups(self, vax_data: Dict) -> List[List[Dict]]:
+        return [self.build_vax_stats_header()] + self.build_vax_stats_code_groups(vax_data)
+
+    def build_vax_stats_header(self) -> List[Dict]:
+        return [
             {
                 "type": "header",
                 "text": {
@@ -61,15 +271,39 @@ class CovidSlackBot:
             {
                 "type": "divider"
             }
-        ] 
-        
-        for block in (self.generate_vax_stats_for_code(vax_data[code]) for code in vax_data):
-            blocks.extend(block)
+        ]
 
-        # Post these messages to slack
-        return self.post_messages_to_slack(blocks)
+    def build_vax_stats_code_groups(self, vax_data: Dict) -> List[List[Dict]]:
+        # Project every uncached code's targets in one batch, the per code blocks just format the results
+        keys: Dict[str, str] = {code: self.vax_stats_key(vax_data[code]) for code in vax_data}
+        uncached: Dict = {code: vax_data[code] for code in vax_data if keys[code] not in self.render_cache}
+        if uncached:
+            projections: Dict = project_vax_targets(uncached, method=self.trend_method)
+            for code in uncached:
+                uncached[code]["VAX_PROJECTIONS"] = projections[code]
+
+        # Generate the messages for each state/country code
+        return [self.generate_vax_stats_for_code(vax_data[code], keys[code]) for code in vax_data]
+
+    # Projections follow from the trailing counts and trend method, so they don't need hashing themselves
+    def vax_stats_key(self, vax_data: Dict) -> str:
+        return content_key("VAX_DATA", vax_data, ["TRAILING_COUNTS"], [self.trend_method])
+
+    # Rendered once per distinct data state, see render_cache
+    def generate_vax_stats_for_code(self, vax_data: Dict, key: Optional[str] = None) -> List:
+        return self.render_cache.get_or_render(
+            key or self.vax_stats_key(vax_data),
+            lambda: self.render_vax_stats_for_code(vax_data)
+        )
+
+    def render_vax_stats_for_code(self, vax_data: Dict) -> List:
+        if "VAX_PROJECTIONS" not in vax_data:
+            vax_data = vax_data.copy()
+            vax_data["VAX_PROJECTIONS"] = project_vax_targets(
+                {vax_data["CODE"]: vax_data},
+                method=self.trend_method
+            )[vax_data["CODE"]]
 
-    def generate_vax_stats_for_code(self, vax_data: Dict) -> List:
         # generate vax stats for each state/country code
         return [
             {
@@ -84,7 +318,7 @@ class CovidSlackBot:
                 "elements": [
                     {
                         "type": "mrkdwn",
-                        "text": f"*{int(vax_data['VACC_DOSE_CNT']):,d}* total doses administered. Data published at {vax_data['LAST_UPDATED_DATE']} AEST"
+                        "text": f"*{vax_data['VACC_DOSE_CNT']:,d}* total doses administered. Data published at {vax_data['LAST_UPDATED_DATE']} AEST"
                     }
                 ]
             },
@@ -98,19 +332,13 @@ class CovidSlackBot:
                         "type": "mrkdwn",
                         "text": 
                         f"\n  :syringe: *1st dose* ({vax_data['POPULATION_BRACKET']})"
-                        f"\n    {self.format_vax_stat(0.6, vax_data, 'VACC_FIRST_DOSE_CNT')}"
-                        f"\n    {self.format_vax_stat(0.7, vax_data, 'VACC_FIRST_DOSE_CNT')}"
-                        f"\n    {self.format_vax_stat(0.8, vax_data, 'VACC_FIRST_DOSE_CNT')}"
-                        f"\n    {self.format_vax_stat(0.9, vax_data, 'VACC_FIRST_DOSE_CNT')}"
+                        + "".join(f"\n    {self.format_vax_stat(target, vax_data, 'VACC_FIRST_DOSE_CNT')}" for target in VAX_TARGETS)
                     },
                     {
                         "type": "mrkdwn",
                         "text": 
                         f"\n  :syringe::syringe: *2nd dose* ({vax_data['POPULATION_BRACKET']})"
-                        f"\n    {self.format_vax_stat(0.6, vax_data, 'VACC_PEOPLE_CNT')}"
-                        f"\n    {self.format_vax_stat(0.7, vax_data, 'VACC_PEOPLE_CNT')}"
-                        f"\n    {self.format_vax_stat(0.8, vax_data, 'VACC_PEOPLE_CNT')}"
-                        f"\n    {self.format_vax_stat(0.9, vax_data, 'VACC_PEOPLE_CNT')}"
+                        + "".join(f"\n    {self.format_vax_stat(target, vax_data, 'VACC_PEOPLE_CNT')}" for target in VAX_TARGETS)
                     }
                 ]
             },
@@ -120,158 +348,90 @@ class CovidSlackBot:
         ]
 
     def format_vax_stat(self, target_percentage: float, vax_data: Dict, vax_field: str) -> str:
-        vax_percentage: float = self.vax_to_percentage(vax_data, vax_field)
+        projection: Projection = vax_data["VAX_PROJECTIONS"][vax_field][target_percentage]
         vax_status: str = ":white_check_mark:"
 
-        if vax_percentage < target_percentage:
-            rolling_avg = (vax_percentage - self.vax_to_percentage(vax_data, "PREV_" + vax_field)) / vax_data["RECORD_COUNT"] 
+        if projection is None:
+            vax_status = ":no_entry:"
+        elif projection != TARGET_REACHED:
+            vax_status = projection.strftime("%b %d")
 
-            days_to_target = math.ceil((target_percentage - vax_percentage) / rolling_avg)
-            
-            if days_to_target > 365:
-                vax_status = ":no_entry:"
-            else:
-                dt = datetime.strptime(vax_data["LAST_UPDATED_DATE"], "%Y-%m-%d %H:%M:%S") + timedelta(days=days_to_target)
-                vax_status = dt.strftime("%b %d")
-        
         #example format: *60%* Oct 10
         return f"*{target_percentage:.0%}:* {vax_status}"
 
+    # Rendered once per distinct data state, see render_cache
     def generate_message_for_code(self, code_data: Dict) -> str:
-        # prepare the new data from the previous and current values provided in the payload
-
-        # Total new cases
-        new_cases: int = None
-        if code_data['CASE_CNT'] is not None:
-            new_cases = int(code_data['CASE_CNT']) - int(code_data['PREV_CASE_CNT'])
-
-        # New cases sourced overseas 
-        new_oseas_cases: int = None
-        if code_data['SRC_OVERSEAS_CNT'] is not None:
-            new_oseas_cases = int(code_data['SRC_OVERSEAS_CNT']) - int(code_data['PREV_SRC_OVERSEAS_CNT'])
-
-        # New tests in reporting period
-        new_tests: int = None
-        if code_data['TEST_CNT'] is not None:
-            new_tests = int(code_data['TEST_CNT']) - int(code_data['PREV_TEST_CNT'])
-
-        # New tests in reporting period
-        new_deaths: int = None
-        if code_data['DEATH_CNT'] is not None:
-            new_deaths = int(code_data['DEATH_CNT']) - int(code_data['PREV_DEATH_CNT'])
-
-        # New vaccinations in reporting period
-        new_vax: int = None
-        if code_data['VACC_DOSE_CNT'] is not None:
-            new_vax = int(code_data['VACC_DOSE_CNT']) - int(code_data['PREV_VACC_DOSE_CNT'])
-
-        # Change in the number of active cases
-        active_case_change: int = None
-        if code_data['ACTIVE_CNT'] is not None:
-            active_case_change = int(code_data['ACTIVE_CNT']) - int(code_data['PREV_ACTIVE_CNT'])
-
-        # Change in the number of people in hospital
-        hosp_change: int = None
-        if code_data['MED_HOSP_CNT'] is not None:
-            hosp_change = int(code_data['MED_HOSP_CNT']) - int(code_data['PREV_MED_HOSP_CNT'])
-
-        # Change in the number of people on ventilators
-        vent_change: int = None
-        if code_data['MED_VENT_CNT'] is not None:
-            vent_change = int(code_data['MED_VENT_CNT']) - int(code_data['PREV_MED_VENT_CNT'])
+        return self.render_cache.get_or_render(
+            content_key("CODE_DATA", code_data),
+            lambda: self.render_message_for_code(code_data)
+        )
 
-        # Change in the number of people in the ICU
-        icu_change: int = None
-        if code_data['MED_ICU_CNT'] is not None:
-            icu_change = int(code_data['MED_ICU_CNT']) - int(code_data['PREV_MED_ICU_CNT'])
+    def render_message_for_code(self, code_data: Dict) -> str:
+        # prepare the new data from the previous and current values provided in the payload
+        changes: Dict[str, int] = {}
+        for field in CHANGE_FIELDS:
+            if code_data[field] is not None:
+                changes[field] = code_data[field] - code_data['PREV_' + field]
 
-        # Generate a string message in slack markdown, hiding sections depending on available data
-        message = f"--- *Latest COVID figures for {code_data['CODE']}* ---\n"
+        # Generate the message in slack markdown, hiding sections depending on available data
+        parts: List[str] = [HEADING_TEMPLATE(code_data['CODE'])]
 
-        # Depending on available data attempt to generate cases string in the format below 
+        # Depending on available data attempt to generate cases string in the format below
         # 1,279 New total cases | 20,148 active cases (+1,108)
-        if new_cases is not None:
-            message += f":helmet_with_white_cross: {format(new_cases, ',d')} New total cases"
-
-            if active_case_change is not None and active_case_change != 0:
-                message += f" | {format(int(code_data['ACTIVE_CNT']), ',d')} active cases ({'+' if int(active_case_change) >= 0 else ''}{format(active_case_change, ',d')})"
+        if 'CASE_CNT' in changes:
+            parts.append(CASES_TEMPLATE(changes['CASE_CNT']))
+            if changes.get('ACTIVE_CNT'):
+                parts.append(ACTIVE_TEMPLATE(code_data['ACTIVE_CNT'], signed(changes['ACTIVE_CNT'])))
+            parts.append("\n")
 
-            message += "\n"
-
-        # Depending on available data attempt to generate oversaes cases string in the format below 
+        # Depending on available data attempt to generate oversaes cases string in the format below
         # 0 New overseas cases
-        if new_oseas_cases is not None:
-            message += f":earth_asia: {format(new_oseas_cases, ',d')} New overseas cases\n"
+        if 'SRC_OVERSEAS_CNT' in changes:
+            parts.append(OVERSEAS_TEMPLATE(changes['SRC_OVERSEAS_CNT']))
 
-        # Depending on available data attempt to generate oversaes cases string in the format below 
+        # Depending on available data attempt to generate oversaes cases string in the format below
         # 957 (+49) Hospitalised | 160 (+10) in ICU | 64 (-2) ventilated
         if code_data['MED_HOSP_CNT'] is not None:
-            message += f":hospital: {format(int(code_data['MED_HOSP_CNT']), ',d')}"
-
-            if hosp_change is not None:
-                message += f" ({'+' if int(hosp_change) >= 0 else ''}{format(hosp_change, ',d')})"
-
-            message += " Hospitalised"
+            for field, template in HOSPITAL_TEMPLATES:
+                if field == 'MED_HOSP_CNT' or code_data[field] is not None:
+                    change: str = f" ({signed(changes[field])})" if field in changes else ""
+                    parts.append(template(code_data[field], change))
+            parts.append("\n")
 
-            if code_data['MED_ICU_CNT'] is not None:
-                message += f" | {format(int(code_data['MED_ICU_CNT']), ',d')}"
-
-                if icu_change is not None:
-                    message += f" ({'+' if int(icu_change) >= 0 else ''}{format(icu_change, ',d')})"
-
-                message += " in ICU"
-
-            if code_data['MED_VENT_CNT'] is not None:
-                message += f" | {format(int(code_data['MED_VENT_CNT']), ',d')}"
-
-                if vent_change is not None:
-                    message += f" ({'+' if int(vent_change) >= 0 else ''}{format(vent_change, ',d')})"
-
-                message += " ventilated"
-
-            message += "\n"
-
-        # Depending on available data attempt to generate deaths string in the format below 
+        # Depending on available data attempt to generate deaths string in the format below
         # +0 Deaths | 822 Total COVID Deaths
-        if new_deaths is not None:
-            message += f":skull: +{format(new_deaths, ',d')} Deaths"
+        if 'DEATH_CNT' in changes:
+            parts.append(DEATHS_TEMPLATE(changes['DEATH_CNT']))
+            if code_data['DEATH_CNT']:
+                parts.append(TOTAL_DEATHS_TEMPLATE(code_data['DEATH_CNT']))
+            parts.append("\n")
 
-            if code_data['DEATH_CNT'] is not None and code_data['DEATH_CNT'] != 0:
-                message += f" | {format(int(code_data['DEATH_CNT']), ',d')} Total COVID Deaths"
-
-            message += "\n"
-
-        # Depending on available data attempt to generate tests string in the format below 
+        # Depending on available data attempt to generate tests string in the format below
         # +48,372 Tests in the last reporting period | 9,647,579 total tests
-        if new_tests is not None:
-            message += f":test_tube: +{format(new_tests, ',d')} Tests in the last reporting period"
-
-            if code_data['TEST_CNT'] is not None and code_data['TEST_CNT'] != 0:
-                message += f" | {format(int(code_data['TEST_CNT']), ',d')} total tests"
-
-            message += "\n"
+        if 'TEST_CNT' in changes:
+            parts.append(TESTS_TEMPLATE(changes['TEST_CNT']))
+            if code_data['TEST_CNT']:
+                parts.append(TOTAL_TESTS_TEMPLATE(code_data['TEST_CNT']))
+            parts.append("\n")
 
-        # Depending on available data attempt to generate vaccinations string in the format: 
+        # Depending on available data attempt to generate vaccinations string in the format:
         # 12,046 New doses | 466,621 total | 78.2% (+0.2) 1st dose | 42.2% (+0.01) 2nd dose
         # (This will often be incorrect as GP numbers come in at odd times)
-        if new_vax is not None:
-            message += f":syringe: {int(code_data['VACC_DOSE_CNT']):,d} doses (+{new_vax:,d})"
-
-            if code_data["VACC_FIRST_DOSE_CNT"] is not None and code_data["VACC_FIRST_DOSE_CNT"] != 0:
-                message += self.format_vax(code_data, "VACC_FIRST_DOSE_CNT", "1st")
-
-            if code_data["VACC_PEOPLE_CNT"] is not None and code_data["VACC_PEOPLE_CNT"] != 0:
-                message += self.format_vax(code_data, "VACC_PEOPLE_CNT", "2nd")
-
-            message += "\n        (This will often be lagging as GP numbers come in at odd times)\n"
+        if 'VACC_DOSE_CNT' in changes:
+            parts.append(DOSES_TEMPLATE(code_data['VACC_DOSE_CNT'], changes['VACC_DOSE_CNT']))
+            if code_data["VACC_FIRST_DOSE_CNT"]:
+                parts.append(self.format_vax(code_data, "VACC_FIRST_DOSE_CNT", "1st"))
+            if code_data["VACC_PEOPLE_CNT"]:
+                parts.append(self.format_vax(code_data, "VACC_PEOPLE_CNT", "2nd"))
+            parts.append(DOSES_LAGGING_NOTE)
 
         # Depending on available data attempt to date stamp the data in the below format
-        # 2021-09-01 Report date, using covidlive.com.au 
+        # 2021-09-01 Report date, using covidlive.com.au
         # data published at: 2021-09-01 11:52:25 AEST
         if code_data["REPORT_DATE"] is not None and code_data["LAST_UPDATED_DATE"]:
-            message += f":robot_face: {code_data['REPORT_DATE']} Report, using covidlive.com.au\n        Data published at: {code_data['LAST_UPDATED_DATE']} AEST"
+            parts.append(REPORT_TEMPLATE(code_data['REPORT_DATE'], code_data['LAST_UPDATED_DATE']))
 
-        return message
+        return "".join(parts)
 
     def format_vax(self, code_data: Dict, vax_field: str, ordinal: str) -> str:
         current_dose = self.vax_to_percentage(code_data, vax_field)
@@ -280,6 +440,6 @@ class CovidSlackBot:
         return f" | {current_dose:.1%} (+{dose_delta*100:.2}) {code_data['POPULATION_BRACKET']} {ordinal} dose"
 
     def vax_to_percentage(self, code_data: Dict, vax_field: str) -> float:
-        vax_field += "_" + code_data['POPULATION_BRACKET'];
-        return int(code_data[vax_field])/int(code_data['POPULATION']);
+        vax_field = BRACKET_FIELD_NAMES[(vax_field, code_data['POPULATION_BRACKET'])]
+        return int(code_data[vax_field])/code_data['POPULATION']
 
@@ -0,0 +1,177 @@
+import hashlib
+import json
+import mmap
+import os
+import time
+import zlib
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from covid_row import COUNT_FIELDS, CovidRow
+
+# Only these attributes are archived, the rest are derived after selection
+ARCHIVED_ATTRIBUTES: List[str] = ["REPORT_DATE", "LAST_UPDATED_DATE"]
+
+
+# A row's content, used to tell whether a report has changed since it was last archived
+def row_fingerprint(row: CovidRow) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{row['REPORT_DATE']}|{row['LAST_UPDATED_DATE']}".encode("utf-8"))
+    digest.update(row.counts.tobytes())
+    return digest.hexdigest()
+
+
+# One code's rows as a compressed columnar segment: a JSON header with the string columns,
+# then every count column one after the other as packed int64s
+def encode_segment(rows: List[CovidRow]) -> bytes:
+    header: Dict = {"ROWS": len(rows), "FIELDS": COUNT_FIELDS}
+    for field in ARCHIVED_ATTRIBUTES:
+        header[field] = [row[field] for row in rows]
+
+    columns: array = array("q")
+    for position in range(len(COUNT_FIELDS)):
+        columns.extend(row.counts[position] for row in rows)
+
+    return zlib.compress(json.dumps(header).encode("utf-8") + b"\n" + columns.tobytes())
+
+
+def decode_segment(code: str, segment: bytes) -> List[CovidRow]:
+    raw: bytes = zlib.decompress(segment)
+    header_end: int = raw.index(b"\n")
+    header: Dict = json.loads(raw[:header_end])
+    columns: array = array("q")
+    columns.frombytes(raw[header_end + 1:])
+
+    row_count: int = header["ROWS"]
+    rows: List[CovidRow] = []
+    for row_position in range(row_count):
+        row: CovidRow = CovidRow()
+        row["CODE"] = code
+        for field in ARCHIVED_ATTRIBUTES:
+            row[field] = header[field][row_position]
+        rows.append(row)
+
+    # Map archived columns by name, so rows archived before a field was added still decode
+    for column_position, field in enumerate(header["FIELDS"]):
+        if field not in COUNT_FIELDS:
+            continue
+        position: int = COUNT_FIELDS.index(field)
+        offset: int = column_position * row_count
+        for row_position, row in enumerate(rows):
+            row.counts[position] = columns[offset + row_position]
+
+    return rows
+
+
+class SnapshotArchive:
+
+    # segments.bin is an append-only file of compressed segments, snapshots.jsonl records where each
+    # snapshot's per code segments are. Each snapshot only holds the reports that are new or changed,
+    # and fingerprints.jsonl gets a line of their fingerprints, so nothing archived is ever rewritten
+    def __init__(self, archive_dir: str) -> None:
+        self.archive_dir: str = archive_dir
+        self.segments_file: str = os.path.join(archive_dir, "segments.bin")
+        self.snapshots_file: str = os.path.join(archive_dir, "snapshots.jsonl")
+        self.fingerprints_file: str = os.path.join(archive_dir, "fingerprints.jsonl")
+
+    def snapshots(self) -> List[Dict]:
+        if not os.path.exists(self.snapshots_file):
+            return []
+
+        with open(self.snapshots_file) as snapshotsFile:
+            return [json.loads(line) for line in snapshotsFile if line.strip()]
+
+    # code -> REPORT_DATE -> fingerprint of the report as last archived, later lines replace earlier ones
+    def load_fingerprints(self) -> Dict[str, Dict[str, str]]:
+        fingerprints: Dict[str, Dict[str, str]] = {}
+        if not os.path.exists(self.fingerprints_file):
+            return fingerprints
+
+        with open(self.fingerprints_file) as fingerprintsFile:
+            for line in fingerprintsFile:
+                if line.strip():
+                    for code, code_fingerprints in json.loads(line).items():
+                        fingerprints.setdefault(code, {}).update(code_fingerprints)
+        return fingerprints
+
+    # Archive a fetched snapshot as a delta against everything archived before it.
+    # Returns the number of rows written
+    def append(self, rows: Iterable[CovidRow], fetched_at: Optional[float] = None) -> int:
+        os.makedirs(self.archive_dir, exist_ok=True)
+        fingerprints: Dict[str, Dict[str, str]] = self.load_fingerprints()
+
+        # A report republished within the snapshot is archived once, as its latest update
+        reports: Dict[Tuple[str, str], CovidRow] = {}
+        for row in rows:
+            key: Tuple[str, str] = (row["CODE"], row["REPORT_DATE"])
+            if key not in reports or (row["LAST_UPDATED_DATE"] or "") >= (reports[key]["LAST_UPDATED_DATE"] or ""):
+                reports[key] = row
+
+        changed: Dict[str, List[CovidRow]] = {}
+        changed_fingerprints: Dict[str, Dict[str, str]] = {}
+        for row in reports.values():
+            fingerprint: str = row_fingerprint(row)
+            if fingerprints.get(row["CODE"], {}).get(row["REPORT_DATE"]) == fingerprint:
+                continue
+            changed_fingerprints.setdefault(row["CODE"], {})[row["REPORT_DATE"]] = fingerprint
+            changed.setdefault(row["CODE"], []).append(row)
+
+        snapshot: Dict = {"FETCHED_AT": fetched_at if fetched_at is not None else time.time(), "CODES": {}}
+        with open(self.segments_file, "ab") as segmentsFile:
+            for code, code_rows in changed.items():
+                segment: bytes = encode_segment(code_rows)
+                snapshot["CODES"][code] = [segmentsFile.tell(), len(segment)]
+                segmentsFile.write(segment)
+
+        with open(self.snapshots_file, "a") as snapshotsFile:
+            snapshotsFile.write(json.dumps(snapshot) + "\n")
+
+        # Written last, so a run that stops partway archives the same rows again rather than losing them
+        if changed_fingerprints:
+            with open(self.fingerprints_file, "a") as fingerprintsFile:
+                fingerprintsFile.write(json.dumps(changed_fingerprints) + "\n")
+
+        return sum(len(code_rows) for code_rows in changed.values())
+
+    # What we knew about the code at time `as_of` (or now), newest report first
+    def rows_as_of(self, code: str, as_of: Optional[float] = None) -> List[CovidRow]:
+        return self.latest_rows([code], as_of)
+
+    # The code's last `days` reports as currently known
+    def history(self, code: str, days: int) -> List[CovidRow]:
+        return self.rows_as_of(code)[:days]
+
+    def codes(self) -> List[str]:
+        return list(self.load_fingerprints())
+
+    # Every archived row for the codes (or all codes), as they were known at `as_of`, each code newest report first.
+    # The snapshot index is read once however many codes are asked for, and only their segments are read,
+    # through a memory map of the segments file
+    def latest_rows(self, codes: Optional[List[str]] = None, as_of: Optional[float] = None) -> List[CovidRow]:
+        snapshots: List[Dict] = [
+            snapshot for snapshot in self.snapshots() if as_of is None or snapshot["FETCHED_AT"] <= as_of
+        ]
+        if codes is None:
+            codes = list(dict.fromkeys(code for snapshot in snapshots for code in snapshot["CODES"]))
+
+        locations: Dict[str, List[Tuple[int, int]]] = {code: [] for code in codes}
+        for snapshot in snapshots:
+            for code, location in snapshot["CODES"].items():
+                if code in locations:
+                    locations[code].append(tuple(location))
+        if not any(locations.values()):
+            return []
+
+        rows: List[CovidRow] = []
+        with open(self.segments_file, "rb") as segmentsFile:
+            with mmap.mmap(segmentsFile.fileno(), 0, access=mmap.ACCESS_READ) as segments:
+                for code, code_locations in locations.items():
+                    reports: Dict[str, CovidRow] = {}
+                    for offset, length in code_locations:
+                        # Later snapshots replace earlier versions of the same report
+                        for row in decode_segment(code, segments[offset:offset + length]):
+                            reports[row["REPORT_DATE"]] = row
+                    rows.extend(sorted(
+                        reports.values(), key=lambda row: (row["REPORT_DATE"], row["LAST_UPDATED_DATE"] or ""), reverse=True
+                    ))
+        return rows
@@ -0,0 +1,111 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional, Tuple
+
+# Slow imports that a run posting nothing shouldn't need, other than requests to fetch the feed
+HEAVY_MODULES: List[str] = ["requests", "slack_sdk", "aiohttp", "numpy", "matplotlib"]
+
+
+# Run python code in a fresh interpreter from this directory, as a container start would.
+# Returns the wall time and what it wrote to stderr
+def run_python(code: str, importtime: bool = False) -> Tuple[float, str]:
+    started: float = time.perf_counter()
+    result: subprocess.CompletedProcess = subprocess.run(
+        [sys.executable] + (["-X", "importtime"] if importtime else []) + ["-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.abspath(__file__))
+    )
+    return time.perf_counter() - started, result.stderr
+
+
+# Parse `python -X importtime` output into (module, depth, self seconds, cumulative seconds), in the
+# order imports finished. Lines look like "import time:       176 |      27926 |     certifi.core"
+def parse_importtime(output: str) -> List[Tuple[str, int, float, float]]:
+    imports: List[Tuple[str, int, float, float]] = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth: int = (len(name) - len(name.lstrip()) - 1) // 2
+        imports.append((name.strip(), depth, int(self_us) / 1e6, int(cumulative_us) / 1e6))
+    return imports
+
+
+# How long a fresh interpreter takes to start and import the module, the module's heaviest direct
+# imports and which of the HEAVY_MODULES it pulled in. Timings are medians over the repeats
+def profile_startup(module: str = "post_covid_stats", repeats: int = 5, top: int = 10) -> Dict:
+    interpreter: float = statistics.median(run_python("pass")[0] for _ in range(repeats))
+    startup: float = statistics.median(run_python(f"import {module}")[0] for _ in range(repeats))
+    imports: List[Tuple[str, int, float, float]] = parse_importtime(run_python(f"import {module}", importtime=True)[1])
+
+    position: int = max(position for position, (name, depth, _, _) in enumerate(imports) if name == module and depth == 0)
+    # The module's own imports come just before it, back to the previous top level import
+    direct: List[Tuple[str, float]] = []
+    for name, depth, _, cumulative in reversed(imports[:position]):
+        if depth == 0:
+            break
+        if depth == 1:
+            direct.append((name, cumulative))
+    direct.sort(key=lambda entry: entry[1], reverse=True)
+
+    loaded: List[str] = [name for name, _, _, _ in imports]
+    return {
+        "module": module,
+        "repeats": repeats,
+        "interpreter_s": interpreter,
+        "startup_s": startup,
+        "import_s": imports[position][3],
+        "heaviest_imports": dict(direct[:top]),
+        "heavy_modules_loaded": [
+            heavy for heavy in HEAVY_MODULES if any(name == heavy or name.startswith(heavy + ".") for name in loaded)
+        ],
+    }
+
+
+# What got slower or heavier than the baseline report
+def find_regressions(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    regressions: List[str] = []
+    if report["import_s"] > baseline["import_s"] * (1 + tolerance):
+        regressions.append(f"import {report['module']}: {baseline['import_s']:.4f}s -> {report['import_s']:.4f}s")
+    for heavy in report["heavy_modules_loaded"]:
+        if heavy not in baseline["heavy_modules_loaded"]:
+            regressions.append(f"{heavy} is now imported on startup")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Report how long the bot takes to start, and what it imports to do so")
+    parser.add_argument("--module", default="post_covid_stats", help="entrypoint module to import")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10, help="number of the heaviest imports to list")
+    parser.add_argument("--output", help="write the JSON report here instead of stdout")
+    parser.add_argument("--baseline", help="JSON report to compare against, exits 1 on a regression")
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown against the baseline")
+    args = parser.parse_args(argv)
+
+    report: Dict = profile_startup(args.module, args.repeats, args.top)
+    if args.output:
+        with open(args.output, "w") as outputFile:
+            json.dump(report, outputFile, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+    if args.baseline:
+        with open(args.baseline) as baselineFile:
+            regressions: List[str] = find_regressions(report, json.load(baselineFile), args.tolerance)
+        if regressions:
+            print("Startup regressions against baseline:\n  " + "\n  ".join(regressions), file=sys.stderr)
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import json
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+DEFAULT_CODES: List[str] = ["AUS", "ACT", "NSW", "NT", "QLD", "SA", "TAS", "VIC", "WA"]
+
+# Every count in a covid-live.json row, each published with a PREV_ value from the previous report
+FEED_COUNTS: List[str] = [
+    "CASE_CNT", "TEST_CNT", "DEATH_CNT", "RECOV_CNT", "MED_ICU_CNT", "MED_VENT_CNT", "MED_HOSP_CNT",
+    "SRC_OVERSEAS_CNT", "SRC_INTERSTATE_CNT", "SRC_CONTACT_CNT", "SRC_UNKNOWN_CNT", "SRC_INVES_CNT",
+    "PROB_CASE_CNT", "ACTIVE_CNT", "NEW_CASE_CNT", "VACC_DIST_CNT", "VACC_DOSE_CNT", "VACC_FIRST_DOSE_CNT",
+    "VACC_PEOPLE_CNT", "VACC_AGED_CARE_CNT", "VACC_GP_CNT", "VACC_FIRST_DOSE_CNT_12_15", "VACC_PEOPLE_CNT_12_15",
+]
+VAX_COUNTS: List[str] = ["VACC_DOSE_CNT", "VACC_FIRST_DOSE_CNT", "VACC_PEOPLE_CNT"]
+# Fields that are never nulled out, the bot relies on them being present
+REQUIRED_COUNTS: List[str] = VAX_COUNTS + ["VACC_FIRST_DOSE_CNT_12_15", "VACC_PEOPLE_CNT_12_15"]
+
+
+# Generate a feed shaped like covidlive's: one row per code per day, cumulative counts that grow
+# day by day, newest first unless shuffled. null_density is the chance of any optional count being
+# null, and the newest day's vaccination counts are left null for a share of codes, the way
+# covidlive publishes cases before the vaccination numbers come in.
+def generate_feed(
+    codes: List[str] = DEFAULT_CODES,
+    days: int = 365,
+    null_density: float = 0.05,
+    shuffle: bool = False,
+    seed: Optional[int] = 0,
+    end_date: date = date(2021, 9, 1)
+) -> List[Dict]:
+    rng: random.Random = random.Random(seed)
+    rows: List[Dict] = []
+
+    for code in codes:
+        # Daily increments per count for this code, with some day to day noise
+        increments: Dict[str, int] = {field: rng.randint(1, 50000) for field in FEED_COUNTS}
+        increments["VACC_FIRST_DOSE_CNT_12_15"] = increments["VACC_FIRST_DOSE_CNT"] // 20
+        increments["VACC_PEOPLE_CNT_12_15"] = increments["VACC_PEOPLE_CNT"] // 20
+        totals: Dict[str, int] = {field: 0 for field in FEED_COUNTS}
+        history: List[Dict[str, int]] = []
+
+        for _ in range(days + 1):
+            for field in FEED_COUNTS:
+                totals[field] += max(0, int(increments[field] * rng.uniform(0.5, 1.5)))
+            history.append(dict(totals))
+
+        vax_lagging: bool = rng.random() < 0.3
+        for day in range(days):
+            report_date: date = end_date - timedelta(days=day)
+            current: Dict[str, int] = history[days - day]
+            previous: Dict[str, int] = history[days - day - 1]
+            row: Dict = {
+                "REPORT_DATE": report_date.isoformat(),
+                "LAST_UPDATED_DATE": f"{report_date.isoformat()} {rng.randint(9, 18):02d}:{rng.randint(0, 59):02d}:00",
+                "CODE": code,
+                "NAME": code,
+            }
+            for field in FEED_COUNTS:
+                nulled: bool = field not in REQUIRED_COUNTS and rng.random() < null_density
+                row[field] = None if nulled else str(current[field])
+                row["PREV_" + field] = None if nulled else str(previous[field])
+
+            if day == 0 and vax_lagging:
+                for field in VAX_COUNTS:
+                    row[field] = None
+                    row["PREV_" + field] = None
+
+            rows.append(row)
+
+    if shuffle:
+        rng.shuffle(rows)
+    else:
+        rows.sort(key=lambda row: row["REPORT_DATE"], reverse=True)
+
+    return rows
+
+
+def generate_feed_json(**kwargs) -> bytes:
+    return json.dumps(generate_feed(**kwargs)).encode("utf-8")
@@ -0,0 +1,61 @@
+import asyncio
+import time
+from typing import Dict, List
+
+from slack_sdk.errors import SlackApiError
+
+from async_slack import AsyncSlackPoster
+
+
+class FakeResponse:
+
+    def __init__(self, status_code: int, headers: Dict) -> None:
+        self.status_code: int = status_code
+        self.headers: Dict = headers
+        self.data: Dict = {"ok": status_code == 200}
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+
+class FakeAsyncClient:
+
+    def __init__(self, rate_limited_channels: List[str]) -> None:
+        self.rate_limited_channels: List[str] = list(rate_limited_channels)
+        self.posted: List[str] = []
+
+    async def chat_postMessage(self, channel: str, **kwargs):
+        if channel in self.rate_limited_channels:
+            self.rate_limited_channels.remove(channel)
+            response = FakeResponse(429, {"Retry-After": "0.2"})
+            raise SlackApiError("ratelimited", response)
+
+        self.posted.append(channel)
+        return FakeResponse(200, {})
+
+
+def test_post_to_channels_retries_after_rate_limit():
+    client: FakeAsyncClient = FakeAsyncClient(["#b"])
+    poster: AsyncSlackPoster = AsyncSlackPoster("token", "bot", ":robot_face:", client=client)
+
+    started: float = time.monotonic()
+    responses = asyncio.run(poster.post_to_channels(["#a", "#b", "#c"], []))
+    elapsed: float = time.monotonic() - started
+
+    assert [response.status_code for response in responses] == [200, 200, 200], "Message: every channel should be posted"
+    assert client.posted[-1] == "#b", "Message: the rate limited channel should be posted last"
+    assert 0.2 <= elapsed < 1, "Message: only the rate limited channel should wait for Retry-After"
+
+
+def test_rate_limits_carry_over_between_runs():
+    client: FakeAsyncClient = FakeAsyncClient([])
+    poster: AsyncSlackPoster = AsyncSlackPoster("token", "bot", ":robot_face:", rate=10, burst=1, client=client)
+    asyncio.run(poster.post_to_channels(["#a", "#a", "#a"], []))
+
+    # A new event loop, as each post or poll runs in, waits on the same buckets
+    started: float = time.monotonic()
+    asyncio.run(poster.post_to_channels(["#a", "#a", "#a"], []))
+    elapsed: float = time.monotonic() - started
+
+    assert client.posted == ["#a"] * 6
+    assert elapsed >= 0.25, "Message: the channel's bucket should still be empty from the last run"
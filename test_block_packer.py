@@ -0,0 +1,25 @@
+from typing import Dict, List
+
+from block_packer import pack_block_groups
+
+
+def blocks(count: int, code: str) -> List[Dict]:
+    return [{"type": "divider", "code": code} for _ in range(count)]
+
+
+def test_pack_block_groups_keeps_groups_together():
+    # header group plus 12 codes of 5 blocks each, 62 blocks in total
+    groups: List[List[Dict]] = [blocks(2, "header")] + [blocks(5, f"code{i}") for i in range(12)]
+    messages: List[List[Dict]] = pack_block_groups(groups)
+
+    assert [len(message) for message in messages] == [47, 15], "Message: should pack into the fewest messages"
+    assert [block for message in messages for block in message] == [block for group in groups for block in group], \
+        "Message: blocks should stay in order"
+    assert messages[1][0]["code"] == "code9" and messages[0][-1]["code"] == "code8", \
+        "Message: a code's blocks should not be split across messages"
+
+
+def test_pack_block_groups_splits_oversized_group():
+    messages: List[List[Dict]] = pack_block_groups([blocks(3, "a"), blocks(120, "b"), blocks(3, "c")])
+
+    assert [len(message) for message in messages] == [50, 50, 26], "Message: oversized groups should fill messages"
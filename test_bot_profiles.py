@@ -0,0 +1,82 @@
+import json
+from typing import Dict, List
+
+import bot_profiles
+from bot_profiles import BotProfile, fetch_and_post_profiles, load_profiles, post_profiles, profile_codes
+from code_index import CodeIndex
+from covid_row import CovidRow
+from local_servers import FeedServer
+from run_metrics import RunMetrics, start_run
+from synthetic_feed import generate_feed_json
+from test_post_covid_stats import FakeSlackResponse, load_state_data, make_row
+
+
+class FakeSlackBot:
+
+    def __init__(self) -> None:
+        self.posted: List[Dict] = []
+
+    def execute_for_covid_data(self, covid_data: Dict):
+        self.posted.append({code: covid_data[code]["POPULATION_BRACKET"] for code in covid_data})
+        return FakeSlackResponse()
+
+
+def test_profiles_share_one_selection_per_code(tmp_path, monkeypatch):
+    monkeypatch.setenv("VIC_TEAM_TOKEN", "xoxb-vic")
+    profiles_file = tmp_path / "profiles.json"
+    profiles_file.write_text(json.dumps({"PROFILES": [
+        {"NAME": "vic", "SELECTED_CODES": "VIC", "SLACK_BOT_DISPLAY": "CODE_DATA", "SLACK_BOT_TOKEN_ENV": "VIC_TEAM_TOKEN"},
+        {"NAME": "east", "SELECTED_CODES": ["VIC", "NSW"], "SLACK_BOT_DISPLAY": "CODE_DATA"},
+        {"NAME": "youth", "SELECTED_CODES": "NSW", "SLACK_BOT_DISPLAY": "CODE_DATA", "POPULATION_BRACKET": "12+"},
+    ]}))
+    profiles: List[BotProfile] = load_profiles(str(profiles_file))
+    assert profiles[0].slack_token == "xoxb-vic"
+    assert profile_codes(profiles) == ["VIC", "NSW"]
+
+    rows: List[CovidRow] = [CovidRow.from_feed(make_row(code, 1)) for code in ["VIC", "NSW"]]
+    slack_bots: Dict[str, FakeSlackBot] = {profile.name: FakeSlackBot() for profile in profiles}
+    last_posted: Dict = {}
+
+    metrics: RunMetrics = start_run()
+    post_profiles(profiles, slack_bots, CodeIndex(rows), load_state_data(), last_posted)
+
+    assert slack_bots["vic"].posted == [{"VIC": "16+"}]
+    assert slack_bots["east"].posted == [{"VIC": "16+", "NSW": "16+"}]
+    assert slack_bots["youth"].posted == [{"NSW": "12+"}]
+    assert metrics.counters["selections_computed"] == 2, "Message: each code should be selected once for every bracket"
+    assert set(last_posted) == {"vic", "east", "youth"}, "Message: what was posted should be kept per profile"
+
+
+class FlakySlackBot(FakeSlackBot):
+
+    def __init__(self, failures: int) -> None:
+        super().__init__()
+        self.failures: int = failures
+
+    def execute_for_covid_data(self, covid_data: Dict):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("channel_not_found")
+        return super().execute_for_covid_data(covid_data)
+
+
+def test_failed_profile_is_retried_without_reposting_the_others(tmp_path, monkeypatch):
+    profiles: List[BotProfile] = [
+        BotProfile({"NAME": "vic", "SELECTED_CODES": "VIC", "SLACK_BOT_DISPLAY": "CODE_DATA"}),
+        BotProfile({"NAME": "nsw", "SELECTED_CODES": "NSW", "SLACK_BOT_DISPLAY": "CODE_DATA"}),
+    ]
+    slack_bots: Dict[str, FakeSlackBot] = {"vic": FakeSlackBot(), "nsw": FlakySlackBot(failures=1)}
+    start_run()
+
+    with FeedServer(generate_feed_json(codes=["VIC", "NSW"], days=10)) as feed_server:
+        monkeypatch.setattr(bot_profiles, "SOURCE_URL", feed_server.url)
+        monkeypatch.setattr(bot_profiles, "FEED_CACHE_DIR", str(tmp_path))
+        monkeypatch.setattr(bot_profiles, "create_slack_bots", lambda profiles: slack_bots)
+
+        fetch_and_post_profiles(profiles)
+        fetch_and_post_profiles(profiles)
+        fetch_and_post_profiles(profiles)
+
+    assert feed_server.statuses == [200, 200, 304], "Message: the feed should be committed once every profile posted"
+    assert len(slack_bots["vic"].posted) == 1, "Message: a profile that posted shouldn't repost when another is retried"
+    assert len(slack_bots["nsw"].posted) == 1, "Message: the failed profile should be posted on the next run"
@@ -0,0 +1,100 @@
+import random
+from datetime import date, timedelta
+from typing import Dict, List, Optional
+
+from code_index import CodeIndex, has_vax_data, row_recency
+from covid_row import CovidRow
+from post_covid_stats import get_most_recent_data_for_codes
+from run_metrics import RunMetrics, start_run
+from test_post_covid_stats import load_state_data, make_row
+
+
+# A feed row with just the fields selection reads
+def make_feed_row(code: str, day: int, updated: bool = True, vax: bool = True) -> Dict:
+    report_date: str = str(date(2021, 8, 1) + timedelta(days=day))
+    return {
+        "CODE": code,
+        "REPORT_DATE": report_date,
+        "LAST_UPDATED_DATE": f"{report_date} 11:00:00" if updated else None,
+        "VACC_DOSE_CNT": 1000 + day if vax else None,
+    }
+
+
+# What the index should select, from every row sorted newest first
+def sorted_selection(rows: List[Dict], code: str, window: int, history_days: int) -> Dict:
+    ordered: List[Dict] = sorted((row for row in rows if row["CODE"] == code), key=row_recency, reverse=True)
+    updated: List[Dict] = [row for row in ordered if row["LAST_UPDATED_DATE"] is not None]
+    vax_position: Optional[int] = next((position for position, row in enumerate(ordered) if has_vax_data(row)), None)
+    return {
+        "LATEST": updated[0]["REPORT_DATE"] if updated else None,
+        "LATEST_VAX": ordered[vax_position]["REPORT_DATE"] if vax_position is not None else None,
+        "TRAILING": [row["REPORT_DATE"] for row in ordered[vax_position + 1:vax_position + 1 + window]] if vax_position is not None else [],
+        "HISTORY": [row["REPORT_DATE"] for row in updated[:history_days]],
+    }
+
+
+def index_selection(index: CodeIndex, code: str) -> Dict:
+    latest: Optional[Dict] = index.latest(code)
+    latest_vax: Optional[Dict] = index.latest_vax(code)
+    return {
+        "LATEST": latest["REPORT_DATE"] if latest is not None else None,
+        "LATEST_VAX": latest_vax["REPORT_DATE"] if latest_vax is not None else None,
+        "TRAILING": [row["REPORT_DATE"] for row in index.trailing(code)],
+        "HISTORY": [row["REPORT_DATE"] for row in index.history(code)],
+    }
+
+
+def test_index_selects_what_sorting_would_from_shuffled_rows_and_deltas():
+    # Reports arriving out of order, with the older one lacking vax data and the oldest not yet updated
+    rows: List[Dict] = [
+        make_feed_row("VIC", 2, updated=False),
+        make_feed_row("VIC", 4, vax=False),
+        make_feed_row("VIC", 0, vax=False),
+        make_feed_row("VIC", 3, vax=False),
+        make_feed_row("VIC", 1),
+    ]
+    assert index_selection(CodeIndex(rows, window=3), "VIC")["TRAILING"] == ["2021-08-01"]
+
+    for seed in range(40):
+        rng: random.Random = random.Random(seed)
+        # Sparse vax data, and some reports not updated yet
+        rows = [
+            make_feed_row(code, day, updated=rng.random() > 0.1, vax=rng.random() < 0.15)
+            for code in ["VIC", "NSW"] for day in range(40)
+        ]
+        rng.shuffle(rows)
+
+        at_once: CodeIndex = CodeIndex(rows, window=7, history_days=10)
+        deltas: CodeIndex = CodeIndex(window=7, history_days=10)
+        size: int = rng.randint(1, 12)
+        for start in range(0, len(rows), size):
+            deltas.update(rows[start:start + size])
+        assert deltas.update(rows) == 0, "Message: replaying every row shouldn't change anything"
+
+        for code in ["VIC", "NSW"]:
+            expected: Dict = sorted_selection(rows, code, 7, 10)
+            assert index_selection(at_once, code) == expected, f"Message: seed {seed} {code} built at once"
+            assert index_selection(deltas, code) == expected, f"Message: seed {seed} {code} built from deltas"
+
+
+def test_replayed_snapshots_change_nothing_and_corrections_replace_reports():
+    rows: List[CovidRow] = [CovidRow.from_feed(make_row("VIC", day)) for day in range(1, 11)]
+    index: CodeIndex = CodeIndex(rows)
+    assert index.update(rows) == 0, "Message: rows already seen shouldn't change the index"
+
+    corrected: Dict = make_row("VIC", 9)
+    corrected["LAST_UPDATED_DATE"] = "2021-09-10 18:00:00"
+    index.update([CovidRow.from_feed(corrected)])
+
+    assert [row["LAST_UPDATED_DATE"] for row in index.trailing("VIC", 2)] == ["2021-09-10 18:00:00", "2021-09-08 11:00:00"]
+
+
+def test_missing_codes_are_reported_not_raised():
+    metrics: RunMetrics = start_run()
+    index: CodeIndex = CodeIndex([CovidRow.from_feed(make_row("VIC", 1))], ["VIC", "NSW"])
+
+    code_data: Dict = get_most_recent_data_for_codes(index, load_state_data(), ["VIC", "NSW"], "16+")
+
+    assert list(code_data) == ["VIC"]
+    assert index.missing(["VIC", "NSW"]) == ["NSW"]
+    assert metrics.counters["codes_missing"] == 1
@@ -0,0 +1,79 @@
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import time
+from typing import Dict
+from urllib.parse import urlencode
+
+from aiohttp.test_utils import TestClient, TestServer
+
+import command_server
+from command_server import CommandServer, verify_slack_signature
+from local_servers import FeedServer
+from synthetic_feed import generate_feed_json
+
+SIGNING_SECRET = "fake-signing-secret"
+
+
+def sign(body: bytes, timestamp: str) -> str:
+    base: bytes = b"v0:" + timestamp.encode("utf-8") + b":" + body
+    return "v0=" + hmac.new(SIGNING_SECRET.encode("utf-8"), base, hashlib.sha256).hexdigest()
+
+
+def test_verify_slack_signature():
+    body: bytes = b"command=%2Fcovid&text=VIC"
+    timestamp: str = str(int(time.time()))
+
+    assert verify_slack_signature(SIGNING_SECRET, timestamp, body, sign(body, timestamp))
+    assert not verify_slack_signature(SIGNING_SECRET, timestamp, body + b"x", sign(body, timestamp))
+    assert not verify_slack_signature(SIGNING_SECRET, timestamp, body, sign(body, timestamp), now=time.time() + 600)
+
+
+def test_slash_commands_answer_from_the_rendered_feed(tmp_path):
+    feed_file = tmp_path / "covid-live.json"
+    feed_file.write_bytes(generate_feed_json(days=30))
+    server: CommandServer = CommandServer(SIGNING_SECRET, str(feed_file))
+    assert server.refresh(), "Message: the first refresh should load the feed"
+    assert not server.refresh(), "Message: an unchanged feed file shouldn't be reloaded"
+
+    async def run_commands() -> Dict[str, Dict]:
+        results: Dict[str, Dict] = {}
+        async with TestClient(TestServer(server.create_app())) as client:
+            for command, text in [("/covid", "VIC"), ("/vax", "nsw 12+"), ("/covid", "XYZ")]:
+                body: bytes = urlencode({"command": command, "text": text}).encode("utf-8")
+                timestamp: str = str(int(time.time()))
+                response = await client.post("/slack/commands", data=body, headers={
+                    "Content-Type": "application/x-www-form-urlencoded",
+                    "X-Slack-Request-Timestamp": timestamp,
+                    "X-Slack-Signature": sign(body, timestamp),
+                })
+                assert response.status == 200
+                results[f"{command} {text}"] = await response.json()
+
+            response = await client.post("/slack/commands", data=b"command=%2Fcovid", headers={
+                "X-Slack-Request-Timestamp": str(int(time.time())),
+                "X-Slack-Signature": "v0=forged",
+            })
+            assert response.status == 401, "Message: unsigned requests should be rejected"
+        return results
+
+    results: Dict[str, Dict] = asyncio.run(run_commands())
+
+    assert "Latest COVID figures for VIC" in results["/covid VIC"]["blocks"][0]["text"]["text"]
+    assert "(12+)" in json.dumps(results["/vax nsw 12+"]["blocks"]), "Message: the requested bracket should be shown"
+    assert results["/covid XYZ"]["response_type"] == "ephemeral", "Message: unknown codes should be reported privately"
+
+
+def test_refreshes_from_the_feed_are_conditional_once_rendered(tmp_path, monkeypatch):
+    monkeypatch.setattr(command_server, "FEED_CACHE_DIR", str(tmp_path))
+
+    with FeedServer(generate_feed_json(days=10)) as feed_server:
+        monkeypatch.setattr(command_server, "SOURCE_URL", feed_server.url)
+        server: CommandServer = CommandServer(SIGNING_SECRET)
+        assert server.refresh(), "Message: the first refresh should load the feed"
+        assert not server.refresh(), "Message: an unchanged feed shouldn't be rendered again"
+
+    assert feed_server.statuses == [200, 304], "Message: the second refresh should be answered with a 304"
+    assert sorted(os.listdir(tmp_path / "command-server")) == ["covid-live.json", "covid-live.meta.json"]
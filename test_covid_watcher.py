@@ -0,0 +1,51 @@
+from typing import List
+
+import pytest
+
+import covid_watcher
+import post_covid_stats
+from covid_watcher import CovidWatcher
+from local_servers import FakeSlackServer, FeedServer
+from post_covid_stats import load_last_posted, save_last_posted
+from run_metrics import start_run
+from slack_bot import CovidSlackBot
+from synthetic_feed import generate_feed_json
+
+
+def test_unchanged_feed_still_posts_codes_that_were_not_posted(tmp_path, monkeypatch):
+    codes: List[str] = ["AUS", "VIC"]
+    start_run()
+
+    with FeedServer(generate_feed_json(codes=codes, days=10)) as feed_server, FakeSlackServer() as slack_server:
+        monkeypatch.setattr(covid_watcher, "SOURCE_URL", feed_server.url)
+        monkeypatch.setattr(covid_watcher, "FEED_CACHE_DIR", str(tmp_path))
+        slack_bot: CovidSlackBot = CovidSlackBot("token", "#a", "bot", ":robot_face:", base_url=slack_server.url)
+        watcher: CovidWatcher = CovidWatcher(codes, ["CODE_DATA"], slack_bot=slack_bot)
+
+        watcher.poll()
+        # As if posting VIC had failed, so it was never recorded as posted
+        del watcher.last_posted["CODE_DATA"]["VIC"]
+        watcher.poll()
+        watcher.poll()
+
+    assert feed_server.requests == 3
+    posts: List[str] = [call["PAYLOAD"]["blocks"][0]["text"]["text"] for call in slack_server.accepted("chat.postMessage")]
+    assert len(posts) == 2, "Message: the feed should be posted once, then VIC once more"
+    assert "VIC" in posts[1] and "AUS" not in posts[1], "Message: only the code that wasn't posted should be retried"
+
+
+def test_last_posted_is_replaced_whole(tmp_path, monkeypatch):
+    last_posted_file: str = str(tmp_path / "last-posted.json")
+    save_last_posted(last_posted_file, {"CODE_DATA": {"VIC": ("2021-09-01", "2021-09-01 10:00")}})
+
+    # As if the run were stopped partway through writing
+    def interrupted_dump(value, file) -> None:
+        file.write("{\"CODE_DA")
+        raise KeyboardInterrupt
+    monkeypatch.setattr(post_covid_stats.json, "dump", interrupted_dump)
+    with pytest.raises(KeyboardInterrupt):
+        save_last_posted(last_posted_file, {})
+    monkeypatch.undo()
+
+    assert load_last_posted(last_posted_file) == {"CODE_DATA": {"VIC": ("2021-09-01", "2021-09-01 10:00")}}, \
+        "Message: an interrupted save should leave the last complete file in place"
@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+import feed_fetcher
+from feed_fetcher import create_session
+from post_covid_stats import fetch_and_parse_data
+from run_metrics import RunMetrics, measure_download, start_run
+
+
+# Local feeds, each path with a list of responses to give in turn (the last one repeats) and a delay
+class FeedServer:
+
+    def __init__(self, routes: Dict[str, Dict]) -> None:
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:
+                route: Dict = routes[self.path]
+                time.sleep(route.get("delay", 0))
+                status, body = route["responses"][0] if len(route["responses"]) == 1 else route["responses"].pop(0)
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args) -> None:
+                pass
+
+        self.server: ThreadingHTTPServer = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url: str = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+
+def feed(rows: List[Dict]) -> bytes:
+    return json.dumps(rows).encode("utf-8")
+
+
+def test_fetch_retries_falls_back_to_mirrors_and_merges_sources(monkeypatch):
+    monkeypatch.setattr(feed_fetcher, "backoff_seconds", lambda attempt: 0.01)
+    main_rows: List[Dict] = [
+        {"CODE": "VIC", "REPORT_DATE": "2021-09-02", "LAST_UPDATED_DATE": "2021-09-02 10:00:00", "CASE_CNT": "10"},
+        {"CODE": "VIC", "REPORT_DATE": "2021-09-01", "LAST_UPDATED_DATE": "2021-09-01 10:00:00", "CASE_CNT": "5"},
+    ]
+    # A later correction of the 2nd, and a code the main feed doesn't have
+    region_rows: List[Dict] = [
+        {"CODE": "VIC", "REPORT_DATE": "2021-09-02", "LAST_UPDATED_DATE": "2021-09-02 12:00:00", "CASE_CNT": "11"},
+        {"CODE": "NSW", "REPORT_DATE": "2021-09-02", "LAST_UPDATED_DATE": "2021-09-02 11:00:00", "CASE_CNT": "20"},
+    ]
+    server: FeedServer = FeedServer({
+        "/main": {"responses": [(404, b"gone")]},
+        "/mirror": {"responses": [(503, b""), (200, feed(main_rows))], "delay": 0.3},
+        "/region": {"responses": [(200, feed(region_rows))], "delay": 0.3},
+    })
+
+    metrics: RunMetrics = start_run()
+    started: float = time.monotonic()
+    rows, modified = fetch_and_parse_data(
+        f"{server.url}/main",
+        ["VIC", "NSW"],
+        session=create_session(),
+        mirrors=[f"{server.url}/mirror"],
+        extra_sources=[f"{server.url}/region"]
+    )
+    elapsed: float = time.monotonic() - started
+
+    assert modified
+    assert sorted((row["CODE"], row["REPORT_DATE"], row["CASE_CNT"]) for row in rows) == [
+        ("NSW", "2021-09-02", 20),
+        ("VIC", "2021-09-01", 5),
+        ("VIC", "2021-09-02", 11),
+    ], "Message: sources should merge with the latest update of each report winning"
+    assert metrics.counters["feed_fetch_retries"] == 1, "Message: the mirror's 503 should be retried"
+    assert metrics.counters["feed_mirror_fallbacks"] == 1, "Message: the main feed's 404 should fall back to the mirror"
+    # The mirror is fetched twice, the region source alongside it rather than after
+    assert elapsed < 0.9, "Message: sources should download concurrently"
+
+
+def test_download_waits_are_kept_per_stream():
+    def chunks(delay: float):
+        for _ in range(4):
+            time.sleep(delay)
+            yield b"[]"
+
+    metrics: RunMetrics = start_run()
+    slow_waits: List[float] = []
+    fast_waits: List[float] = []
+    slow: threading.Thread = threading.Thread(target=lambda: list(measure_download(chunks(0.1), metrics, slow_waits)))
+    slow.start()
+    list(measure_download(chunks(0.0), metrics, fast_waits))
+    slow.join()
+
+    assert sum(slow_waits) >= 0.4 and metrics.stages["download"] >= 0.4
+    assert sum(fast_waits) < 0.1, "Message: a stream's waits shouldn't include another stream downloading at the same time"
@@ -0,0 +1,37 @@
+import json
+from typing import Dict, List
+
+from feed_parser import decode_chunks, iter_json_array, stream_rows_for_codes
+
+
+def test_stream_rows_for_codes_across_chunk_boundaries():
+    rows: List[Dict] = [
+        {"CODE": "VIC", "REPORT_DATE": "2021-09-02", "NAME": "Victoria ✓"},
+        {"CODE": "NSW", "REPORT_DATE": "2021-09-02", "NAME": "NSW"},
+        {"CODE": "VIC", "REPORT_DATE": "2021-09-01", "NAME": "Victoria ✓"},
+    ]
+    body: bytes = json.dumps(rows, indent=2, ensure_ascii=False).encode("utf-8")
+
+    # split into tiny chunks so rows and multi-byte characters straddle chunk boundaries
+    byte_chunks = [body[i:i + 7] for i in range(0, len(body), 7)]
+    selected = list(stream_rows_for_codes(decode_chunks(byte_chunks), ["VIC"]))
+
+    assert selected == [rows[0], rows[2]], "Message: only VIC rows should be streamed"
+
+
+def test_iter_json_array_empty_and_truncated():
+    assert list(iter_json_array(["[", " ]"])) == [], "Message: empty array should yield nothing"
+
+    try:
+        list(iter_json_array(['[{"CODE": "VIC"}, {"CODE"']))
+        assert False, "Message: truncated feed should raise"
+    except ValueError:
+        pass
+
+
+def test_null_fields_read_as_none_and_are_not_in_the_row():
+    from covid_row import CovidRow
+    row: CovidRow = CovidRow.from_feed({"CODE": "VIC", "REPORT_DATE": "2021-09-01", "CASE_CNT": 5, "VACC_DOSE_CNT": None})
+
+    assert row["VACC_DOSE_CNT"] is None and "VACC_DOSE_CNT" not in row, "Message: a null field has no value"
+    assert row.get("VACC_DOSE_CNT", 0) == 0 and "CASE_CNT" in row
@@ -0,0 +1,38 @@
+from typing import List
+
+from code_index import CodeIndex
+from feed_cache import FeedCache
+from feed_fetcher import create_session
+from local_servers import FakeSlackServer, FeedServer
+from post_covid_stats import fetch_and_parse_data, load_state_data, post_updates
+from run_metrics import RunMetrics, start_run
+from slack_bot import CovidSlackBot
+from synthetic_feed import generate_feed_json
+
+
+def test_full_run_posts_to_the_fake_slack_through_a_rate_limit(tmp_path):
+    codes: List[str] = ["AUS", "VIC"]
+    metrics: RunMetrics = start_run()
+
+    with FeedServer(generate_feed_json(codes=codes, days=10)) as feed_server, FakeSlackServer(retry_after=0.1) as slack_server:
+        slack_server.fail_next(429)
+        slack_bot: CovidSlackBot = CovidSlackBot("token", "#a,#b", "bot", ":robot_face:", base_url=slack_server.url)
+        feed_cache: FeedCache = FeedCache(str(tmp_path))
+
+        rows, modified = fetch_and_parse_data(feed_server.url, codes, feed_cache, create_session())
+        post_updates(slack_bot, CodeIndex(rows, codes), load_state_data(), codes, ["CODE_DATA"], "16+")
+        feed_cache.commit()
+        _, modified_again = fetch_and_parse_data(feed_server.url, codes, feed_cache, create_session())
+
+    assert modified and not modified_again, "Message: an unchanged feed should be answered with a 304"
+    assert sorted(call["CHANNEL"] for call in slack_server.accepted("chat.postMessage")) == ["#a", "#b"]
+    assert slack_server.summary() == {"chat.postMessage": {"429": 1, "200": 2}}
+    assert metrics.counters["slack_api_retries"] == 1, "Message: the rate limited post should be retried"
+    assert slack_server.accepted()[0]["PAYLOAD"]["blocks"], "Message: payloads should be recorded"
+
+
+def test_fake_slack_rate_limits_each_channel():
+    with FakeSlackServer(channel_rate=0.5, channel_burst=1) as slack_server:
+        statuses: List[int] = [slack_server.status_for(channel) for channel in ["#a", "#a", "#b"]]
+
+    assert statuses == [200, 429, 200], "Message: only the channel over its rate should be limited"
@@ -0,0 +1,38 @@
+from typing import Dict, List
+
+import pytest
+
+from covid_row import CovidRow
+from population_brackets import PopulationTable, derive_brackets
+from test_post_covid_stats import load_state_data, make_row
+
+
+def test_derive_brackets_for_every_row_at_once():
+    rows: List[CovidRow] = [CovidRow.from_feed(make_row("VIC", day)) for day in range(1, 4)]
+    rows[1]["VACC_FIRST_DOSE_CNT_12_15"] = 0
+    rows[1]["PREV_VACC_FIRST_DOSE_CNT_12_15"] = 7
+    rows[2]["VACC_PEOPLE_CNT"] = None
+
+    derive_brackets(rows)
+
+    assert [row["VACC_FIRST_DOSE_CNT_12+"] for row in rows] == [1000, 2000, 3000]
+    assert [row["PREV_VACC_FIRST_DOSE_CNT_16+"] for row in rows] == [-10, 993, 1990]
+    assert rows[1]["VACC_FIRST_DOSE_CNT_16+"] == 1993, "Message: a 0 age group count should fall back to the previous one"
+    assert rows[2]["VACC_PEOPLE_CNT_16+"] is None, "Message: brackets of missing counts should be missing"
+
+
+def test_population_table():
+    state_data: Dict = load_state_data()
+    table: PopulationTable = PopulationTable(state_data)
+
+    assert table.brackets == ["12+", "16+"]
+    assert table.population("VIC", "16+") == state_data["VIC"]["POPULATION"]["16+"]
+    assert table.population("XYZ", "16+") is None
+
+    # A population for a bracket that isn't defined yet is skipped, and only asking for it fails
+    state_data["VIC"]["POPULATION"]["5-11"] = 500000
+    table = PopulationTable(state_data)
+    assert table.brackets == ["12+", "16+"]
+    assert table.population("VIC", "16+") == state_data["VIC"]["POPULATION"]["16+"]
+    with pytest.raises(ValueError):
+        table.population("VIC", "5-11")
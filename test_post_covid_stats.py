@@ -0,0 +1,171 @@
+import json
+import random
+from typing import Dict, List
+
+from code_index import CodeIndex
+from covid_row import CovidRow
+from run_metrics import start_run
+from post_covid_stats import get_most_recent_data_for_codes, get_vax_data_for_codes
+
+
+def make_row(code: str, day: int, vax: bool = True) -> Dict:
+    doses: int = 1000 * day
+    return {
+        "CODE": code,
+        "REPORT_DATE": f"2021-09-{day:02d}",
+        "LAST_UPDATED_DATE": f"2021-09-{day:02d} 11:00:00",
+        "VACC_DOSE_CNT": str(doses) if vax else None,
+        "PREV_VACC_DOSE_CNT": str(doses - 1000) if vax else None,
+        "VACC_FIRST_DOSE_CNT": str(doses) if vax else None,
+        "PREV_VACC_FIRST_DOSE_CNT": str(doses - 1000) if vax else None,
+        "VACC_PEOPLE_CNT": str(doses // 2) if vax else None,
+        "PREV_VACC_PEOPLE_CNT": str((doses - 1000) // 2) if vax else None,
+        "VACC_FIRST_DOSE_CNT_12_15": "10",
+        "PREV_VACC_FIRST_DOSE_CNT_12_15": "10",
+        "VACC_PEOPLE_CNT_12_15": "5",
+        "PREV_VACC_PEOPLE_CNT_12_15": "5",
+    }
+
+
+def load_state_data() -> Dict:
+    with open("./resources/state-data.json") as file:
+        return json.load(file)
+
+
+def test_selection_is_independent_of_feed_order():
+    rows: List[CovidRow] = [CovidRow.from_feed(make_row(code, day)) for code in ["VIC", "NSW"] for day in range(1, 21)]
+    rows.append(CovidRow.from_feed(make_row("VIC", 21, vax=False)))
+    shuffled: List[CovidRow] = list(rows)
+    random.Random(4).shuffle(shuffled)
+
+    state_data: Dict = load_state_data()
+    for feed in (rows, shuffled):
+        index: CodeIndex = CodeIndex(feed, ["VIC", "NSW"])
+        code_data: Dict = get_most_recent_data_for_codes(index, state_data, ["VIC", "NSW"], "16+")
+        vax_data: Dict = get_vax_data_for_codes(index, state_data, ["VIC", "NSW"], "16+")
+
+        assert code_data["VIC"]["REPORT_DATE"] == "2021-09-21", "Message: latest VIC row should be selected"
+        assert code_data["VIC"]["VACC_DOSE_CNT"] == 20000, "Message: vax data should fall back to the previous row"
+        assert vax_data["VIC"]["REPORT_DATE"] == "2021-09-20", "Message: latest VIC vax row should be selected"
+        assert vax_data["VIC"]["RECORD_COUNT"] == 7, "Message: trailing window should be a week"
+        assert vax_data["VIC"]["PREV_VACC_FIRST_DOSE_CNT_16+"] == 13000 - 10, "Message: baseline should be a week ago"
+
+    # Selection must not leak derived fields into the shared index
+    assert "POPULATION" not in index.latest("VIC"), "Message: index rows should not be mutated"
+
+
+class FakeResponse:
+
+    def __init__(self, status_code: int, body: bytes = b"", headers: Dict = None) -> None:
+        self.status_code: int = status_code
+        self.body: bytes = body
+        self.headers: Dict = headers or {}
+        self.encoding: str = "utf-8"
+        self.text: str = body.decode("utf-8")
+
+    def iter_content(self, chunk_size: int):
+        for i in range(0, len(self.body), chunk_size):
+            yield self.body[i:i + chunk_size]
+
+
+def test_conditional_fetch_reuses_cached_feed(tmp_path):
+    import post_covid_stats
+    from feed_cache import FeedCache
+
+    body: bytes = json.dumps([make_row("VIC", 1), make_row("NSW", 1)]).encode("utf-8")
+    requests_made: List[Dict] = []
+
+    class FakeSession:
+        def get(self, url, headers=None, stream=False, timeout=None):
+            requests_made.append(headers)
+            if headers.get("If-None-Match") == '"v1"':
+                return FakeResponse(304)
+            return FakeResponse(200, body, {"ETag": '"v1"'})
+
+    metrics = start_run()
+    rows, modified = post_covid_stats.fetch_and_parse_data("http://feed", ["VIC"], FeedCache(str(tmp_path)), FakeSession())
+    assert modified and [row["CODE"] for row in rows] == ["VIC"], "Message: first fetch should download"
+    assert metrics.counters == {
+        "feed_bytes_downloaded": len(body),
+        "feed_rows_scanned": 2,
+        "feed_rows_kept": 1,
+    }, "Message: fetch should record bytes downloaded and rows scanned vs kept"
+    assert {"fetch", "download", "parse"} <= set(metrics.stages), "Message: fetch stages should be timed"
+    assert 'covidbot_stage_seconds{stage="parse"}' in metrics.to_prometheus(), "Message: stages should be exported"
+
+    # Until it's been posted and committed, the feed is fetched in full again
+    feed_cache: FeedCache = FeedCache(str(tmp_path))
+    rows, modified = post_covid_stats.fetch_and_parse_data("http://feed", ["VIC"], feed_cache, FakeSession())
+    assert modified, "Message: an uncommitted feed should be fetched again"
+    feed_cache.commit()
+
+    # A fresh cache instance has to fall back to the body stored on disk
+    rows, modified = post_covid_stats.fetch_and_parse_data("http://feed", ["VIC"], FeedCache(str(tmp_path)), FakeSession())
+    assert not modified and [row["CODE"] for row in rows] == ["VIC"], "Message: 304 should reuse the cached feed"
+    assert requests_made == [{}, {}, {"If-None-Match": '"v1"'}], "Message: only requests after a commit should be conditional"
+
+
+class FakeSlackBot:
+
+    def __init__(self) -> None:
+        self.posted: List[List[str]] = []
+
+    def execute_for_covid_data(self, covid_data: Dict):
+        self.posted.append(list(covid_data))
+        return FakeSlackResponse()
+
+
+class FakeSlackResponse:
+    status_code: int = 200
+    data: Dict = {"ok": True}
+
+
+def test_post_updates_only_posts_codes_that_moved_on():
+    from post_covid_stats import post_updates
+
+    state_data: Dict = load_state_data()
+    slack_bot: FakeSlackBot = FakeSlackBot()
+    last_posted: Dict = {}
+
+    rows: List[CovidRow] = [CovidRow.from_feed(make_row("VIC", 1)), CovidRow.from_feed(make_row("NSW", 1))]
+    post_updates(slack_bot, CodeIndex(rows), state_data, ["VIC", "NSW"], ["CODE_DATA"], "16+", last_posted)
+    post_updates(slack_bot, CodeIndex(rows), state_data, ["VIC", "NSW"], ["CODE_DATA"], "16+", last_posted)
+
+    rows.append(CovidRow.from_feed(make_row("NSW", 2)))
+    post_updates(slack_bot, CodeIndex(rows), state_data, ["VIC", "NSW"], ["CODE_DATA"], "16+", last_posted)
+
+    assert slack_bot.posted == [["VIC", "NSW"], ["NSW"]], "Message: only updated codes should be reposted"
+
+
+def test_selection_matches_on_shuffled_synthetic_feed():
+    from synthetic_feed import generate_feed
+
+    state_data: Dict = load_state_data()
+    codes: List[str] = ["AUS", "VIC", "NSW"]
+    selections: List[Dict] = []
+    for shuffle in (False, True):
+        rows: List[CovidRow] = [CovidRow.from_feed(row) for row in generate_feed(days=60, shuffle=shuffle, seed=1)]
+        index: CodeIndex = CodeIndex(rows, codes)
+        code_data: Dict = get_most_recent_data_for_codes(index, state_data, codes, "16+")
+        vax_data: Dict = get_vax_data_for_codes(index, state_data, codes, "16+")
+        selections.append({
+            code: (code_data[code].to_dict(), vax_data[code].to_dict()) for code in codes
+        })
+
+    assert selections[0] == selections[1], "Message: row order should not change the selection"
+
+
+def test_vax_baseline_skips_rows_without_vax_data():
+    from post_covid_stats import get_vax_data_for_codes
+    from vax_projection import project_vax_targets
+
+    # The oldest row in VIC's window has no vax counts
+    rows: List[CovidRow] = [CovidRow.from_feed(make_row("VIC", day, vax=day != 2)) for day in range(1, 10)]
+    rows += [CovidRow.from_feed(make_row("NSW", day)) for day in range(1, 10)]
+    vax_data: Dict = get_vax_data_for_codes(CodeIndex(rows), load_state_data(), ["VIC", "NSW"], "16+", window=7)
+
+    assert vax_data["VIC"]["RECORD_COUNT"] == 6, "Message: the baseline should be the oldest row with vax counts"
+    assert vax_data["VIC"]["PREV_VACC_FIRST_DOSE_CNT_16+"] == 3000 - 10
+    assert vax_data["VIC"]["TRAILING_COUNTS"]["VACC_FIRST_DOSE_CNT"][-1] is None, "Message: the gap should be kept"
+    for method in ["average", "least_squares"]:
+        assert set(project_vax_targets(vax_data, method=method)) == {"VIC", "NSW"}
@@ -0,0 +1,86 @@
+from typing import Dict, List
+
+from async_slack import AsyncSlackPoster
+from covid_row import CovidRow
+from posted_messages import PostedMessages
+from slack_bot import CovidSlackBot
+
+
+class FakeAsyncClient:
+
+    def __init__(self) -> None:
+        self.calls: List[Dict] = []
+
+    async def chat_postMessage(self, channel: str, **kwargs):
+        self.calls.append({"method": "post", "channel": channel, **kwargs})
+        return {"ok": True, "ts": str(len(self.calls))}
+
+    async def chat_update(self, channel: str, **kwargs):
+        self.calls.append({"method": "update", "channel": channel, **kwargs})
+        return {"ok": True, "ts": kwargs["ts"]}
+
+
+def make_code_data(code: str, report_date: str, last_updated_date: str, new_cases: int) -> CovidRow:
+    row: CovidRow = CovidRow()
+    row["CODE"] = code
+    row["REPORT_DATE"] = report_date
+    row["LAST_UPDATED_DATE"] = last_updated_date
+    row["NEW_CASE_CNT"] = new_cases
+    row["POPULATION"] = 1000
+    row["CODE_EMOJI"] = ""
+    return row
+
+
+def make_slack_bot(tmp_path, client: FakeAsyncClient) -> CovidSlackBot:
+    posted: PostedMessages = PostedMessages(str(tmp_path / "posted-messages.json"))
+    slack_bot: CovidSlackBot = CovidSlackBot("token", "#a", "bot", ":robot_face:", posted_messages=posted)
+    slack_bot.create_poster = lambda: AsyncSlackPoster("token", "bot", ":robot_face:", client=client)
+    slack_bot.render_code_groups = lambda display, data: {
+        code: [{"type": "section", "text": {"type": "mrkdwn", "text": f"{code} {data[code]['NEW_CASE_CNT']}"}}]
+        for code in data
+    }
+    return slack_bot
+
+
+def test_corrections_edit_the_original_message(tmp_path):
+    client: FakeAsyncClient = FakeAsyncClient()
+    slack_bot: CovidSlackBot = make_slack_bot(tmp_path, client)
+
+    slack_bot.publish("CODE_DATA", {
+        "VIC": make_code_data("VIC", "2021-09-01", "2021-09-01 10:00:00", 100),
+        "NSW": make_code_data("NSW", "2021-09-01", "2021-09-01 11:00:00", 200),
+    })
+    # Unchanged data is not sent again
+    assert slack_bot.publish("CODE_DATA", {"VIC": make_code_data("VIC", "2021-09-01", "2021-09-01 10:00:00", 100)}) is None
+
+    # A corrected report edits the message it was posted in, a new report is posted
+    slack_bot.publish("CODE_DATA", {
+        "VIC": make_code_data("VIC", "2021-09-01", "2021-09-01 12:00:00", 101),
+        "NSW": make_code_data("NSW", "2021-09-02", "2021-09-02 11:00:00", 300),
+    })
+
+    assert [call["method"] for call in client.calls] == ["post", "update", "post"], "Message: the correction should be an edit"
+    assert client.calls[1]["ts"] == "1", "Message: the correction should edit the first message"
+    assert [block["text"]["text"] for block in client.calls[1]["blocks"]] == ["VIC 101", "NSW 200"], \
+        "Message: the edit should keep the message's other codes"
+
+    reloaded: PostedMessages = PostedMessages(str(tmp_path / "posted-messages.json"))
+    assert reloaded.find("#a", "CODE_DATA", "NSW")[0]["TS"] == "3", "Message: the newest post should be remembered"
+    assert reloaded.find("#a", "CODE_DATA", "VIC")[1]["VERSION"] == ["2021-09-01", "2021-09-01 12:00:00"]
+
+
+def test_corrections_to_separately_posted_messages_edit_each_one(tmp_path):
+    client: FakeAsyncClient = FakeAsyncClient()
+    slack_bot: CovidSlackBot = make_slack_bot(tmp_path, client)
+
+    slack_bot.publish("CODE_DATA", {"VIC": make_code_data("VIC", "2021-09-01", "2021-09-01 10:00:00", 100)})
+    slack_bot.publish("CODE_DATA", {"NSW": make_code_data("NSW", "2021-09-01", "2021-09-01 11:00:00", 200)})
+    slack_bot.publish("CODE_DATA", {
+        "VIC": make_code_data("VIC", "2021-09-01", "2021-09-01 12:00:00", 101),
+        "NSW": make_code_data("NSW", "2021-09-01", "2021-09-01 12:00:00", 201),
+    })
+
+    updates: List[Dict] = [call for call in client.calls if call["method"] == "update"]
+    assert sorted(call["ts"] for call in updates) == ["1", "2"], "Message: both corrected messages should be edited"
+    assert sorted(call["blocks"][0]["text"]["text"] for call in updates) == ["NSW 201", "VIC 101"], \
+        "Message: each edit should carry its code's correction"
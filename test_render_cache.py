@@ -0,0 +1,35 @@
+from covid_row import CovidRow
+from render_cache import RenderCache, content_key
+from run_metrics import RunMetrics, start_run
+
+
+def make_row(new_cases: int) -> CovidRow:
+    row: CovidRow = CovidRow()
+    row["CODE"] = "VIC"
+    row["REPORT_DATE"] = "2021-09-01"
+    row["CASE_CNT"] = 1000 + new_cases
+    row["PREV_CASE_CNT"] = 1000
+    return row
+
+
+def test_render_cache_keys_on_content_and_evicts_least_recently_used():
+    metrics: RunMetrics = start_run()
+    cache: RenderCache = RenderCache(max_entries=2)
+    renders: list = []
+
+    def render(row: CovidRow) -> str:
+        renders.append(row["CASE_CNT"])
+        return f"{row['CASE_CNT']} cases"
+
+    first: CovidRow = make_row(1)
+    assert content_key("CODE_DATA", first) == content_key("CODE_DATA", first.copy())
+    assert content_key("CODE_DATA", first) != content_key("CODE_DATA", make_row(2))
+    assert content_key("CODE_DATA", first) != content_key("VAX_DATA", first)
+
+    for row in [first, first.copy(), make_row(2), first, make_row(3), make_row(2)]:
+        cache.get_or_render(content_key("CODE_DATA", row), lambda: render(row))
+
+    # The second render of 1002 is because it was evicted when 1003 went in, 1001 having been used more recently
+    assert renders == [1001, 1002, 1003, 1002], "Message: unchanged data should only render once while cached"
+    assert len(cache) == 2
+    assert metrics.counters == {"render_cache_hits": 2, "render_cache_misses": 4}
@@ -1,12 +1,13 @@
 import json
 from typing import Dict
 
+from covid_row import CovidRow
 from slack_bot import CovidSlackBot
 
 
 def test_generate_message_for_code():
     with open("./resources/nsw.json") as file:
-        nsw_data: Dict = json.load(file)
+        nsw_data: CovidRow = CovidRow.from_feed(json.load(file))
 
     slack_bot: CovidSlackBot = CovidSlackBot(
         "Fake Token Here",
@@ -32,7 +33,7 @@ def test_generate_message_for_code():
 
 def test_generate_vax_data_for_code():
     with open("./resources/nsw.json") as file:
-        nsw_data: Dict = json.load(file)
+        nsw_data: CovidRow = CovidRow.from_feed(json.load(file))
 
     slack_bot: CovidSlackBot = CovidSlackBot(
         "Fake Token Here",
@@ -0,0 +1,60 @@
+from typing import Dict, List
+
+import pytest
+
+import post_covid_stats
+from covid_row import CovidRow
+from snapshot_archive import SnapshotArchive
+from synthetic_feed import generate_feed
+
+
+def test_archive_stores_deltas_and_answers_point_in_time_queries(tmp_path):
+    archive: SnapshotArchive = SnapshotArchive(str(tmp_path))
+    feed: List[Dict] = generate_feed(codes=["VIC", "NSW"], days=30, seed=2)
+
+    # Day one knows about all but the newest report, day two adds it and corrects an older one
+    first: List[CovidRow] = [CovidRow.from_feed(row) for row in feed if row["REPORT_DATE"] != "2021-09-01"]
+    second: List[CovidRow] = [CovidRow.from_feed(row) for row in feed]
+    corrected: CovidRow = next(row for row in second if row["CODE"] == "VIC" and row["REPORT_DATE"] == "2021-08-20")
+    corrected["CASE_CNT"] += 5
+
+    assert archive.append(first, fetched_at=100) == 58, "Message: the first snapshot is archived in full"
+    assert archive.append(second, fetched_at=200) == 3, "Message: later snapshots only archive new or changed rows"
+    assert archive.append(second, fetched_at=300) == 0, "Message: an unchanged snapshot archives nothing"
+
+    latest: List[CovidRow] = archive.rows_as_of("VIC")
+    assert [row.to_dict() for row in latest] == [
+        row.to_dict() for row in sorted((row for row in second if row["CODE"] == "VIC"), key=lambda row: row["REPORT_DATE"], reverse=True)
+    ], "Message: replaying the archive should give back the latest feed"
+
+    before: List[CovidRow] = archive.rows_as_of("VIC", as_of=150)
+    assert before[0]["REPORT_DATE"] == "2021-08-31", "Message: point in time queries exclude later snapshots"
+    assert next(row for row in before if row["REPORT_DATE"] == "2021-08-20")["CASE_CNT"] == corrected["CASE_CNT"] - 5, \
+        "Message: point in time queries return the report as it was known then"
+    assert len(archive.history("NSW", 7)) == 7, "Message: history should return the last N reports"
+
+
+def test_archive_index_is_read_once_and_only_appended_to(tmp_path, monkeypatch):
+    archive: SnapshotArchive = SnapshotArchive(str(tmp_path))
+    feed: List[Dict] = generate_feed(codes=["AUS", "VIC", "NSW"], days=10, seed=3)
+    archive.append([CovidRow.from_feed(row) for row in feed if row["REPORT_DATE"] != "2021-09-01"], fetched_at=100)
+    first_fingerprints: str = (tmp_path / "fingerprints.jsonl").read_text()
+    archive.append([CovidRow.from_feed(row) for row in feed], fetched_at=200)
+
+    assert (tmp_path / "fingerprints.jsonl").read_text().startswith(first_fingerprints), \
+        "Message: archiving a snapshot should append its fingerprints, not rewrite them"
+    assert archive.append([CovidRow.from_feed(row) for row in feed], fetched_at=300) == 0, \
+        "Message: appended fingerprints should still be found"
+
+    reads: List[int] = []
+    snapshots = archive.snapshots
+    monkeypatch.setattr(archive, "snapshots", lambda: reads.append(1) or snapshots())
+    rows: List[CovidRow] = archive.latest_rows()
+    assert len(reads) == 1, "Message: the snapshot index should be read once for every code"
+    assert [row["CODE"] for row in rows] == ["AUS"] * 10 + ["VIC"] * 10 + ["NSW"] * 10
+
+
+def test_offline_without_an_archive_fails_rather_than_fetching(monkeypatch):
+    monkeypatch.setattr(post_covid_stats, "FEED_OFFLINE", True)
+    with pytest.raises(ValueError):
+        post_covid_stats.fetch_and_parse_data("http://127.0.0.1:9/covid-live.json", ["VIC"])
@@ -0,0 +1,24 @@
+from typing import Dict
+
+from startup_profile import parse_importtime, profile_startup
+
+IMPORTTIME_OUTPUT: str = """import time: self [us] | cumulative | imported package
+import time:       176 |      27926 |     certifi.core
+import time:       375 |      28300 |   certifi
+import time:      1527 |     328401 | post_covid_stats
+"""
+
+
+def test_parse_importtime():
+    assert parse_importtime(IMPORTTIME_OUTPUT) == [
+        ("certifi.core", 2, 0.000176, 0.027926),
+        ("certifi", 1, 0.000375, 0.0283),
+        ("post_covid_stats", 0, 0.001527, 0.328401),
+    ]
+
+
+def test_startup_only_imports_what_fetching_needs():
+    report: Dict = profile_startup(repeats=1)
+
+    assert report["heavy_modules_loaded"] == ["requests"], "Message: slack, aiohttp and numpy should be imported only to post"
+    assert "requests" in report["heaviest_imports"]
@@ -0,0 +1,129 @@
+import os
+from typing import Dict, List
+
+import pytest
+from slack_sdk.errors import SlackApiError
+
+from async_slack import AsyncSlackPoster
+from code_index import CodeIndex
+from covid_row import CovidRow
+from local_servers import FakeSlackServer
+from run_metrics import RunMetrics, start_run
+from slack_bot import CovidSlackBot
+from test_async_slack import FakeResponse
+from test_post_covid_stats import load_state_data, make_row
+from trend_charts import ChartRenderer, chart_key, chart_series, post_charts, render_chart
+
+
+# Stands in for render_chart in the worker processes, so it has to be importable from here
+def write_fake_chart(series: Dict, output_file: str) -> None:
+    with open(output_file, "w") as chartFile:
+        chartFile.write(series["CODE"])
+
+
+class FakeAsyncClient:
+
+    def __init__(self, failing_titles: List[str] = None) -> None:
+        self.uploaded: List[str] = []
+        self.failing_titles: List[str] = failing_titles or []
+
+    async def conversations_list(self, **kwargs):
+        response: FakeResponse = FakeResponse(200, {})
+        response.data["channels"] = [{"id": "C0A", "name": "a"}, {"id": "C0B", "name": "b"}]
+        return response
+
+    async def files_upload_v2(self, channel: str, **kwargs):
+        if kwargs["title"] in self.failing_titles:
+            raise SlackApiError("fatal_error", FakeResponse(500, {}))
+        self.uploaded.append(f"{channel} {kwargs['title']}")
+        return FakeResponse(200, {})
+
+
+class FakeSlackBot:
+
+    def __init__(self, client: FakeAsyncClient, slack_token: str = "token") -> None:
+        self.slack_token: str = slack_token
+        self.channel_names: List[str] = ["#a", "#b"]
+        self.client: FakeAsyncClient = client
+
+    def get_poster(self) -> AsyncSlackPoster:
+        return AsyncSlackPoster("token", "bot", ":robot_face:", client=self.client)
+
+
+def make_index() -> CodeIndex:
+    return CodeIndex([CovidRow.from_feed(make_row(code, day)) for code in ["VIC", "NSW"] for day in [1, 2, 3]], history_days=60)
+
+
+def test_chart_series_is_oldest_first_and_keyed_by_content():
+    series: Dict = chart_series(make_index(), load_state_data(), "VIC", "16+")
+
+    assert series["DATES"] == sorted(series["DATES"]), "Message: the series should run oldest day first"
+    assert len(series["FIRST_DOSE"]) == 3
+    assert chart_key(series) == chart_key(chart_series(make_index(), load_state_data(), "VIC", "16+"))
+    assert chart_key(series) != chart_key(chart_series(make_index(), load_state_data(), "NSW", "16+"))
+
+
+def test_charts_are_rendered_and_uploaded_once(tmp_path):
+    renderer: ChartRenderer = ChartRenderer(str(tmp_path), render_function=write_fake_chart)
+    series_by_code: Dict[str, Dict] = {code: chart_series(make_index(), load_state_data(), code, "16+") for code in ["VIC", "NSW"]}
+    client: FakeAsyncClient = FakeAsyncClient()
+
+    try:
+        post_charts(FakeSlackBot(client), renderer, renderer.submit(series_by_code))
+        pending = renderer.submit(series_by_code)
+    finally:
+        renderer.shutdown()
+
+    assert all(future is None for _, future in pending.values()), "Message: rendered charts should be found in the cache"
+    assert sorted(client.uploaded) == ["C0A NSW trends", "C0A VIC trends", "C0B NSW trends", "C0B VIC trends"], \
+        "Message: charts should be shared to each channel's ID"
+
+    # A new renderer reads what was uploaded, so an unchanged chart isn't sent again
+    post_charts(FakeSlackBot(client), ChartRenderer(str(tmp_path)), pending)
+    assert len(client.uploaded) == 4, "Message: charts a channel already has shouldn't be uploaded again"
+
+    # Another token is another workspace, whose channels of the same name don't have them yet
+    post_charts(FakeSlackBot(client, "another workspace's token"), ChartRenderer(str(tmp_path)), pending)
+    assert len(client.uploaded) == 8, "Message: charts should be recorded per bot as well as per channel"
+
+
+def test_failed_uploads_are_counted_and_retried_without_failing_the_run(tmp_path):
+    metrics: RunMetrics = start_run()
+    renderer: ChartRenderer = ChartRenderer(str(tmp_path), render_function=write_fake_chart)
+    series_by_code: Dict[str, Dict] = {code: chart_series(make_index(), load_state_data(), code, "16+") for code in ["VIC", "NSW"]}
+
+    try:
+        pending = renderer.submit(series_by_code)
+        post_charts(FakeSlackBot(FakeAsyncClient(["VIC trends"])), renderer, pending)
+    finally:
+        renderer.shutdown()
+    assert metrics.counters["chart_upload_failures"] == 2
+
+    client: FakeAsyncClient = FakeAsyncClient()
+    post_charts(FakeSlackBot(client), ChartRenderer(str(tmp_path)), pending)
+    assert sorted(client.uploaded) == ["C0A VIC trends", "C0B VIC trends"], "Message: only the failed uploads should be retried"
+
+
+def test_charts_upload_to_the_fake_slack(tmp_path):
+    renderer: ChartRenderer = ChartRenderer(str(tmp_path), render_function=write_fake_chart)
+
+    with FakeSlackServer() as slack_server:
+        slack_bot: CovidSlackBot = CovidSlackBot("token", "#a", "bot", ":robot_face:", base_url=slack_server.url)
+        try:
+            post_charts(slack_bot, renderer, renderer.submit({"VIC": chart_series(make_index(), load_state_data(), "VIC", "16+")}))
+        finally:
+            renderer.shutdown()
+
+    assert [call["CHANNEL"] for call in slack_server.accepted("files.completeUploadExternal")] == ["#a"]
+    assert [call["PAYLOAD"]["file"] for call in slack_server.accepted("upload")] == ["<3 bytes>"]
+
+
+def test_render_chart_writes_a_png(tmp_path):
+    pytest.importorskip("matplotlib")
+    output_file: str = str(tmp_path / "chart.png")
+
+    render_chart(chart_series(make_index(), load_state_data(), "VIC", "16+"), output_file)
+
+    with open(output_file, "rb") as chartFile:
+        assert chartFile.read(8) == b"\x89PNG\r\n\x1a\n"
+    assert not os.path.exists(output_file + ".partial.png")
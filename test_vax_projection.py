@@ -0,0 +1,60 @@
+from datetime import datetime
+from typing import Dict
+
+from vax_projection import TARGET_REACHED, project_vax_targets
+
+
+def make_vax_data(first_doses, second_doses) -> Dict:
+    # counts are newest first, one row per day
+    return {
+        "CODE": "VIC",
+        "POPULATION": 1000,
+        "POPULATION_BRACKET": "16+",
+        "LAST_UPDATED_DATE": "2021-09-01 11:00:00",
+        "VACC_FIRST_DOSE_CNT_16+": first_doses[0],
+        "PREV_VACC_FIRST_DOSE_CNT_16+": first_doses[-1],
+        "VACC_PEOPLE_CNT_16+": second_doses[0],
+        "PREV_VACC_PEOPLE_CNT_16+": second_doses[-1],
+        "RECORD_COUNT": len(first_doses) - 1,
+        "TRAILING_COUNTS": {"VACC_FIRST_DOSE_CNT": first_doses, "VACC_PEOPLE_CNT": second_doses},
+    }
+
+
+def test_project_vax_targets_average_and_least_squares():
+    # 1st doses grow a steady 1% a day, 2nd doses aren't moving
+    vax_data: Dict = {"VIC": make_vax_data([650, 640, 630, 620], [400, 400, 400, 400])}
+
+    for method in ["average", "least_squares"]:
+        projections = project_vax_targets(vax_data, method=method)["VIC"]
+
+        assert projections["VACC_FIRST_DOSE_CNT"][0.6] == TARGET_REACHED, "Message: 60% should already be reached"
+        assert projections["VACC_FIRST_DOSE_CNT"][0.7] == datetime(2021, 9, 6, 11), "Message: 70% is 5 days away"
+        assert projections["VACC_FIRST_DOSE_CNT"][0.9] == datetime(2021, 9, 26, 11), "Message: 90% is 25 days away"
+        assert projections["VACC_PEOPLE_CNT"][0.6] is None, "Message: flat coverage never reaches the target"
+
+
+def test_least_squares_smooths_a_noisy_window():
+    # the two point average only sees the first and last day, the fit uses every day
+    vax_data: Dict = {"VIC": make_vax_data([650, 600, 600, 600, 620], [400, 390, 380, 370, 360])}
+
+    average = project_vax_targets(vax_data, method="average")["VIC"]
+    least_squares = project_vax_targets(vax_data, method="least_squares")["VIC"]
+
+    assert average["VACC_FIRST_DOSE_CNT"][0.7] == datetime(2021, 9, 8, 11), "Message: 7 days at 0.75% a day"
+    assert least_squares["VACC_FIRST_DOSE_CNT"][0.7] == datetime(2021, 9, 10, 11), "Message: 9 days at 0.6% a day"
+    assert average["VACC_PEOPLE_CNT"][0.6] == least_squares["VACC_PEOPLE_CNT"][0.6], "Message: linear data agrees"
+
+
+def test_missing_counts_are_gaps_rather_than_failures():
+    # A day without counts keeps the others at their own day, so the fit still sees 1% a day
+    with_gap: Dict = make_vax_data([650, None, 630, 620], [400, 400, 400, 400])
+    # No baseline to average from, so nothing can be projected for this code
+    no_baseline: Dict = make_vax_data([650], [400])
+    no_baseline["CODE"] = "NSW"
+    no_baseline["PREV_VACC_FIRST_DOSE_CNT_16+"] = None
+    no_baseline["RECORD_COUNT"] = 1
+
+    projections = project_vax_targets({"VIC": with_gap, "NSW": no_baseline}, method="least_squares")
+
+    assert projections["VIC"]["VACC_FIRST_DOSE_CNT"][0.7] == datetime(2021, 9, 6, 11), "Message: 70% is 5 days away"
+    assert projections["NSW"]["VACC_FIRST_DOSE_CNT"][0.7] is None, "Message: a code without a baseline can't be projected"
@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import importlib.util
+import json
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+from async_slack import AsyncSlackPoster
+from code_index import CodeIndex
+from covid_row import BRACKET_FIELD_NAMES, CovidRow
+from population_brackets import derive_brackets, population_table
+from run_metrics import current_metrics
+from slack_bot import CovidSlackBot
+from vax_projection import VAX_TARGETS
+
+CHART_DAYS: int = 60
+CHART_WORKERS: int = 2
+
+
+# Charts need matplotlib, which is optional
+def charts_available() -> bool:
+    return importlib.util.find_spec("matplotlib") is not None
+
+
+# Everything a code's chart is drawn from, oldest day first. The index needs to keep `days` of history
+def chart_series(index: CodeIndex, state_data: Dict, code: str, population_bracket: str, days: int = CHART_DAYS) -> Dict:
+    rows: List[CovidRow] = [row.copy() for row in index.history(code)[:days]]
+    rows.reverse()
+    derive_brackets(rows)
+    population: Optional[int] = population_table(state_data).population(code, population_bracket)
+
+    def change(row: CovidRow, field: str) -> Optional[int]:
+        if row[field] is None or row["PREV_" + field] is None:
+            return None
+        return row[field] - row["PREV_" + field]
+
+    def coverage(row: CovidRow, field: str) -> Optional[float]:
+        count: Optional[int] = row[BRACKET_FIELD_NAMES[(field, population_bracket)]]
+        if count is None or not population:
+            return None
+        return round(count / population, 6)
+
+    return {
+        "CODE": code,
+        "POPULATION_BRACKET": population_bracket,
+        "DATES": [row["REPORT_DATE"] for row in rows],
+        "NEW_CASES": [change(row, "CASE_CNT") for row in rows],
+        "HOSPITALISED": [row["MED_HOSP_CNT"] for row in rows],
+        "ICU": [row["MED_ICU_CNT"] for row in rows],
+        "FIRST_DOSE": [coverage(row, "VACC_FIRST_DOSE_CNT") for row in rows],
+        "SECOND_DOSE": [coverage(row, "VACC_PEOPLE_CNT") for row in rows],
+        "TARGETS": VAX_TARGETS,
+    }
+
+
+# Charts are named by a hash of their series, so an unchanged chart is found by name
+def chart_key(series: Dict) -> str:
+    return hashlib.sha256(json.dumps(series, sort_keys=True).encode("utf-8")).hexdigest()[:32]
+
+
+# Draw cases, hospitalisations and vaccination coverage against the targets as a PNG.
+# Runs in a worker process, so matplotlib is only ever imported there
+def render_chart(series: Dict, output_file: str) -> None:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    dates: List[str] = [date[5:] for date in series["DATES"]]
+    figure, (cases, hospital, vax) = plt.subplots(3, 1, figsize=(8, 9), sharex=True)
+    figure.suptitle(f"{series['CODE']} over the last {len(dates)} reports")
+
+    cases.bar(dates, [value or 0 for value in series["NEW_CASES"]], color="tab:red")
+    cases.set_ylabel("New cases")
+
+    hospital.plot(dates, [float("nan") if value is None else value for value in series["HOSPITALISED"]], label="Hospitalised")
+    hospital.plot(dates, [float("nan") if value is None else value for value in series["ICU"]], label="ICU")
+    hospital.set_ylabel("Patients")
+    hospital.legend(loc="upper left")
+
+    for field, label in [("FIRST_DOSE", "1st dose"), ("SECOND_DOSE", "2nd dose")]:
+        vax.plot(dates, [float("nan") if value is None else value * 100 for value in series[field]], label=label)
+    for target in series["TARGETS"]:
+        vax.axhline(target * 100, color="grey", linestyle=":", linewidth=1)
+    vax.set_ylabel(f"% of {series['POPULATION_BRACKET']} vaccinated")
+    vax.set_ylim(0, 100)
+    vax.legend(loc="upper left")
+
+    vax.set_xticks(dates[::max(1, len(dates) // 10)])
+    figure.autofmt_xdate()
+    figure.tight_layout()
+
+    # Written under a temporary name, so a half written chart is never mistaken for a cached one
+    partial_file: str = output_file + ".partial.png"
+    figure.savefig(partial_file, format="png")
+    plt.close(figure)
+    os.replace(partial_file, output_file)
+
+
+class ChartRenderer:
+
+    # Charts are rendered into cache_dir named by chart_key, in a pool of worker processes so
+    # several codes render at once without holding up the bot. uploaded.json records each code's chart
+    # that each destination (see upload_destination) was last sent, so an unchanged chart isn't uploaded again
+    def __init__(
+        self,
+        cache_dir: str,
+        workers: int = CHART_WORKERS,
+        render_function: Callable[[Dict, str], None] = render_chart,
+        days: int = CHART_DAYS
+    ) -> None:
+        self.cache_dir: str = cache_dir
+        # Days of history charted, indexes need to keep this many
+        self.days: int = days
+        self.workers: int = workers
+        self.render_function: Callable[[Dict, str], None] = render_function
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.uploaded_file: str = os.path.join(cache_dir, "uploaded.json")
+        self.uploaded: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(self.uploaded_file):
+            with open(self.uploaded_file) as uploadedFile:
+                self.uploaded = json.load(uploadedFile)
+
+    def chart_file(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.png")
+
+    # Start rendering every chart that isn't already cached, without waiting for them.
+    # Returns code -> (chart key, the render in progress or None if it's cached)
+    def submit(self, series_by_code: Dict[str, Dict]) -> Dict[str, Tuple[str, Optional[Future]]]:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        pending: Dict[str, Tuple[str, Optional[Future]]] = {}
+        for code, series in series_by_code.items():
+            key: str = chart_key(series)
+            if os.path.exists(self.chart_file(key)):
+                pending[code] = (key, None)
+                continue
+
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=self.workers)
+            pending[code] = (key, self.executor.submit(self.render_function, series, self.chart_file(key)))
+        return pending
+
+    # Wait for the renders to finish. Returns code -> chart key for every chart that's ready
+    def wait(self, pending: Dict[str, Tuple[str, Optional[Future]]]) -> Dict[str, str]:
+        ready: Dict[str, str] = {}
+        for code, (key, future) in pending.items():
+            if future is not None:
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f"Unable to render the chart for {code}: {e}")
+                    continue
+            ready[code] = key
+        return ready
+
+    def is_uploaded(self, destination: str, code: str, key: str) -> bool:
+        return self.uploaded.get(destination, {}).get(code) == key
+
+    def record_upload(self, destination: str, code: str, key: str) -> None:
+        self.uploaded.setdefault(destination, {})[code] = key
+
+    def save(self) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        partial_file: str = self.uploaded_file + ".partial"
+        with open(partial_file, "w") as uploadedFile:
+            json.dump(self.uploaded, uploadedFile)
+        os.replace(partial_file, self.uploaded_file)
+
+    def shutdown(self) -> None:
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+
+
+# Where a bot's charts for a channel go. Profiles can post with different tokens, so to different
+# workspaces, and the same channel name is only the same channel under the same token
+def upload_destination(slack_bot: CovidSlackBot, channel: str) -> str:
+    return hashlib.sha256(slack_bot.slack_token.encode("utf-8")).hexdigest()[:16] + channel
+
+
+# Wait for the charts and upload each one a channel doesn't already have, channels in parallel
+def post_charts(slack_bot: CovidSlackBot, renderer: ChartRenderer, pending: Dict[str, Tuple[str, Optional[Future]]]) -> None:
+    ready: Dict[str, str] = renderer.wait(pending)
+    uploads: Dict[str, List[Tuple[str, str]]] = {
+        channel: [
+            (code, key) for code, key in ready.items()
+            if not renderer.is_uploaded(upload_destination(slack_bot, channel), code, key)
+        ]
+        for channel in slack_bot.channel_names
+    }
+    if not any(uploads.values()):
+        return
+
+    # Charts are optional, so a chart that can't be uploaded is reported and tried again next time
+    # rather than failing a run whose text has already been posted
+    async def upload_to_channel(poster: AsyncSlackPoster, channel: str) -> None:
+        for code, key in uploads[channel]:
+            try:
+                await poster.upload_file(channel, renderer.chart_file(key), f"{code} trends")
+            except Exception as e:
+                print(f"Unable to upload the chart for {code} to {channel}: {e}")
+                current_metrics().increment("chart_upload_failures")
+                continue
+            renderer.record_upload(upload_destination(slack_bot, channel), code, key)
+
+    async def upload_all() -> None:
+        poster: AsyncSlackPoster = slack_bot.get_poster()
+        try:
+            await poster.find_channel_ids([channel for channel in uploads if uploads[channel]])
+        except Exception as e:
+            print(f"Unable to look up channel IDs, uploading by name: {e}")
+        await asyncio.gather(*(upload_to_channel(poster, channel) for channel in uploads))
+
+    print(f"Uploading charts for {','.join(ready)}")
+    try:
+        with current_metrics().stage("charts"):
+            asyncio.run(upload_all())
+    finally:
+        # Save even after a failure, so charts that were uploaded aren't sent again
+        renderer.save()
@@ -0,0 +1,103 @@
+import warnings
+from datetime import datetime, timedelta
+from typing import Dict, List, Union
+
+import numpy as np
+
+from covid_row import BRACKET_FIELD_NAMES
+
+VAX_TARGETS: List[float] = [0.6, 0.7, 0.8, 0.9]
+VAX_FIELDS: List[str] = ["VACC_FIRST_DOSE_CNT", "VACC_PEOPLE_CNT"]
+TREND_METHODS: List[str] = ["average", "least_squares"]
+# Targets further away than this are reported as not being reached
+MAX_PROJECTION_DAYS: int = 365
+TARGET_REACHED: str = "reached"
+
+# A projection is TARGET_REACHED, the datetime the target is expected to be hit, or None if it
+# won't be hit within MAX_PROJECTION_DAYS at the current rate
+Projection = Union[str, datetime, None]
+
+
+# Daily rate of change in coverage from the latest and oldest rows of the trailing window
+def average_rates(current: np.ndarray, previous: np.ndarray, days: np.ndarray) -> np.ndarray:
+    return (current - previous) / days[:, None]
+
+
+# Daily rate of change in coverage from a least squares fit over every row of the trailing window.
+# history is codes x fields x window (newest first), padded with NaN where a code has fewer rows
+def least_squares_rates(history: np.ndarray) -> np.ndarray:
+    days_ago: np.ndarray = np.arange(history.shape[2], dtype=float)
+    x: np.ndarray = np.where(np.isnan(history), np.nan, -days_ago)
+    with warnings.catch_warnings():
+        # Codes with no history at all give NaN means, which become NaN rates. Days without counts are NaN too,
+    # and are left out of the fit without moving the other days
+        warnings.simplefilter("ignore", RuntimeWarning)
+        x_mean: np.ndarray = np.nanmean(x, axis=2, keepdims=True)
+        y_mean: np.ndarray = np.nanmean(history, axis=2, keepdims=True)
+    covariance: np.ndarray = np.nansum((x - x_mean) * (history - y_mean), axis=2)
+    variance: np.ndarray = np.nansum((x - x_mean) ** 2, axis=2)
+    return covariance / variance
+
+
+# Project every code x vax field x target in one pass over the selected vax data
+def project_vax_targets(
+    vax_data: Dict[str, Dict],
+    targets: List[float] = VAX_TARGETS,
+    fields: List[str] = VAX_FIELDS,
+    method: str = "average"
+) -> Dict[str, Dict[str, Dict[float, Projection]]]:
+    if method not in TREND_METHODS:
+        raise ValueError(f"Unknown trend method: {method}")
+
+    codes: List[str] = list(vax_data)
+    if not codes:
+        return {}
+
+    population: np.ndarray = np.array([vax_data[code]["POPULATION"] for code in codes], dtype=float)
+    # Missing counts become NaN, so a code without them can't be projected rather than failing every code
+    current: np.ndarray = np.array([
+        [vax_data[code][BRACKET_FIELD_NAMES[(field, vax_data[code]["POPULATION_BRACKET"])]] for field in fields] for code in codes
+    ], dtype=float) / population[:, None]
+    previous: np.ndarray = np.array([
+        [vax_data[code][BRACKET_FIELD_NAMES[("PREV_" + field, vax_data[code]["POPULATION_BRACKET"])]] for field in fields] for code in codes
+    ], dtype=float) / population[:, None]
+    days: np.ndarray = np.array([vax_data[code]["RECORD_COUNT"] for code in codes], dtype=float)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rates: np.ndarray = average_rates(current, previous, days)
+
+        if method == "least_squares":
+            window: int = max(len(vax_data[code].get("TRAILING_COUNTS", {}).get(fields[0], [])) for code in codes)
+            if window > 1:
+                history: np.ndarray = np.full((len(codes), len(fields), window), np.nan)
+                for code_index, code in enumerate(codes):
+                    for field_index, field in enumerate(fields):
+                        counts: List[int] = vax_data[code].get("TRAILING_COUNTS", {}).get(field, [])
+                        history[code_index, field_index, :len(counts)] = counts
+                history /= population[:, None, None]
+                fitted: np.ndarray = least_squares_rates(history)
+                # Codes without enough history to fit keep the two point average
+                rates = np.where(np.isfinite(fitted), fitted, rates)
+
+        remaining: np.ndarray = np.array(targets)[None, None, :] - current[:, :, None]
+        days_to_target: np.ndarray = np.ceil(remaining / rates[:, :, None])
+
+    reached: np.ndarray = remaining <= 0
+    reachable: np.ndarray = (rates[:, :, None] > 0) & np.isfinite(days_to_target) & (days_to_target <= MAX_PROJECTION_DAYS)
+
+    projections: Dict[str, Dict[str, Dict[float, Projection]]] = {}
+    for code_index, code in enumerate(codes):
+        last_updated: datetime = datetime.strptime(vax_data[code]["LAST_UPDATED_DATE"], "%Y-%m-%d %H:%M:%S")
+        projections[code] = {}
+        for field_index, field in enumerate(fields):
+            projections[code][field] = {}
+            for target_index, target in enumerate(targets):
+                projection: Projection = None
+                if reached[code_index, field_index, target_index]:
+                    projection = TARGET_REACHED
+                elif reachable[code_index, field_index, target_index]:
+                    days_ahead: int = int(days_to_target[code_index, field_index, target_index])
+                    projection = last_updated + timedelta(days=days_ahead)
+                projections[code][field][target] = projection
+
+    return projections